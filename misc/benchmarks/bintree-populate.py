@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure how long binarytree.populate takes to rebuild the Packages
+index of a synthetic PKGDIR, for a number of PORTAGE_BINPKG_SCAN_JOBS
+values. Run it from a source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/bintree-populate.py
+
+Use --latency to add a delay to every xpak read, which approximates
+a PKGDIR on a network filesystem.
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from portage import os
+from portage.dbapi.bintree import binarytree
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+def populate(settings, jobs, latency):
+	settings.unlock()
+	settings["PORTAGE_BINPKG_SCAN_JOBS"] = str(jobs)
+	settings.lock()
+	bintree = binarytree(pkgdir=settings["PKGDIR"], settings=settings)
+	if latency:
+		read_metadata = bintree._read_metadata
+		def delayed_read_metadata(*args, **kwargs):
+			time.sleep(latency)
+			return read_metadata(*args, **kwargs)
+		bintree._read_metadata = delayed_read_metadata
+	try:
+		os.unlink(bintree._pkgindex_file)
+	except OSError:
+		pass
+	start = time.time()
+	bintree.populate()
+	elapsed = time.time() - start
+	return elapsed, len(bintree.dbapi.cpv_all())
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--packages", type=int, default=2000,
+		help="number of binary packages in the synthetic PKGDIR")
+	parser.add_argument("--jobs", default="1,2,4,8,16",
+		help="comma separated list of PORTAGE_BINPKG_SCAN_JOBS values")
+	parser.add_argument("--latency", type=float, default=0.0,
+		help="seconds added to every xpak read")
+	parser.add_argument("--repeat", type=int, default=3,
+		help="number of runs per value, of which the best is reported")
+	args = parser.parse_args()
+
+	binpkgs = {}
+	for i in range(args.packages):
+		cpv = "dev-libs/pkg%d-1" % i
+		binpkgs[cpv] = {
+			"DEPEND": "dev-libs/dep%d" % (i % 50),
+			"IUSE": "foo bar",
+			"USE": "foo",
+		}
+	print("Creating %d binary packages..." % args.packages)
+	playground = ResolverPlayground(binpkgs=binpkgs)
+	try:
+		for jobs in [int(x) for x in args.jobs.split(",")]:
+			best = None
+			for i in range(args.repeat):
+				elapsed, count = populate(playground.settings,
+					jobs, args.latency)
+				if count != args.packages:
+					raise AssertionError("found %d of %d packages" %
+						(count, args.packages))
+				if best is None or elapsed < best:
+					best = elapsed
+			print("jobs=%-3d %8.3fs" % (jobs, best))
+	finally:
+		playground.cleanup()
+
+
+if __name__ == "__main__":
+	main()
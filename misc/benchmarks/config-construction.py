@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure how long it takes to construct a portage.config instance for a
+synthetic profile stack and user configuration, with the profile stack
+parsed from scratch, and loaded from a compiled profile snapshot. Run it
+from a source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/config-construction.py
+
+The import time of portage itself, which comes on top of this for every
+command, can be measured with:
+
+	PYTHONPATH=pym python -X importtime -c "import portage" 2>&1 | sort -t '|' -k 2 -n | tail
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import portage
+from portage.package.ebuild.config import config
+from portage.package.ebuild._config.ProfileSnapshot import ProfileSnapshot
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+covers = ProfileSnapshot.covers
+
+
+def construct(playground, snapshot):
+	# Load the snapshot from disk again, like a new process does.
+	portage.util._profile_snapshots[:] = []
+	if not snapshot:
+		ProfileSnapshot.covers = lambda self, filename: False
+	env = {"PORTAGE_REPOSITORIES": playground.settings["PORTAGE_REPOSITORIES"]}
+	start = time.time()
+	settings = config(eprefix=playground.eprefix, env=env)
+	# Instantiate the lazily constructed managers too.
+	settings._mask_manager
+	settings._keywords_manager
+	settings._virtuals_manager
+	elapsed = time.time() - start
+	if snapshot:
+		for x in portage.util._profile_snapshots:
+			x.flush()
+	else:
+		ProfileSnapshot.covers = covers
+	return elapsed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--lines", type=int, default=5000,
+		help="number of lines in each synthetic package.* file")
+	parser.add_argument("--repeat", type=int, default=5,
+		help="number of runs per mode, of which the best is reported")
+	args = parser.parse_args()
+
+	atoms = ["=dev-libs/pkg%d-%d" % (i, i % 7 + 1)
+		for i in range(args.lines)]
+	profile = {
+		"eapi": ["5"],
+		"package.mask": atoms,
+		"package.use.stable.mask": ["%s foo" % x for x in atoms],
+		"package.unmask": atoms[::2],
+	}
+	user_config = {
+		"package.accept_keywords": ["%s ~x86" % x for x in atoms],
+		"package.license": ["%s TEST" % x for x in atoms],
+		"package.use": ["%s foo -bar" % x for x in atoms],
+	}
+	print("Creating a profile with %d lines per file..." % args.lines)
+	playground = ResolverPlayground(profile=profile, user_config=user_config)
+	try:
+		# Create the snapshot.
+		construct(playground, True)
+		for snapshot in (False, True):
+			best = min(construct(playground, snapshot)
+				for i in range(args.repeat))
+			print("%-10s %8.3fs" % ("snapshot" if snapshot else "parse", best))
+	finally:
+		playground.cleanup()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure how long description searches take for a synthetic repository,
+by matching every description like emerge --searchdesc does, and by
+matching only the descriptions of the packages that a pkg_word_index
+returns. Run it from a source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/desc-search.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import re
+import string
+import time
+
+from portage.cache.index.pkg_word_index import (pkg_word_index_lines,
+	pkg_word_index_search)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--packages", type=int, default=20000,
+		help="number of packages")
+	parser.add_argument("--queries", type=int, default=20,
+		help="number of search keys")
+	args = parser.parse_args()
+
+	rng = random.Random(0)
+	vocabulary = ["".join(rng.choice(string.ascii_lowercase)
+		for i in range(rng.randint(3, 10))) for j in range(5000)]
+	descs = {}
+	for i in range(args.packages):
+		descs["cat-%d/pkg%d" % (i % 150, i)] = " ".join(
+			rng.choice(vocabulary) for j in range(rng.randint(3, 12)))
+	cps = sorted(descs)
+	queries = []
+	for i in range(args.queries):
+		words = descs[rng.choice(cps)].split()
+		start = rng.randrange(len(words))
+		queries.append(" ".join(words[start:start + rng.randint(1, 2)]))
+
+	index_lines = list(pkg_word_index_lines(descs.items()))
+	results = {}
+	for indexed in (False, True):
+		start = time.time()
+		for key in queries:
+			searchre = re.compile(re.escape(key), re.I)
+			candidates = cps
+			if indexed:
+				candidates = sorted(pkg_word_index_search(index_lines, key))
+			matches = [cp for cp in candidates if searchre.search(descs[cp])]
+			if indexed:
+				assert matches == results[key], key
+			results[key] = matches
+		print("%-10s %8.3fs" % ("indexed" if indexed else "full",
+			time.time() - start))
+
+
+if __name__ == "__main__":
+	main()
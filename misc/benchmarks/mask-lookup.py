@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure how long package.mask, package.unmask and package.accept_keywords
+lookups take for a synthetic configuration that lists many atoms for the
+same packages, with and without the per-cp AtomIndex. Run it from a
+source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/mask-lookup.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from portage.package.ebuild._config.helper import AtomIndex
+from portage.package.ebuild._config.KeywordsManager import KeywordsManager
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.versions import _pkg_str
+
+
+candidates = AtomIndex._candidates
+atom_index = KeywordsManager._atom_index
+
+
+def lookup(playground, pkgs, indexed):
+	settings = playground.settings
+	mask_manager = settings._mask_manager
+	keywords_manager = settings._keywords_manager
+	if not indexed:
+		# Check every atom, and order keywords atoms by repeated
+		# best_match_to_list calls, like before the index existed.
+		AtomIndex._candidates = lambda self, pkg: range(len(self._atoms))
+		KeywordsManager._atom_index = lambda self, key, cpdict: None
+	try:
+		start = time.time()
+		for pkg in pkgs:
+			mask_manager.getMaskAtom(pkg, None, None)
+			keywords_manager.getPKeywords(pkg, None, None, "x86")
+		return time.time() - start
+	finally:
+		AtomIndex._candidates = candidates
+		KeywordsManager._atom_index = atom_index
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--packages", type=int, default=10,
+		help="number of package names")
+	parser.add_argument("--atoms", type=int, default=200,
+		help="number of atoms per package name in each file")
+	parser.add_argument("--repeat", type=int, default=3,
+		help="number of runs per mode, of which the best is reported")
+	args = parser.parse_args()
+
+	operators = ("=", ">=", "<", "~", "=")
+	masks = []
+	for i in range(args.packages):
+		for j in range(args.atoms):
+			masks.append("%sdev-libs/pkg%d-%d.%d" %
+				(operators[j % len(operators)], i, j, j % 3))
+	profile = {
+		"package.mask": masks,
+		"package.unmask": masks[::3],
+	}
+	user_config = {
+		"package.accept_keywords": ["%s ~x86" % x for x in masks],
+	}
+	pkgs = [_pkg_str("dev-libs/pkg%d-%d.%d" % (i, j, j % 3), slot="0",
+		repo="test_repo")
+		for i in range(args.packages)
+		for j in range(0, args.atoms, max(1, args.atoms // 50))]
+
+	print("Creating a configuration with %d atoms per file..." % len(masks))
+	playground = ResolverPlayground(profile=profile, user_config=user_config)
+	try:
+		print("Looking up %d packages" % len(pkgs))
+		for indexed in (False, True):
+			best = min(lookup(playground, pkgs, indexed)
+				for i in range(args.repeat))
+			print("%-10s %8.3fs" % ("indexed" if indexed else "linear", best))
+	finally:
+		playground.cleanup()
+
+
+if __name__ == "__main__":
+	main()
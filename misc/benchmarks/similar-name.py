@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure how long similar_name_search takes to suggest names for
+misspelled package names, for a synthetic repository with and without
+a pkg_trigram_index. Run it from a source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/similar-name.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import string
+import time
+
+from portage.cache.index.pkg_trigram_index import (pkg_trigram_index_lines,
+	pkg_trigram_index_search)
+from portage.dbapi._similar_name_search import similar_name_search
+from portage.dep import Atom
+
+
+class NameDb(object):
+	"""
+	A database of package names, which provides cp_similar if it has
+	the lines of a trigram index, like IndexedPortdb.
+	"""
+
+	def __init__(self, cps, index_lines=None):
+		self._cps = cps
+		if index_lines is not None:
+			self.cp_similar = lambda pn: \
+				pkg_trigram_index_search(index_lines, pn)
+
+	def cp_all(self):
+		return list(self._cps)
+
+
+def misspell(rng, name):
+	chars = list(name)
+	pos = rng.randrange(len(chars))
+	op = rng.randrange(3)
+	if op == 0 and len(chars) > 1:
+		del chars[pos]
+	elif op == 1:
+		chars.insert(pos, rng.choice(string.ascii_lowercase))
+	else:
+		chars[pos] = rng.choice(string.ascii_lowercase)
+	return "".join(chars)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--packages", type=int, default=20000,
+		help="number of package names")
+	parser.add_argument("--queries", type=int, default=20,
+		help="number of misspelled names to look up")
+	args = parser.parse_args()
+
+	rng = random.Random(0)
+	prefixes = ("lib", "py", "perl-", "gtk", "qt", "x", "kde-", "gnome-")
+	categories = ("app-misc", "dev-libs", "dev-python", "media-libs",
+		"net-misc", "sys-apps", "x11-libs")
+	cps = set()
+	while len(cps) < args.packages:
+		cps.add("%s/%s%s" % (rng.choice(categories),
+			rng.choice(prefixes),
+			"".join(rng.choice(string.ascii_lowercase)
+			for i in range(rng.randint(2, 8)))))
+	cps = sorted(cps)
+	queries = [Atom("null/" + misspell(rng, rng.choice(cps).split("/")[1]))
+		for i in range(args.queries)]
+
+	index_lines = list(pkg_trigram_index_lines(cps))
+	differences = 0
+	results = {}
+	for indexed in (False, True):
+		db = NameDb(cps, index_lines if indexed else None)
+		start = time.time()
+		for atom in queries:
+			matches = similar_name_search([db], atom)
+			if indexed and matches != results[atom]:
+				differences += 1
+			results[atom] = matches
+		print("%-10s %8.3fs" % ("indexed" if indexed else "full",
+			time.time() - start))
+	print("queries with different suggestions: %d of %d" %
+		(differences, len(queries)))
+
+
+if __name__ == "__main__":
+	main()
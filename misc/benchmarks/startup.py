@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Measure the startup time of short emerge and portageq commands, and the
+number of modules that they import, for a small synthetic configuration.
+With --importtime, also list the imports that take the most time, which
+requires python 3.7 or later. Run it from a source checkout:
+
+	PYTHONPATH=pym python misc/benchmarks/startup.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from portage.const import PORTAGE_BIN_PATH, PORTAGE_PYM_PATH
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+COMMANDS = (
+	("portageq", "has_version", "{eroot}", "sys-apps/sed"),
+	("portageq", "best_version", "{eroot}", "sys-apps/sed"),
+	("portageq", "envvar", "ARCH"),
+	("emerge", "--version"),
+	("emerge", "--info"),
+)
+
+# Print the imported modules on a separate file descriptor, so that the
+# output of the command does not get mixed up with them.
+_wrapper = """
+import os, sys
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+try:
+	with open(script) as f:
+		code = compile(f.read(), script, "exec")
+	exec(code, {"__name__": "__main__", "__file__": script})
+finally:
+	os.write(3, " ".join(sys.modules).encode())
+"""
+
+
+def run(args, env, importtime=False):
+	"""
+	Run a command, and return the elapsed time, the names of the portage
+	and _emerge modules that it imported, and its import time report.
+	"""
+	read_fd, write_fd = os.pipe()
+	python_args = [sys.executable]
+	if importtime:
+		python_args += ["-X", "importtime"]
+	start = time.time()
+	proc = subprocess.Popen(python_args + ["-c", _wrapper] + args,
+		env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+		preexec_fn=lambda: os.dup2(write_fd, 3), close_fds=False)
+	os.close(write_fd)
+	with os.fdopen(read_fd, "rb") as f:
+		modules = f.read().decode().split()
+	stdout, stderr = proc.communicate()
+	elapsed = time.time() - start
+	if proc.returncode != os.EX_OK:
+		raise SystemExit("%s failed:\n%s" % (" ".join(args),
+			stderr.decode("utf_8", "replace")))
+	modules = [x for x in modules
+		if x.split(".")[0] in ("portage", "_emerge")]
+	return elapsed, modules, stderr.decode("utf_8", "replace")
+
+
+def top_imports(report, count):
+	"""
+	Return the lines of a -X importtime report with the highest
+	cumulative times.
+	"""
+	lines = []
+	for line in report.splitlines():
+		if not line.startswith("import time:"):
+			continue
+		fields = line.split("|")
+		try:
+			lines.append((int(fields[1]), line))
+		except ValueError:
+			pass
+	lines.sort(reverse=True)
+	return [line for cumulative, line in lines[:count]]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--repeat", type=int, default=5,
+		help="number of runs per command, of which the best is reported")
+	parser.add_argument("--importtime", type=int, default=0, metavar="N",
+		help="list the N imports with the highest cumulative time")
+	args = parser.parse_args()
+
+	playground = ResolverPlayground(
+		ebuilds={"sys-apps/sed-4": {}},
+		installed={"sys-apps/sed-4": {}})
+	try:
+		env = os.environ.copy()
+		env["PORTAGE_OVERRIDE_EPREFIX"] = playground.eprefix
+		env["PORTAGE_REPOSITORIES"] = \
+			playground.settings.repositories.config_string()
+		env["PYTHONPATH"] = PORTAGE_PYM_PATH
+		for command in COMMANDS:
+			cmd_args = [os.path.join(PORTAGE_BIN_PATH, command[0])] + \
+				[x.format(eroot=playground.eroot) for x in command[1:]]
+			best = min(run(cmd_args, env)[0] for i in range(args.repeat))
+			elapsed, modules, report = run(cmd_args, env,
+				importtime=args.importtime > 0)
+			print("%-36s %8.3fs %5d modules" %
+				(" ".join(command[:2]), best, len(modules)))
+			for line in top_imports(report, args.importtime):
+				print("    " + line)
+	finally:
+		playground.cleanup()
+
+
+if __name__ == "__main__":
+	main()
@@ -1,4 +1,4 @@
-# Copyright 1999-2013 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import _emerge.emergelog
@@ -167,6 +167,8 @@ class Binpkg(CompositeTask):
 			verifier = BinpkgVerifier(background=self.background,
 				logfile=logfile, pkg=self.pkg, scheduler=self.scheduler,
 				_pkg_path=path)
+			# Verify the whole package before anything from it is used,
+			# since pkg_setup runs its environment before extraction.
 			self._start_task(verifier, self._verifier_exit)
 			return
 
@@ -235,7 +237,6 @@ class Binpkg(CompositeTask):
 
 		infloc = self._infloc
 		pkg = self.pkg
-		pkg_path = self._pkg_path
 
 		dir_mode = 0o755
 		for mydir in (dir_path, self._image_dir, infloc):
@@ -246,9 +247,9 @@ class Binpkg(CompositeTask):
 		portage.prepare_build_dirs(self.settings["ROOT"], self.settings, 1)
 		self._writemsg_level(">>> Extracting info\n")
 
-		pkg_xpak = portage.xpak.tbz2(self._pkg_path)
 		check_missing_metadata = ("CATEGORY", "PF")
 		missing_metadata = set()
+		pkg_xpak = portage.xpak.tbz2(self._pkg_path)
 		for k in check_missing_metadata:
 			v = pkg_xpak.getfile(_unicode_encode(k,
 				encoding=_encodings['repo.content']))
@@ -273,16 +274,6 @@ class Binpkg(CompositeTask):
 			finally:
 				f.close()
 
-		# Store the md5sum in the vdb.
-		f = io.open(_unicode_encode(os.path.join(infloc, 'BINPKGMD5'),
-			encoding=_encodings['fs'], errors='strict'),
-			mode='w', encoding=_encodings['content'], errors='strict')
-		try:
-			f.write(_unicode_decode(
-				str(portage.checksum.perform_md5(pkg_path)) + "\n"))
-		finally:
-			f.close()
-
 		env_extractor = BinpkgEnvExtractor(background=self.background,
 			scheduler=self.scheduler, settings=self.settings)
 
@@ -308,9 +299,14 @@ class Binpkg(CompositeTask):
 			self.wait()
 			return
 
+		# The md5sum that is stored in the vdb is computed in the
+		# same pass that extracts the package.
+		hash_names = ["MD5"]
+
 		extractor = BinpkgExtractorAsync(background=self.background,
 			env=self.settings.environ(),
 			features=self.settings.features,
+			hash_names=hash_names,
 			image_dir=self._image_dir,
 			pkg=self.pkg, pkg_path=self._pkg_path,
 			logfile=self.settings.get("PORTAGE_LOG_FILE"),
@@ -326,6 +322,12 @@ class Binpkg(CompositeTask):
 			self.wait()
 			return
 
+		# Store the md5sum in the vdb.
+		with io.open(_unicode_encode(os.path.join(self._infloc, 'BINPKGMD5'),
+			encoding=_encodings['fs'], errors='strict'),
+			mode='w', encoding=_encodings['content'], errors='strict') as f:
+			f.write(_unicode_decode(extractor.digests["MD5"] + "\n"))
+
 		try:
 			with io.open(_unicode_encode(os.path.join(self._infloc, "EPREFIX"),
 				encoding=_encodings['fs'], errors='strict'), mode='r',
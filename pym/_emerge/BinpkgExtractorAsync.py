@@ -1,14 +1,21 @@
-# Copyright 1999-2013 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import errno
 import logging
 
+from _emerge.PipeReader import PipeReader
 from _emerge.SpawnProcess import SpawnProcess
 import portage
+from portage import os
+from portage.checksum import _checksum_stream
+from portage.const import HASHING_BLOCKSIZE
 from portage.localization import _
+from portage.util._async.ForkProcess import ForkProcess
 from portage.util.compression_probe import (
 	compression_probe,
 	_compressors,
+	_parallel_command,
 )
 from portage.process import find_binary
 from portage.util import (
@@ -18,9 +25,19 @@ from portage.util import (
 import signal
 import subprocess
 
-class BinpkgExtractorAsync(SpawnProcess):
+class BinpkgExtractorAsync(ForkProcess):
+	"""
+	Extract the contents of a binary package into image_dir. If
+	hash_names is given, then the package is read only once: the file is
+	fed to the decompressor by a subprocess, which computes the given
+	digests of the whole file in the same pass, and the digests
+	attribute is a dict of the results after successful execution.
+	Otherwise, the decompressor reads the file directly.
+	"""
 
-	__slots__ = ("features", "image_dir", "pkg", "pkg_path")
+	__slots__ = ("digests", "features", "hash_names", "image_dir",
+		"pkg", "pkg_path", "_archive_size", "_digest_pipe_reader",
+		"_digest_pw")
 
 	_shell_binary = portage.const.BASH_BINARY
 
@@ -35,7 +52,8 @@ class BinpkgExtractorAsync(SpawnProcess):
 					tar_options.append(portage._shell_quote("--xattrs-exclude=%s" % x))
 				tar_options = " ".join(tar_options)
 
-		decomp = _compressors.get(compression_probe(self.pkg_path))
+		compression = compression_probe(self.pkg_path)
+		decomp = _compressors.get(compression)
 		if decomp is not None:
 			decomp_cmd = decomp.get("decompress")
 		else:
@@ -74,15 +92,33 @@ class BinpkgExtractorAsync(SpawnProcess):
 				self._async_wait()
 				return
 
+		# Decompress from multiple threads if the format allows it.
+		cmd = [varexpand(x, mydict=self.env)
+			for x in shlex_split(decomp_cmd)]
+		parallel_cmd = _parallel_command(compression, cmd,
+			"decompress_parallel", self.env)
+		if parallel_cmd is not cmd:
+			decomp_cmd = " ".join(portage._shell_quote(x)
+				for x in parallel_cmd)
+
 		pkg_xpak = portage.xpak.tbz2(self.pkg_path)
 		pkg_xpak.scan()
+		self._archive_size = pkg_xpak.filestat.st_size - pkg_xpak.xpaksize
+
+		cmds = []
+		if self.hash_names is None:
+			cmds.append("head -c %d -- %s" % (self._archive_size,
+				portage._shell_quote(self.pkg_path)))
+		cmds.append(decomp_cmd)
+		cmds.append("tar -xp %s -C %s -f -" % (tar_options,
+			portage._shell_quote(self.image_dir)))
 
 		# SIGPIPE handling (128 + SIGPIPE) should be compatible with
 		# assert_sigpipe_ok() that's used by the ebuild unpack() helper.
 		self.args = [self._shell_binary, "-c",
-			("cmd0=(head -c %d -- %s) cmd1=(%s) cmd2=(tar -xp %s -C %s -f -); " + \
-			'"${cmd0[@]}" | "${cmd1[@]}" | "${cmd2[@]}"; ' + \
-			"p=(${PIPESTATUS[@]}) ; for i in {0..2}; do " + \
+			("%s; " + \
+			"%s; " + \
+			"p=(${PIPESTATUS[@]}) ; for i in {0..%d}; do " + \
 			"if [[ ${p[$i]} != 0 && ${p[$i]} != %d ]] ; then " + \
 			"echo command $(eval \"echo \\\"'\\${cmd$i[*]}'\\\"\") " + \
 			"failed with status ${p[$i]} ; exit ${p[$i]} ; fi ; done; " + \
@@ -90,11 +126,111 @@ class BinpkgExtractorAsync(SpawnProcess):
 			"echo command $(eval \"echo \\\"'\\${cmd$i[*]}'\\\"\") " + \
 			"failed with status ${p[$i]} ; exit ${p[$i]} ; fi ; " + \
 			"exit 0 ;") % \
-			(pkg_xpak.filestat.st_size - pkg_xpak.xpaksize,
-			portage._shell_quote(self.pkg_path),
-			decomp_cmd,
-			tar_options,
-			portage._shell_quote(self.image_dir),
+			(" ".join("cmd%d=(%s)" % (i, cmd)
+				for i, cmd in enumerate(cmds)),
+			" | ".join('"${cmd%d[@]}"' % i for i in range(len(cmds))),
+			len(cmds) - 1,
 			128 + signal.SIGPIPE)]
 
-		SpawnProcess._start(self)
+		if self.hash_names is None:
+			SpawnProcess._start(self)
+			return
+
+		pr, pw = os.pipe()
+		self.fd_pipes = {}
+		self.fd_pipes[pw] = pw
+		self._digest_pw = pw
+		self._digest_pipe_reader = PipeReader(
+			input_files={"input":pr},
+			scheduler=self.scheduler)
+		self._digest_pipe_reader.addExitListener(self._digest_pipe_reader_exit)
+		self._digest_pipe_reader.start()
+		ForkProcess._start(self)
+		os.close(pw)
+
+	def _spawn(self, args, **kwargs):
+		if self.hash_names is None:
+			return SpawnProcess._spawn(self, args, **kwargs)
+		return ForkProcess._spawn(self, args, **kwargs)
+
+	def _run(self):
+		"""
+		Feed the archive part of the package to the extraction pipeline,
+		and compute the digests of the whole file, including the xpak
+		segment, in the same pass.
+		"""
+		checksums = _checksum_stream(self.hash_names)
+		proc = subprocess.Popen(self.args, env=self.env,
+			stdin=subprocess.PIPE)
+		remaining = self._archive_size
+		with open(portage._unicode_encode(self.pkg_path,
+			encoding=portage._encodings['fs'], errors='strict'), 'rb') as f:
+			while True:
+				buf = f.read(HASHING_BLOCKSIZE)
+				if not buf:
+					break
+				checksums.update(buf)
+				if remaining > 0:
+					try:
+						proc.stdin.write(buf[:remaining])
+					except EnvironmentError as e:
+						if e.errno != errno.EPIPE:
+							raise
+						# The pipeline stopped reading, and its exit
+						# status reports whether that was an error. The
+						# digests must still cover the whole file.
+						remaining = 0
+					else:
+						remaining -= len(buf)
+					if remaining <= 0:
+						proc.stdin.close()
+		try:
+			proc.stdin.close()
+		except EnvironmentError:
+			pass
+		returncode = proc.wait()
+		if returncode != os.EX_OK:
+			return returncode
+
+		buf = "".join("%s=%s\n" % item
+			for item in checksums.digests().items()).encode('utf_8')
+
+		while buf:
+			buf = buf[os.write(self._digest_pw, buf):]
+
+		return os.EX_OK
+
+	def _parse_digests(self, data):
+
+		digests = {}
+		for line in data.decode('utf_8').splitlines():
+			parts = line.split('=', 1)
+			if len(parts) == 2:
+				digests[parts[0]] = parts[1]
+
+		if "size" in digests:
+			digests["size"] = int(digests["size"])
+		self.digests = digests
+
+	def _pipe_logger_exit(self, pipe_logger):
+		if self.hash_names is None:
+			ForkProcess._pipe_logger_exit(self, pipe_logger)
+			return
+		# Ignore this event, since we want to ensure that we
+		# exit only after _digest_pipe_reader has reached EOF.
+		self._pipe_logger = None
+
+	def _digest_pipe_reader_exit(self, pipe_reader):
+		self._parse_digests(pipe_reader.getvalue())
+		self._digest_pipe_reader = None
+		self._unregister()
+		self.wait()
+
+	def _unregister(self):
+		ForkProcess._unregister(self)
+
+		pipe_reader = self._digest_pipe_reader
+		if pipe_reader is not None:
+			self._digest_pipe_reader = None
+			pipe_reader.removeExitListener(self._digest_pipe_reader_exit)
+			pipe_reader.cancel()
@@ -13,6 +13,7 @@ from portage import _unicode_decode
 from portage.checksum import _hash_filter
 from portage.elog.messages import eerror
 from portage.package.ebuild.fetch import _check_distfile, fetch
+from portage.package.ebuild._distfiles_layout import distfile_path
 from portage.util._async.ForkProcess import ForkProcess
 from portage.util._pty import _create_pty_or_pipe
 
@@ -45,7 +46,7 @@ class EbuildFetcher(ForkProcess):
 			# Use stat rather than lstat since fetch() creates
 			# symlinks when PORTAGE_RO_DISTDIRS is used.
 			try:
-				st = os.stat(os.path.join(distdir, filename))
+				st = os.stat(distfile_path(distdir, filename))
 			except OSError:
 				return False
 			if st.st_size == 0:
@@ -79,7 +80,7 @@ class EbuildFetcher(ForkProcess):
 						success = False
 						break
 					continue
-				ok, st = _check_distfile(os.path.join(distdir, filename),
+				ok, st = _check_distfile(distfile_path(distdir, filename),
 					mydigests, eout, show_errors=False, hash_filter=hash_filter)
 				if not ok:
 					success = False
@@ -218,7 +219,7 @@ class EbuildFetcher(ForkProcess):
 			# Use stat rather than lstat since portage.fetch() creates
 			# symlinks when PORTAGE_RO_DISTDIRS is used.
 			try:
-				st = os.stat(os.path.join(distdir, filename))
+				st = os.stat(distfile_path(distdir, filename))
 			except OSError:
 				return False
 			if st.st_size == 0:
@@ -125,6 +125,8 @@ class MetadataRegen(AsyncScheduler):
 
 			for mytree, nodes in dead_nodes.items():
 				auxdb = portdb.auxdb[mytree]
+				if nodes:
+					portdb._invalidate_eclass_index(mytree)
 				for y in nodes:
 					try:
 						del auxdb[y]
@@ -1,4 +1,4 @@
-# Copyright 1999-2016 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, print_function, unicode_literals
@@ -25,14 +25,24 @@ import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.dbapi._similar_name_search:similar_name_search',
 	'portage.debug',
+	'portage.emaint.main:print_results',
+	'portage.metadata:action_metadata',
 	'portage.news:count_unread_news,display_news_notifications',
+	'portage.package.ebuild._ipc.QueryCommand:QueryCommand',
+	'portage.package.ebuild.doebuild:_check_temp_dir',
 	'portage.util._get_vm_info:get_vm_info',
 	'portage.util.locale:check_locale',
+	'portage.util._async.run_main_scheduler:run_main_scheduler',
 	'portage.emaint.modules.sync.sync:SyncRepos',
 	'_emerge.chk_updated_cfg_files:chk_updated_cfg_files',
+	'_emerge.depgraph:backtrack_depgraph,depgraph,resume_depgraph',
 	'_emerge.help:help@emerge_help',
+	'_emerge.MetadataRegen:MetadataRegen',
 	'_emerge.post_emerge:display_news_notification,post_emerge',
+	'_emerge.Scheduler:Scheduler',
+	'_emerge.search:search',
 	'_emerge.stdout_spinner:stdout_spinner',
+	'_emerge.unmerge:unmerge',
 )
 
 from portage import os
@@ -53,40 +63,30 @@ from portage.output import blue, colorize, create_color_func, darkgreen, \
 good = create_color_func("GOOD")
 bad = create_color_func("BAD")
 warn = create_color_func("WARN")
-from portage.package.ebuild._ipc.QueryCommand import QueryCommand
-from portage.package.ebuild.doebuild import _check_temp_dir
 from portage._sets import load_default_config, SETPREFIX
 from portage._sets.base import InternalPackageSet
 from portage.util import cmp_sort_key, writemsg, varexpand, \
 	writemsg_level, writemsg_stdout
 from portage.util.digraph import digraph
 from portage.util.SlotObject import SlotObject
-from portage.util._async.run_main_scheduler import run_main_scheduler
 from portage.util._async.SchedulerInterface import SchedulerInterface
 from portage.util._eventloop.global_event_loop import global_event_loop
 from portage._global_updates import _global_updates
 from portage.sync.old_tree_timestamp import old_tree_timestamp_warn
 from portage.localization import _
-from portage.metadata import action_metadata
-from portage.emaint.main import print_results
 
 from _emerge.clear_caches import clear_caches
 from _emerge.countdown import countdown
 from _emerge.create_depgraph_params import create_depgraph_params
 from _emerge.Dependency import Dependency
-from _emerge.depgraph import backtrack_depgraph, depgraph, resume_depgraph
 from _emerge.DepPrioritySatisfiedRange import DepPrioritySatisfiedRange
 from _emerge.emergelog import emergelog
 from _emerge.is_valid_package_atom import is_valid_package_atom
-from _emerge.MetadataRegen import MetadataRegen
 from _emerge.Package import Package
 from _emerge.ProgressHandler import ProgressHandler
 from _emerge.RootConfig import RootConfig
-from _emerge.Scheduler import Scheduler
-from _emerge.search import search
 from _emerge.SetArg import SetArg
 from _emerge.show_invalid_depstring_notice import show_invalid_depstring_notice
-from _emerge.unmerge import unmerge
 from _emerge.UnmergeDepPriority import UnmergeDepPriority
 from _emerge.UseFlagDisplay import pkg_use_display
 from _emerge.UserQuery import UserQuery
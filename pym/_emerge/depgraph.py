@@ -1,4 +1,4 @@
-# Copyright 1999-2017 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, print_function, unicode_literals
@@ -8,9 +8,11 @@ import errno
 import functools
 import io
 import logging
+import pickle
 import stat
 import sys
 import textwrap
+import time
 import warnings
 from collections import deque
 from itertools import chain
@@ -46,7 +48,9 @@ from portage.util import ConfigProtect, shlex_split, new_protect_filename
 from portage.util import cmp_sort_key, writemsg, writemsg_stdout
 from portage.util import ensure_dirs
 from portage.util import writemsg_level, write_atomic
+from portage.util.cpuinfo import get_cpu_count
 from portage.util.digraph import digraph
+from portage.util._async.AsyncFunction import AsyncFunction
 from portage.util._async.TaskScheduler import TaskScheduler
 from portage.util._eventloop.EventLoop import EventLoop
 from portage.util._eventloop.global_event_loop import global_event_loop
@@ -101,6 +105,14 @@ class _scheduler_graph_config(object):
 		self.graph = graph
 		self.mergelist = mergelist
 
+def _copy_dep_struct(dep_struct):
+	"""
+	Return a copy of the nested lists of a dependency structure, as
+	returned from use_reduce, sharing the atoms of the original.
+	"""
+	return [_copy_dep_struct(x) if isinstance(x, list) else x
+		for x in dep_struct]
+
 def _wildcard_set(atoms):
 	pkgs = InternalPackageSet(allow_wildcard=True)
 	for x in atoms:
@@ -130,6 +142,15 @@ class _frozen_depgraph_config(object):
 		# All Package instances
 		self._pkg_cache = {}
 		self._highest_license_masked = {}
+		# Reduced dependency structures, which the depgraph instances
+		# that are created for backtracking share (see _reduce_deps).
+		self._reduced_deps_cache = {}
+		self._reduced_deps_hits = 0
+		self._reduced_deps_misses = 0
+		# Expanded atoms and candidate versions for each atom and package
+		# type, which the depgraph instances that are created for
+		# backtracking also share (see _iter_match_pkgs_atom).
+		self._atom_candidates_cache = {}
 		# We can't know that an soname dep is unsatisfied if there are
 		# any unbuilt ebuilds in the graph, since unbuilt ebuilds have
 		# no soname data. Therefore, only enable soname dependency
@@ -668,6 +689,10 @@ class depgraph(object):
 			self._spinner_update()
 			self._dynamic_config._package_tracker.add_installed_pkg(pkg)
 			self._add_installed_sonames(pkg)
+			if pkg.cpv in fake_vartree._aux_get_history:
+				# The fake_vartree is shared with earlier backtracking
+				# runs, which have already applied the dynamic deps.
+				continue
 			ebuild_path, repo_path = \
 				portdb.findname2(pkg.cpv, myrepo=pkg.repo)
 			if ebuild_path is None:
@@ -3351,11 +3376,8 @@ class depgraph(object):
 						noiselevel=-1, level=logging.DEBUG)
 
 				try:
-					dep_string = portage.dep.use_reduce(dep_string,
-						uselist=use_enabled,
-						is_valid_flag=pkg.iuse.is_valid_flag,
-						opconvert=True, token_class=Atom,
-						eapi=pkg.eapi)
+					dep_string = self._reduce_deps(pkg, dep_string,
+						use_enabled)
 				except portage.exception.InvalidDependString as e:
 					if not pkg.installed:
 						# should have been masked before it was selected
@@ -3366,10 +3388,8 @@ class depgraph(object):
 					# invalid USE conditionals are a common problem and it's
 					# practical to ignore this issue for installed packages.
 					try:
-						dep_string = portage.dep.use_reduce(dep_string,
-							uselist=use_enabled,
-							opconvert=True, token_class=Atom,
-							eapi=pkg.eapi)
+						dep_string = self._reduce_deps(pkg, dep_string,
+							use_enabled, validate=False)
 					except portage.exception.InvalidDependString as e:
 						self._dynamic_config._masked_installed.add(pkg)
 						del e
@@ -4653,6 +4673,47 @@ class depgraph(object):
 		return [pkg.slot_atom for pkg in greedy_pkgs \
 			if pkg not in discard_pkgs]
 
+	def _reduce_deps(self, pkg, dep_string, use, validate=True):
+		"""
+		Return the result of use_reduce for a dependency string of pkg,
+		with opconvert=True and Atom tokens. Results are memoized in the
+		_frozen_depgraph_config, keyed on the dep string and the effective
+		USE of pkg (which also determines the EAPI and IUSE that apply),
+		so that each backtracking run does not reduce the same dependencies
+		again. Since the memoized structure is shared, a copy of its lists
+		is returned, which the caller is free to modify.
+
+		@param pkg: the package that the dependencies belong to, or None
+			for dependencies that are not evaluated for a package, in
+			which case validate is ignored
+		@type pkg: Package
+		@param validate: whether to raise InvalidDependString for USE
+			conditionals with flags that are not in IUSE
+		@type validate: bool
+		"""
+		frozen_config = self._frozen_config
+		cache_key = (pkg, dep_string, frozenset(use or ()),
+			validate and pkg is not None)
+
+		try:
+			dep_struct = frozen_config._reduced_deps_cache[cache_key]
+		except KeyError:
+			frozen_config._reduced_deps_misses += 1
+			eapi = None
+			is_valid_flag = None
+			if pkg is not None:
+				eapi = pkg.eapi
+				if validate:
+					is_valid_flag = pkg.iuse.is_valid_flag
+			dep_struct = portage.dep.use_reduce(dep_string,
+				uselist=use, is_valid_flag=is_valid_flag,
+				opconvert=True, token_class=Atom, eapi=eapi)
+			frozen_config._reduced_deps_cache[cache_key] = dep_struct
+		else:
+			frozen_config._reduced_deps_hits += 1
+
+		return _copy_dep_struct(dep_struct)
+
 	def _select_atoms_from_graph(self, *pargs, **kwargs):
 		"""
 		Prefer atoms matching packages that have already been
@@ -4668,15 +4729,8 @@ class depgraph(object):
 		None then self._dynamic_config._filtered_trees is used."""
 
 		if not isinstance(depstring, list):
-			eapi = None
-			is_valid_flag = None
-			if parent is not None:
-				eapi = parent.eapi
-				if not parent.installed:
-					is_valid_flag = parent.iuse.is_valid_flag
-			depstring = portage.dep.use_reduce(depstring,
-				uselist=myuse, opconvert=True, token_class=Atom,
-				is_valid_flag=is_valid_flag, eapi=eapi)
+			depstring = self._reduce_deps(parent, depstring, myuse,
+				validate=(parent is not None and not parent.installed))
 
 		if (self._dynamic_config.myparams.get(
 			"ignore_built_slot_operator_deps", "n") == "y" and
@@ -5559,6 +5613,38 @@ class depgraph(object):
 				yield self._pkg(cpv, pkg_type, root_config,
 					installed=installed, onlydeps=onlydeps)
 
+	def _atom_candidates(self, root_config, pkg_type, atom):
+		"""
+		Return the expanded atom, the versions of its cp in descending
+		order, and the repositories to search for atom in the database
+		for pkg_type. The package databases do not change during
+		dependency resolution, so the result is memoized in the frozen
+		config, where the depgraph instances that are created for
+		backtracking share it. Only the per-version checks that depend
+		on the state of a particular run, such as USE, are repeated.
+		"""
+		db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
+		cache_key = (db, atom)
+		try:
+			return self._frozen_config._atom_candidates_cache[cache_key]
+		except KeyError:
+			pass
+
+		atom_exp = dep_expand(atom, mydb=db, settings=root_config.settings)
+		cp_list = db.cp_list(atom_exp.cp)
+		repo_list = None
+		if cp_list:
+			if atom.repo is None and hasattr(db, "getRepositories"):
+				repo_list = db.getRepositories(catpkg=atom_exp.cp)
+			else:
+				repo_list = [atom.repo]
+			# descending order
+			cp_list.reverse()
+
+		result = (atom_exp, tuple(cp_list), repo_list)
+		self._frozen_config._atom_candidates_cache[cache_key] = result
+		return result
+
 	def _iter_match_pkgs_atom(self, root_config, pkg_type, atom,
 		onlydeps=False):
 		"""
@@ -5569,21 +5655,14 @@ class depgraph(object):
 		"""
 
 		db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
-		atom_exp = dep_expand(atom, mydb=db, settings=root_config.settings)
-		cp_list = db.cp_list(atom_exp.cp)
+		atom_exp, cp_list, repo_list = self._atom_candidates(
+			root_config, pkg_type, atom)
 		matched_something = False
 		installed = pkg_type == 'installed'
 
 		if cp_list:
 			atom_set = InternalPackageSet(initial_atoms=(atom,),
 				allow_repo=True)
-			if atom.repo is None and hasattr(db, "getRepositories"):
-				repo_list = db.getRepositories(catpkg=atom_exp.cp)
-			else:
-				repo_list = [atom.repo]
-
-			# descending order
-			cp_list.reverse()
 			for cpv in cp_list:
 				# Call match_from_list on one cpv at a time, in order
 				# to avoid unnecessary match_from_list comparisons on
@@ -9686,6 +9765,169 @@ def _spinner_stop(spinner):
 
 	portage.writemsg_stdout("... done!\n")
 
+class _backtrack_workers(object):
+	"""
+	Evaluate pending backtrack parameters speculatively in forked
+	processes, which inherit the frozen config of the parent. A worker
+	only reports the result of a run that needs a restart, which is the
+	only kind of run that the parent does not need a depgraph instance
+	for. The parent consumes a result when the Backtracker returns the
+	same parameter, in the same order as a sequential search, and it
+	runs the depgraph itself for any parameter that has no usable
+	result. Therefore, the outcome is the same as without workers.
+	"""
+
+	def __init__(self, settings, trees, myopts, myparams, myfiles,
+		frozen_config, max_jobs):
+		self._depgraph_args = (settings, trees, myopts, myparams)
+		self._myfiles = myfiles
+		self._frozen_config = frozen_config
+		self._max_jobs = max_jobs
+		self._tasks = []
+
+	def start(self, pending):
+		"""
+		Start workers for the given parameters, unless they have one
+		already, as long as fewer than max_jobs workers are running.
+		"""
+		running = sum(1 for parameter, task in self._tasks
+			if task.returncode is None)
+		for parameter in pending:
+			if running >= self._max_jobs:
+				break
+			if any(parameter == x for x, task in self._tasks):
+				continue
+			task = AsyncFunction(target=self._evaluate, args=(parameter,),
+				scheduler=global_event_loop())
+			task.start()
+			self._tasks.append((parameter, task))
+			running += 1
+
+	def result(self, parameter, mydepgraph):
+		"""
+		Return the backtrack infos of a worker that has found that a
+		restart is needed for the given parameter, or None if the parent
+		needs to run the depgraph for it. Packages in the result are
+		looked up through mydepgraph.
+		"""
+		for i, (x, task) in enumerate(self._tasks):
+			if parameter == x:
+				break
+		else:
+			return None
+
+		del self._tasks[i]
+		task.wait()
+		if task.returncode != os.EX_OK or task.result is None:
+			return None
+
+		frozen_config = self._frozen_config
+
+		def persistent_load(pid):
+			if pid[0] == "root_config":
+				return frozen_config.roots[pid[1]]
+			hash_key, cpv, type_name, root, installed, onlydeps, repo = pid[1:]
+			pkg = frozen_config._pkg_cache.get(hash_key)
+			if pkg is None:
+				pkg = mydepgraph._pkg(cpv, type_name,
+					frozen_config.roots[root], installed=installed,
+					onlydeps=onlydeps, myrepo=repo)
+				if pkg._hash_key != hash_key:
+					raise portage.exception.PackageNotFound(cpv)
+			return pkg
+
+		unpickler = pickle.Unpickler(io.BytesIO(task.result))
+		unpickler.persistent_load = persistent_load
+		try:
+			infos, license_masked, messages = unpickler.load()
+		except portage.exception.PackageNotFound:
+			return None
+
+		for slot_key, pkg in license_masked.items():
+			other_pkg = frozen_config._highest_license_masked.get(slot_key)
+			if other_pkg is None or pkg > other_pkg:
+				frozen_config._highest_license_masked[slot_key] = pkg
+		if messages:
+			writemsg(messages, noiselevel=-1)
+		return infos
+
+	def cancel(self):
+		for parameter, task in self._tasks:
+			task.cancel()
+			task.wait()
+		del self._tasks[:]
+
+	def _evaluate(self, parameter):
+		"""
+		Run the depgraph for parameter in a worker, and return its
+		result pickled, or None if it does not need a restart. Messages
+		are captured, so that the parent can show them if it uses the
+		result.
+		"""
+		settings, trees, myopts, myparams = self._depgraph_args
+		frozen_config = self._frozen_config
+		frozen_config.spinner = None
+		license_masked = frozen_config._highest_license_masked.copy()
+
+		stdout_orig = sys.stdout
+		stderr_orig = sys.stderr
+		out = io.StringIO()
+		try:
+			sys.stdout = sys.stderr = out
+			mydepgraph = depgraph(settings, trees, myopts, myparams, None,
+				frozen_config=frozen_config, allow_backtracking=True,
+				backtrack_parameters=parameter)
+			success, favorites = mydepgraph.select_files(self._myfiles)
+			restart = not (success or mydepgraph.need_config_change()) and \
+				mydepgraph.need_restart()
+		except Exception:
+			# The parent runs the depgraph again, and reports the error.
+			return None
+		finally:
+			sys.stdout = stdout_orig
+			sys.stderr = stderr_orig
+
+		if not restart:
+			return None
+
+		roots = dict((id(x), x.root) for x in frozen_config.roots.values())
+
+		def persistent_id(obj):
+			if isinstance(obj, Package):
+				return ("Package", obj._hash_key, _unicode(obj.cpv),
+					obj.type_name, obj.root, obj.installed, obj.onlydeps,
+					obj.repo)
+			if isinstance(obj, RootConfig) and id(obj) in roots:
+				return ("root_config", roots[id(obj)])
+			return None
+
+		license_masked = dict((k, v)
+			for k, v in frozen_config._highest_license_masked.items()
+			if license_masked.get(k) is not v)
+		f = io.BytesIO()
+		pickler = pickle.Pickler(f, 2)
+		pickler.persistent_id = persistent_id
+		try:
+			pickler.dump((mydepgraph.get_backtrack_infos(), license_masked,
+				out.getvalue()))
+		except Exception:
+			# Some object in the infos cannot be transferred, so the
+			# parent needs to run the depgraph itself.
+			return None
+		return f.getvalue()
+
+
+def _backtrack_jobs(myopts):
+	"""
+	Return the number of workers to use for speculative backtracking,
+	which is the --backtrack-jobs setting, limited to the number of
+	CPUs since the workers do not wait for anything.
+	"""
+	if "--debug" in myopts or not hasattr(os, "fork"):
+		return 0
+	return min(myopts.get("--backtrack-jobs", 0), get_cpu_count() or 1)
+
+
 def backtrack_depgraph(settings, trees, myopts, myparams,
 	myaction, myfiles, spinner):
 	"""
@@ -9702,6 +9944,7 @@ def backtrack_depgraph(settings, trees, myopts, myparams,
 def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, spinner):
 
 	debug = "--debug" in myopts
+	start_time = time.time()
 	mydepgraph = None
 	max_retries = myopts.get('--backtrack', 10)
 	max_depth = max(1, (max_retries + 1) // 2)
@@ -9712,38 +9955,60 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 	frozen_config = _frozen_depgraph_config(settings, trees,
 		myopts, myparams, spinner)
 
-	while backtracker:
+	workers = None
+	max_jobs = _backtrack_jobs(myopts)
+	if allow_backtracking and max_jobs > 0:
+		workers = _backtrack_workers(settings, trees, myopts, myparams,
+			myfiles, frozen_config, max_jobs)
 
-		if debug and mydepgraph is not None:
-			writemsg_level(
-				"\n\nbacktracking try %s \n\n" % \
-				backtracked, noiselevel=-1, level=logging.DEBUG)
-			mydepgraph.display_problems()
+	try:
+		while backtracker:
 
-		backtrack_parameters = backtracker.get()
-		if debug and backtrack_parameters.runtime_pkg_mask:
-			writemsg_level(
-				"\n\nruntime_pkg_mask: %s \n\n" %
-				backtrack_parameters.runtime_pkg_mask,
-				noiselevel=-1, level=logging.DEBUG)
+			if debug and mydepgraph is not None:
+				writemsg_level(
+					"\n\nbacktracking try %s \n\n" % \
+					backtracked, noiselevel=-1, level=logging.DEBUG)
+				mydepgraph.display_problems()
 
-		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
-			frozen_config=frozen_config,
-			allow_backtracking=allow_backtracking,
-			backtrack_parameters=backtrack_parameters)
-		success, favorites = mydepgraph.select_files(myfiles)
+			backtrack_parameters = backtracker.get()
+			if debug and backtrack_parameters.runtime_pkg_mask:
+				writemsg_level(
+					"\n\nruntime_pkg_mask: %s \n\n" %
+					backtrack_parameters.runtime_pkg_mask,
+					noiselevel=-1, level=logging.DEBUG)
 
-		if success or mydepgraph.need_config_change():
-			break
-		elif not allow_backtracking:
-			break
-		elif backtracked >= max_retries:
-			break
-		elif mydepgraph.need_restart():
-			backtracked += 1
-			backtracker.feedback(mydepgraph.get_backtrack_infos())
-		else:
-			break
+			if workers is not None:
+				# A worker result is only used if the run would not be
+				# the last one, since that requires a depgraph instance.
+				infos = None
+				if backtracked < max_retries:
+					infos = workers.result(backtrack_parameters, mydepgraph)
+				workers.start(backtracker.pending(max_jobs))
+				if infos is not None:
+					backtracked += 1
+					backtracker.feedback(infos)
+					continue
+
+			mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
+				frozen_config=frozen_config,
+				allow_backtracking=allow_backtracking,
+				backtrack_parameters=backtrack_parameters)
+			success, favorites = mydepgraph.select_files(myfiles)
+
+			if success or mydepgraph.need_config_change():
+				break
+			elif not allow_backtracking:
+				break
+			elif backtracked >= max_retries:
+				break
+			elif mydepgraph.need_restart():
+				backtracked += 1
+				backtracker.feedback(mydepgraph.get_backtrack_infos())
+			else:
+				break
+	finally:
+		if workers is not None:
+			workers.cancel()
 
 	if not (success or mydepgraph.need_config_change()) and backtracked:
 
@@ -9770,6 +10035,17 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 			frozen_config=frozen_config, allow_backtracking=False)
 		success, favorites = mydepgraph.select_files(myfiles)
 
+	if debug:
+		hits = frozen_config._reduced_deps_hits
+		lookups = hits + frozen_config._reduced_deps_misses
+		writemsg_level(
+			"\n\ndependency resolution took %.2f seconds, "
+			"with %s backtracking tries\n"
+			"reduced dependency cache: %s hits, %s misses (%.1f%% hit rate)"
+			"\n\n" % (time.time() - start_time, backtracked, hits,
+			lookups - hits, 100.0 * hits / lookups if lookups else 0.0),
+			noiselevel=-1, level=logging.DEBUG)
+
 	return (success, mydepgraph, favorites)
 
 
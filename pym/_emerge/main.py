@@ -1,4 +1,4 @@
-# Copyright 1999-2017 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import print_function
@@ -383,6 +383,14 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--backtrack-jobs": {
+
+			"help"   : "Specifies how many alternative backtracking runs " + \
+				"may be evaluated in parallel",
+
+			"action" : "store"
+		},
+
 		"--binpkg-changed-deps": {
 			"help"    : ("reject binary packages with outdated "
 				"dependencies"),
@@ -995,6 +1003,21 @@ def parse_opts(tmpcmdline, silent=False):
 
 		myoptions.backtrack = backtrack
 
+	if myoptions.backtrack_jobs is not None:
+
+		try:
+			backtrack_jobs = int(myoptions.backtrack_jobs)
+		except (OverflowError, ValueError):
+			backtrack_jobs = -1
+
+		if backtrack_jobs < 0:
+			backtrack_jobs = None
+			if not silent:
+				parser.error("Invalid --backtrack-jobs parameter: '%s'\n" % \
+					(myoptions.backtrack_jobs,))
+
+		myoptions.backtrack_jobs = backtrack_jobs
+
 	if myoptions.deep is not None:
 		deep = None
 		if myoptions.deep == "True":
@@ -1,4 +1,4 @@
-# Copyright 2010-2012 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import copy
@@ -119,6 +119,16 @@ class Backtracker(object):
 			return None
 
 
+	def pending(self, count):
+		"""
+		Returns copies of up to count backtrack parameters that get() would
+		return next if no feedback was given, in the same order.
+		"""
+		nodes = self._unexplored_nodes
+		return [copy.deepcopy(node.parameter)
+			for node in reversed(nodes[max(0, len(nodes) - count):])]
+
+
 	def __len__(self):
 		return len(self._unexplored_nodes)
 
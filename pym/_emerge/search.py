@@ -1,4 +1,4 @@
-# Copyright 1999-2016 Gentoo Foundation
+# Copyright 1999-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -7,6 +7,8 @@ import difflib
 import re
 import portage
 from portage import os
+from portage.cache.index.pkg_trigram_index import similar_cps
+from portage.cache.index.pkg_word_index import desc_match_cps
 from portage.dbapi.porttree import _parse_uri_map
 from portage.dbapi.IndexedPortdb import IndexedPortdb
 from portage.dbapi.IndexedVardb import IndexedVardb
@@ -257,6 +259,7 @@ class search(object):
 			match_category = 1
 			self.searchkey = self.searchkey[1:]
 		fuzzy = False
+		similar = None
 		if regexsearch:
 			self.searchre=re.compile(self.searchkey,re.I)
 		else:
@@ -294,6 +297,20 @@ class search(object):
 						for seq_match, part in zip(
 						part_matchers, part_split(match_string)))
 
+				# If the repositories have a trigram index, then skip
+				# the comparison for their package names that do not
+				# share a trigram with the package name part of the key.
+				similar = self._with_unindexed_cps(similar_cps(self._portdb,
+					part_split(self.searchkey)[-1]))
+
+		desc_candidates = None
+		if self.searchdesc and not regexsearch:
+			# If the repositories have a word index, then skip the
+			# DESCRIPTION lookup for their packages that do not have
+			# all of the words of the key.
+			desc_candidates = self._with_unindexed_cps(
+				desc_match_cps(self._portdb, self.searchkey))
+
 		for package in self._cp_all():
 			self._spinner_update()
 
@@ -304,9 +321,13 @@ class search(object):
 
 			if self.searchre.search(match_string):
 				yield ("pkg", package)
-			elif fuzzy and fuzzy_search(match_string):
+			elif fuzzy and (similar is None or package in similar) and \
+				fuzzy_search(match_string):
 				yield ("pkg", package)
 			elif self.searchdesc: # DESCRIPTION searching
+				if desc_candidates is not None and \
+					package not in desc_candidates:
+					continue
 				# Use _first_cp to avoid an expensive visibility check,
 				# since the visibility check can be avoided entirely
 				# when the DESCRIPTION does not match.
@@ -339,6 +360,18 @@ class search(object):
 					self.sdict[setname].getMetadata("DESCRIPTION")):
 					yield ("set", setname)
 
+	def _with_unindexed_cps(self, cps):
+		"""
+		Add the package names of the dbs other than the portdb, which
+		do not have an index, to a set of package names which was found
+		in an index of the portdb. Returns None if cps is None.
+		"""
+		if cps is not None:
+			for db in self._dbs:
+				if db is not self._portdb:
+					cps.update(db.cp_all())
+		return cps
+
 	def addCP(self, cp):
 		"""
 		Add a specific cp to the search results. This modifies the
@@ -10,8 +10,12 @@ import time
 
 import portage
 from portage import os
+from portage.package.ebuild._distfiles_layout import directory_layouts
+from portage.package.ebuild._mirror_stats import MirrorStats
 from portage.util import grabdict, grablines
 from portage.util._ShelveUnicodeWrapper import ShelveUnicodeWrapper
+from .DigestCache import DigestCache
+from .SqliteDatabase import SqliteDatabase
 
 class Config(object):
 	def __init__(self, options, portdb, event_loop):
@@ -31,8 +35,10 @@ class Config(object):
 		self.log_failure = self._open_log('failure', options.failure_log, 'a')
 
 		self.distfiles = None
+		self.layouts = None
 		if options.distfiles is not None:
 			self.distfiles = options.distfiles
+			self.layouts = directory_layouts(options.distfiles)
 
 		self.mirrors = copy.copy(portdb.settings.thirdpartymirrors())
 
@@ -43,6 +49,11 @@ class Config(object):
 			for x in options.mirror_skip.split(","):
 				self.mirrors[x] = []
 
+		self.mirror_stats = None
+		if options.mirror_stats is not None:
+			self.mirror_stats = MirrorStats(options.mirror_stats)
+			self.mirror_stats.load()
+
 		self.whitelist = None
 		if options.whitelist_from is not None:
 			self.whitelist = set()
@@ -72,6 +83,20 @@ class Config(object):
 			self.deletion_db = self._open_shelve(
 				options.deletion_db, 'deletion')
 
+		self.digest_cache = None
+		if options.digest_db is not None:
+			self.digest_cache = DigestCache(
+				self._open_shelve(options.digest_db, 'digest'),
+				options.digest_db_reverify)
+
+	def layout_path(self, distfile):
+		"""
+		Return the path of a distfile under the primary layout of the
+		distfiles directory.
+		"""
+		return os.path.join(self.options.distfiles,
+			self.layouts[0].get_path(distfile))
+
 	def _open_log(self, log_desc, log_path, mode):
 
 		if log_path is None or self.options.dry_run:
@@ -108,6 +133,9 @@ class Config(object):
 
 		if self.options.dry_run and not os.path.exists(db_file):
 			db = {}
+		elif self.options.db_backend == "sqlite":
+			db = SqliteDatabase(db_file, db_desc,
+				readonly=self.options.dry_run)
 		else:
 			try:
 				db = shelve.open(db_file, flag=open_flag)
@@ -136,5 +164,9 @@ class Config(object):
 		return self
 
 	def __exit__(self, exc_type, exc_value, traceback):
+		if self.mirror_stats is not None and not self.options.dry_run:
+			self.mirror_stats.save()
+		if self.digest_cache is not None and not self.options.dry_run:
+			self.digest_cache.finish()
 		while self._open_files:
 			self._open_files.pop().close()
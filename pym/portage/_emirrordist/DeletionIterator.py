@@ -5,7 +5,10 @@ import logging
 import stat
 
 from portage import os
+from portage.package.ebuild._distfiles_layout import (distfile_path,
+	walk_distfiles)
 from .DeletionTask import DeletionTask
+from .SqliteDatabase import discard_missing, expired_keys
 
 class DeletionIterator(object):
 
@@ -20,10 +23,20 @@ class DeletionIterator(object):
 		deletion_db = self._config.deletion_db
 		deletion_delay = self._config.options.deletion_delay
 		start_time = self._config.start_time
-		distfiles_set = set(os.listdir(self._config.options.distfiles))
-		for filename in distfiles_set:
+		layouts = self._config.layouts
+		distfiles_set = set()
+		expired = None
+		if deletion_db is not None and deletion_delay is not None:
+			expired = frozenset(expired_keys(deletion_db,
+				start_time - deletion_delay, inclusive=True))
+		for filename, path in walk_distfiles(distdir, layouts):
+			if filename in distfiles_set:
+				# Another copy, under a different layout. Copies are
+				# merged by FetchTask when --migrate-layout is enabled.
+				continue
+			distfiles_set.add(filename)
 			try:
-				st = os.stat(os.path.join(distdir, filename))
+				st = os.stat(path)
 			except OSError as e:
 				logging.error("stat failed on '%s' in distfiles: %s\n" %
 					(filename, e))
@@ -43,7 +56,7 @@ class DeletionIterator(object):
 					except KeyError:
 						pass
 			elif distfiles_local is not None and \
-				os.path.exists(os.path.join(distfiles_local, filename)):
+				os.path.exists(distfile_path(distfiles_local, filename)):
 				if deletion_db is not None:
 					try:
 						del deletion_db[filename]
@@ -55,29 +68,20 @@ class DeletionIterator(object):
 				if deletion_db is None or deletion_delay is None:
 
 					yield DeletionTask(background=True,
-						distfile=filename,
+						distfile=filename, distfile_path=path,
 						config=self._config)
 
-				else:
-					deletion_entry = deletion_db.get(filename)
-
-					if deletion_entry is None:
-						logging.debug("add '%s' to deletion db" % filename)
-						deletion_db[filename] = start_time
+				elif filename in expired:
 
-					elif deletion_entry + deletion_delay <= start_time:
+					yield DeletionTask(background=True,
+						distfile=filename, distfile_path=path,
+						config=self._config)
 
-						yield DeletionTask(background=True,
-							distfile=filename,
-							config=self._config)
+				elif filename not in deletion_db:
+					logging.debug("add '%s' to deletion db" % filename)
+					deletion_db[filename] = start_time
 
 		if deletion_db is not None:
-			for filename in list(deletion_db):
-				if filename not in distfiles_set:
-					try:
-						del deletion_db[filename]
-					except KeyError:
-						pass
-					else:
-						logging.debug("drop '%s' from deletion db" %
-							filename)
+			for filename in discard_missing(deletion_db, distfiles_set):
+				logging.debug("drop '%s' from deletion db" %
+					filename)
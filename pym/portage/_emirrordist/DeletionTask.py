@@ -10,15 +10,13 @@ from _emerge.CompositeTask import CompositeTask
 
 class DeletionTask(CompositeTask):
 
-	__slots__ = ('distfile', 'config')
+	__slots__ = ('distfile', 'distfile_path', 'config')
 
 	def _start(self):
 
-		distfile_path = os.path.join(
-			self.config.options.distfiles, self.distfile)
+		distfile_path = self.distfile_path
 
 		if self.config.options.recycle_dir is not None:
-			distfile_path = os.path.join(self.config.options.distfiles, self.distfile)
 			recycle_path = os.path.join(
 				self.config.options.recycle_dir, self.distfile)
 			if self.config.options.dry_run:
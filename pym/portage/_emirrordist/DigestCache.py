@@ -0,0 +1,89 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import json
+import sys
+import zlib
+
+from portage import _encodings, _unicode_encode
+
+if sys.hexversion >= 0x3000000:
+	# pylint: disable=W0622
+	long = int
+
+class DigestCache(object):
+	"""
+	Cache of the digests of files in the distfiles directory, used to
+	avoid digesting unchanged files on every --verify-existing-digest
+	run. Each entry is valid only for the inode, size and mtime that the
+	file had when its digests were computed.
+
+	In order to detect corruption that does not change these properties,
+	a reverify_percent share of the distfiles bypasses the cache on each
+	run. Distfiles are assigned to one of 100 buckets by a hash of their
+	name, and each run bypasses the cache for a window of buckets which
+	advances with every run, so that every file is digested again within
+	100 / reverify_percent runs.
+	"""
+
+	# Distfile names cannot contain a slash, so this key cannot collide
+	# with an entry.
+	_offset_key = "/reverify-offset"
+
+	def __init__(self, db, reverify_percent):
+		self._db = db
+		self._reverify_percent = reverify_percent
+		try:
+			self._offset = long(db.get(self._offset_key, 0)) % 100
+		except ValueError:
+			self._offset = 0
+
+	@staticmethod
+	def stat_key(st):
+		mtime_ns = getattr(st, "st_mtime_ns", None)
+		if mtime_ns is None:
+			mtime_ns = long(st.st_mtime * 1000000000)
+		return [st.st_ino, st.st_size, mtime_ns]
+
+	def reverify(self, distfile):
+		"""
+		Return True if the cache must be bypassed for the given
+		distfile during this run.
+		"""
+		bucket = zlib.crc32(_unicode_encode(distfile,
+			encoding=_encodings['fs'], errors='strict')) % 100
+		return (bucket - self._offset) % 100 < self._reverify_percent
+
+	def get(self, distfile, st, hash_name):
+		"""
+		Return the cached digest of the given type, or None if there
+		is no valid entry for the file with the given stat result.
+		"""
+		try:
+			entry = json.loads(self._db[distfile])
+		except (KeyError, ValueError):
+			return None
+		try:
+			if entry["stat"] != self.stat_key(st):
+				return None
+			return entry["digests"].get(hash_name)
+		except (AttributeError, KeyError, TypeError):
+			return None
+
+	def set(self, distfile, st, digests):
+		"""Record the digests of the file with the given stat result."""
+		self._db[distfile] = json.dumps({
+			"stat": self.stat_key(st),
+			"digests": dict(digests),
+		}, sort_keys=True)
+
+	def discard(self, distfile):
+		try:
+			del self._db[distfile]
+		except KeyError:
+			pass
+
+	def finish(self):
+		"""Advance the reverify window for the next run."""
+		self._db[self._offset_key] = str(
+			(self._offset + self._reverify_percent) % 100)
@@ -1,6 +1,8 @@
-# Copyright 2013 Gentoo Foundation
+# Copyright 2013-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import multiprocessing
+import signal
 import threading
 
 from portage import os
@@ -10,6 +12,147 @@ from portage.dep import use_reduce
 from portage.exception import PortageException
 from .FetchTask import FetchTask
 
+# The portdbapi instance used by _category_fetch_list in worker
+# processes, which inherit it from the parent when they are forked.
+_worker_portdb = None
+
+# Seconds to wait for the result of a worker before checking whether
+# termination has been requested.
+_worker_result_timeout = 1
+
+def _init_worker():
+	# Termination is handled by the parent process, which terminates
+	# the workers.
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _category_fetch_list(args):
+	"""
+	Compute the fetch list of every package of a category in a worker
+	process, and return a list of records in repository order.
+	"""
+	category, restrict_mirror_exemptions = args
+	portdb = _worker_portdb
+	records = []
+	for cp in portdb.cp_all(categories=(category,)):
+		for cpv_records in _iter_cp_fetch_lists(portdb, cp,
+			restrict_mirror_exemptions):
+			records.extend(cpv_records)
+	return records
+
+def _iter_cp_fetch_lists(portdb, cp, restrict_mirror_exemptions):
+	"""
+	Generate the fetch list of each ebuild of cp, in repository order.
+	"""
+	get_repo_for_location = portdb.repositories.get_repo_for_location
+
+	for tree in portdb.porttrees:
+
+		# Reset state so the Manifest is pulled once
+		# for this cp / tree combination.
+		manifest = {}
+		repo_config = get_repo_for_location(tree)
+
+		for cpv in portdb.cp_list(cp, mytree=tree):
+			yield _cpv_fetch_list(portdb, str(cpv), cp, tree, repo_config,
+				manifest, restrict_mirror_exemptions)
+
+def _cpv_fetch_list(portdb, cpv, cp, tree, repo_config, manifest,
+	restrict_mirror_exemptions):
+	"""
+	Compute the fetch list of cpv, and return a list of records. Records
+	are either ("failure", cpv, filename, msg) for problems which are
+	logged (with filename None if the failure does not concern a
+	specific file), or ("fetch", cpv, restrict, filename, uri_tuple,
+	digests) for each distfile. Records only contain builtin types, so
+	that they can be passed from a worker process. The DIST digests of
+	the Manifest are stored in the manifest dict, which is shared by the
+	ebuilds of cp in the same tree.
+	"""
+	records = []
+
+	try:
+		restrict, = portdb.aux_get(cpv, ("RESTRICT",), mytree=tree)
+	except (KeyError, PortageException) as e:
+		records.append(("failure", cpv, None,
+			"aux_get exception %s" % (e,)))
+		return records
+
+	# Here we use matchnone=True to ignore conditional parts
+	# of RESTRICT since they don't apply unconditionally.
+	# Assume such conditionals only apply on the client side.
+	try:
+		restrict = frozenset(use_reduce(restrict,
+			flat=True, matchnone=True))
+	except PortageException as e:
+		records.append(("failure", cpv, None,
+			"use_reduce exception %s" % (e,)))
+		return records
+
+	if "fetch" in restrict:
+		return records
+
+	try:
+		uri_map = portdb.getFetchMap(cpv)
+	except PortageException as e:
+		records.append(("failure", cpv, None,
+			"getFetchMap exception %s" % (e,)))
+		return records
+
+	if not uri_map:
+		return records
+
+	if "mirror" in restrict:
+		skip = False
+		if restrict_mirror_exemptions is not None:
+			new_uri_map = {}
+			for filename, uri_tuple in uri_map.items():
+				for uri in uri_tuple:
+					if uri[:9] == "mirror://":
+						i = uri.find("/", 9)
+						if i != -1 and uri[9:i].strip("/") in \
+							restrict_mirror_exemptions:
+							new_uri_map[filename] = uri_tuple
+							break
+			if new_uri_map:
+				uri_map = new_uri_map
+			else:
+				skip = True
+		else:
+			skip = True
+
+		if skip:
+			return records
+
+	# Parse Manifest for this cp if we haven't yet.
+	digests = manifest.get("DIST")
+	if digests is None:
+		try:
+			digests = repo_config.load_manifest(
+				os.path.join(repo_config.location, cp)
+				).getTypeDigests("DIST")
+		except (EnvironmentError, PortageException) as e:
+			for filename in uri_map:
+				records.append(("failure", cpv, filename,
+					"Manifest exception %s" % (e,)))
+			return records
+		manifest["DIST"] = digests
+
+	if not digests:
+		for filename in uri_map:
+			records.append(("failure", cpv, filename,
+				"digest entry missing"))
+		return records
+
+	for filename, uri_tuple in uri_map.items():
+		file_digests = digests.get(filename)
+		if file_digests is None:
+			records.append(("failure", cpv, filename,
+				"digest entry missing"))
+			continue
+		records.append(("fetch", cpv, restrict, filename,
+			tuple(uri_tuple), dict(file_digests)))
+	return records
+
 class FetchIterator(object):
 
 	def __init__(self, config):
@@ -29,140 +172,101 @@ class FetchIterator(object):
 		"""
 		self._terminated.set()
 
-	def _iter_every_cp(self):
-		# List categories individually, in order to start yielding quicker,
-		# and in order to reduce latency in case of a signal interrupt.
-		cp_all = self._config.portdb.cp_all
-		for category in sorted(self._config.portdb.categories):
-			for cp in cp_all(categories=(category,)):
-				yield cp
+	def _iter_fetch_lists(self):
+		"""
+		Generate lists of fetch list records, in repository order.
+		With --fetch-list-jobs=1 (the default), there is one list per
+		ebuild. With --fetch-list-jobs greater than 1, categories are
+		processed by a pool of forked worker processes, and the records
+		of each category are generated as soon as it is complete, so
+		that fetching starts while later categories are still processed.
+		While a result is awaited, termination is checked periodically.
+		"""
+		global _worker_portdb
+		portdb = self._config.portdb
+		restrict_mirror_exemptions = self._config.restrict_mirror_exemptions
+		categories = sorted(portdb.categories)
+
+		jobs = self._config.options.fetch_list_jobs
+		if jobs <= 1 or len(categories) <= 1:
+			# List categories individually, in order to start yielding
+			# quicker, and in order to reduce latency in case of a
+			# signal interrupt.
+			for category in categories:
+				for cp in portdb.cp_all(categories=(category,)):
+					if self._terminated.is_set():
+						return
+					for records in _iter_cp_fetch_lists(portdb, cp,
+						restrict_mirror_exemptions):
+						if self._terminated.is_set():
+							return
+						yield records
+			return
+
+		_worker_portdb = portdb
+		args = [(category, restrict_mirror_exemptions)
+			for category in categories]
+		pool = multiprocessing.Pool(processes=min(jobs, len(args)),
+			initializer=_init_worker)
+		try:
+			results = pool.imap(_category_fetch_list, args)
+			while True:
+				try:
+					records = results.next(timeout=_worker_result_timeout)
+				except multiprocessing.TimeoutError:
+					if self._terminated.is_set():
+						return
+					continue
+				except StopIteration:
+					break
+				if self._terminated.is_set():
+					return
+				yield records
+			pool.close()
+		finally:
+			pool.terminate()
+			pool.join()
 
 	def __iter__(self):
 
 		portdb = self._config.portdb
-		get_repo_for_location = portdb.repositories.get_repo_for_location
 		file_owners = self._config.file_owners
 		file_failures = self._config.file_failures
-		restrict_mirror_exemptions = self._config.restrict_mirror_exemptions
 
 		hash_filter = _hash_filter(
 			portdb.settings.get("PORTAGE_CHECKSUM_FILTER", ""))
 		if hash_filter.transparent:
 			hash_filter = None
 
-		for cp in self._iter_every_cp():
-
-			if self._terminated.is_set():
-				return
+		for records in self._iter_fetch_lists():
+			for record in records:
 
-			for tree in portdb.porttrees:
+				if self._terminated.is_set():
+					return
 
-				# Reset state so the Manifest is pulled once
-				# for this cp / tree combination.
-				digests = None
-				repo_config = get_repo_for_location(tree)
+				if record[0] == "failure":
+					cpv, filename, msg = record[1:]
+					self._log_failure("%s\t%s\t%s" %
+						(cpv, filename or "", msg))
+					if filename is not None:
+						file_failures[filename] = cpv
+					continue
 
-				for cpv in portdb.cp_list(cp, mytree=tree):
+				cpv, restrict, filename, uri_tuple, file_digests = record[1:]
+				if filename in file_owners:
+					continue
+				file_owners[filename] = cpv
 
-					if self._terminated.is_set():
-						return
+				file_digests = \
+					_filter_unaccelarated_hashes(file_digests)
+				if hash_filter is not None:
+					file_digests = _apply_hash_filter(
+						file_digests, hash_filter)
 
-					try:
-						restrict, = portdb.aux_get(cpv, ("RESTRICT",),
-							mytree=tree)
-					except (KeyError, PortageException) as e:
-						self._log_failure("%s\t\taux_get exception %s" %
-							(cpv, e))
-						continue
-
-					# Here we use matchnone=True to ignore conditional parts
-					# of RESTRICT since they don't apply unconditionally.
-					# Assume such conditionals only apply on the client side.
-					try:
-						restrict = frozenset(use_reduce(restrict,
-							flat=True, matchnone=True))
-					except PortageException as e:
-						self._log_failure("%s\t\tuse_reduce exception %s" %
-							(cpv, e))
-						continue
-
-					if "fetch" in restrict:
-						continue
-
-					try:
-						uri_map = portdb.getFetchMap(cpv)
-					except PortageException as e:
-						self._log_failure("%s\t\tgetFetchMap exception %s" %
-							(cpv, e))
-						continue
-
-					if not uri_map:
-						continue
-
-					if "mirror" in restrict:
-						skip = False
-						if restrict_mirror_exemptions is not None:
-							new_uri_map = {}
-							for filename, uri_tuple in uri_map.items():
-								for uri in uri_tuple:
-									if uri[:9] == "mirror://":
-										i = uri.find("/", 9)
-										if i != -1 and uri[9:i].strip("/") in \
-											restrict_mirror_exemptions:
-											new_uri_map[filename] = uri_tuple
-											break
-							if new_uri_map:
-								uri_map = new_uri_map
-							else:
-								skip = True
-						else:
-							skip = True
-
-						if skip:
-							continue
-
-					# Parse Manifest for this cp if we haven't yet.
-					if digests is None:
-						try:
-							digests = repo_config.load_manifest(
-								os.path.join(repo_config.location, cp)
-								).getTypeDigests("DIST")
-						except (EnvironmentError, PortageException) as e:
-							for filename in uri_map:
-								self._log_failure(
-									"%s\t%s\tManifest exception %s" %
-									(cpv, filename, e))
-								file_failures[filename] = cpv
-							continue
-
-					if not digests:
-						for filename in uri_map:
-							self._log_failure("%s\t%s\tdigest entry missing" %
-								(cpv, filename))
-							file_failures[filename] = cpv
-						continue
-
-					for filename, uri_tuple in uri_map.items():
-						file_digests = digests.get(filename)
-						if file_digests is None:
-							self._log_failure("%s\t%s\tdigest entry missing" %
-								(cpv, filename))
-							file_failures[filename] = cpv
-							continue
-						if filename in file_owners:
-							continue
-						file_owners[filename] = cpv
-
-						file_digests = \
-							_filter_unaccelarated_hashes(file_digests)
-						if hash_filter is not None:
-							file_digests = _apply_hash_filter(
-								file_digests, hash_filter)
-
-						yield FetchTask(cpv=cpv,
-							background=True,
-							digests=file_digests,
-							distfile=filename,
-							restrict=restrict,
-							uri_tuple=uri_tuple,
-							config=self._config)
+				yield FetchTask(cpv=cpv,
+					background=True,
+					digests=file_digests,
+					distfile=filename,
+					restrict=restrict,
+					uri_tuple=uri_tuple,
+					config=self._config)
@@ -10,10 +10,15 @@ import random
 import stat
 import subprocess
 import sys
+import time
 
 import portage
 from portage import _encodings, _unicode_encode
 from portage import os
+from portage.exception import PortageException
+from portage.package.ebuild._distfiles_layout import (distfile_path,
+	lookup_layouts)
+from portage.util import ensure_dirs
 from portage.util._async.FileCopier import FileCopier
 from portage.util._async.FileDigester import FileDigester
 from portage.util._async.PipeLogger import PipeLogger
@@ -30,10 +35,12 @@ class FetchTask(CompositeTask):
 
 	__slots__ = ('distfile', 'digests', 'config', 'cpv',
 		'restrict', 'uri_tuple', '_current_mirror',
-		'_current_stat', '_fetch_tmp_dir_info', '_fetch_tmp_file',
-		'_fs_mirror_stack', '_mirror_stack',
+		'_current_stat', '_distfile_path', '_distfile_stat',
+		'_fetch_tmp_dir_info',
+		'_fetch_tmp_file', '_fs_mirror_stack', '_mirror_stack',
 		'_previously_added',
-		'_primaryuri_stack', '_log_path', '_tried_uris')
+		'_primaryuri_stack', '_log_path', '_tried_uris',
+		'_verified_digests')
 
 	def _start(self):
 
@@ -60,8 +67,8 @@ class FetchTask(CompositeTask):
 			self._async_wait()
 			return
 
-		distfile_path = os.path.join(
-			self.config.options.distfiles, self.distfile)
+		distfile_path = self._find_distfile()
+		self._distfile_path = distfile_path
 
 		st = None
 		size_ok = False
@@ -99,6 +106,24 @@ class FetchTask(CompositeTask):
 
 		if size_ok:
 			if self.config.options.verify_existing_digest:
+				digest_cache = self.config.digest_cache
+				if digest_cache is not None and \
+					not digest_cache.reverify(self.distfile):
+					hash_name = self._select_hash()
+					cached_digest = digest_cache.get(
+						self.distfile, st, hash_name)
+					if cached_digest is not None:
+						# The file has not changed since it was
+						# digested, so the result is known.
+						if cached_digest == self.digests[hash_name]:
+							self._success()
+							self.returncode = os.EX_OK
+							self._async_wait()
+						else:
+							self._start_fetch()
+						return
+
+				self._distfile_stat = st
 				self._start_task(
 					FileDigester(file_path=distfile_path,
 						hash_names=(self._select_hash(),),
@@ -113,6 +138,52 @@ class FetchTask(CompositeTask):
 
 		self._start_fetch()
 
+	def _find_distfile(self):
+		"""
+		Return the path of the distfile in the distfiles directory. This
+		is the path under the primary layout, unless the file is only
+		found under another layout. With --migrate-layout, the file is
+		moved to the primary layout, and copies under other layouts are
+		removed.
+		"""
+		primary_path = self.config.layout_path(self.distfile)
+		if not self.config.options.migrate_layout:
+			return distfile_path(self.config.options.distfiles,
+				self.distfile, self.config.layouts)
+
+		path = primary_path
+		for layout in lookup_layouts(self.config.layouts):
+			other_path = os.path.join(self.config.options.distfiles,
+				layout.get_path(self.distfile))
+			if other_path == primary_path or \
+				not os.path.lexists(other_path):
+				continue
+			if self.config.options.dry_run:
+				logging.info(("dry-run: move '%s' to the primary "
+					"layout of distfiles") % (self.distfile,))
+				if path == primary_path and \
+					not os.path.lexists(primary_path):
+					path = other_path
+				continue
+			try:
+				if os.path.lexists(primary_path):
+					os.unlink(other_path)
+				else:
+					ensure_dirs(os.path.dirname(primary_path))
+					os.rename(other_path, primary_path)
+			except (OSError, PortageException) as e:
+				msg = "%s move to the primary layout failed: %s" % \
+					(self.distfile, e)
+				self.scheduler.output(msg + '\n', background=True,
+					log_path=self._log_path)
+				logging.error(msg)
+				if not os.path.lexists(primary_path):
+					path = other_path
+			else:
+				logging.debug(("move '%s' to the primary layout "
+					"of distfiles") % (self.distfile,))
+		return path
+
 	def _success(self):
 		if not self._previously_added:
 			size = self.digests["size"]
@@ -128,6 +199,11 @@ class FetchTask(CompositeTask):
 				except OSError:
 					pass
 
+		if self._verified_digests is not None and \
+			self.config.digest_cache is not None and \
+			not self.config.options.dry_run:
+			self._cache_digests()
+
 		if self.config.options.recycle_dir is not None:
 
 			recycle_file = os.path.join(
@@ -146,6 +222,24 @@ class FetchTask(CompositeTask):
 					logging.debug("delete '%s' from recycle" %
 						(self.distfile,))
 
+	def _cache_digests(self):
+		"""
+		Record the digests verified for the file in the distfiles
+		directory in the digest cache, unless the file has changed
+		since it was digested.
+		"""
+		try:
+			st = os.stat(self._distfile_path)
+		except OSError:
+			return
+		digest_cache = self.config.digest_cache
+		if self._distfile_stat is not None and \
+			digest_cache.stat_key(st) != \
+			digest_cache.stat_key(self._distfile_stat):
+			digest_cache.discard(self.distfile)
+			return
+		digest_cache.set(self.distfile, st, self._verified_digests)
+
 	def _distfiles_digester_exit(self, digester):
 
 		self._assert_current(digester)
@@ -171,6 +265,7 @@ class FetchTask(CompositeTask):
 
 		wrong_digest = self._find_bad_digest(digester.digests)
 		if wrong_digest is None:
+			self._verified_digests = digester.digests
 			self._success()
 			self.returncode = os.EX_OK
 			self.wait()
@@ -184,6 +279,21 @@ class FetchTask(CompositeTask):
 	def _start_fetch(self):
 
 		self._previously_added = False
+		self._distfile_stat = None
+		self._verified_digests = None
+
+		primary_path = self.config.layout_path(self.distfile)
+		if not self.config.options.dry_run:
+			if self._distfile_path != primary_path:
+				# The file is fetched to the primary layout, so
+				# an invalid copy under another layout is obsolete.
+				self._unlink_file(self._distfile_path, "distfiles")
+			try:
+				ensure_dirs(os.path.dirname(primary_path))
+			except PortageException as e:
+				logging.error("%s ensure_dirs failed in distfiles: %s" %
+					(self.distfile, e))
+		self._distfile_path = primary_path
 		self._fs_mirror_stack = []
 		if self.config.options.distfiles_local is not None:
 			self._fs_mirror_stack.append(self._mirror_info(
@@ -197,7 +307,8 @@ class FetchTask(CompositeTask):
 		for uri in reversed(self.uri_tuple):
 			if uri.startswith('mirror://'):
 				self._mirror_stack.append(
-					self._mirror_iterator(uri, self.config.mirrors))
+					self._mirror_iterator(uri, self.config.mirrors,
+					mirror_stats=self.config.mirror_stats))
 			else:
 				self._primaryuri_stack.append(uri)
 
@@ -205,7 +316,7 @@ class FetchTask(CompositeTask):
 		self._try_next_mirror()
 
 	@staticmethod
-	def _mirror_iterator(uri, mirrors_dict):
+	def _mirror_iterator(uri, mirrors_dict, mirror_stats=None):
 
 		slash_index = uri.find("/", 9)
 		if slash_index != -1:
@@ -214,6 +325,13 @@ class FetchTask(CompositeTask):
 			if not mirrors:
 				return
 			mirrors = list(mirrors)
+			if mirror_stats is not None:
+				# Shuffle first, so that mirrors with equal
+				# predictions share the load.
+				random.shuffle(mirrors)
+				for mirror in mirror_stats.order(mirrors):
+					yield mirror.rstrip("/") + "/" + uri[slash_index+1:]
+				return
 			while mirrors:
 				mirror = mirrors.pop(random.randint(0, len(mirrors) - 1))
 				yield mirror.rstrip("/") + "/" + uri[slash_index+1:]
@@ -266,7 +384,7 @@ class FetchTask(CompositeTask):
 		return None
 
 	def _fetch_fs(self, mirror_info):
-		file_path = os.path.join(mirror_info.location, self.distfile)
+		file_path = distfile_path(mirror_info.location, self.distfile)
 
 		st = None
 		size_ok = False
@@ -331,8 +449,9 @@ class FetchTask(CompositeTask):
 				self.wait()
 				return
 			else:
-				src = os.path.join(current_mirror.location, self.distfile)
-				dest = os.path.join(self.config.options.distfiles, self.distfile)
+				self._verified_digests = digester.digests
+				src = distfile_path(current_mirror.location, self.distfile)
+				dest = self._distfile_path
 				if self._hardlink_atomic(src, dest,
 					"%s to %s" % (current_mirror.name, "distfiles")):
 					logging.debug("hardlink '%s' from %s to distfiles" %
@@ -423,6 +542,9 @@ class FetchTask(CompositeTask):
 		}
 
 		self._fetch_tmp_file = os.path.join(distdir, tmp_basename)
+		self._fetch_uri_current = uri
+		self._fetch_start_time = time.time()
+		self._fetch_duration = None
 
 		try:
 			os.unlink(self._fetch_tmp_file)
@@ -464,7 +586,8 @@ class FetchTask(CompositeTask):
 		if self._was_cancelled():
 			self.wait()
 			return
-		
+
+		self._fetch_duration = time.time() - self._fetch_start_time
 		if os.path.exists(self._fetch_tmp_file):
 			self._start_task(
 				FileDigester(file_path=self._fetch_tmp_file,
@@ -473,8 +596,18 @@ class FetchTask(CompositeTask):
 					logfile=self._log_path),
 					self._fetch_digester_exit)
 		else:
+			self._record_mirror_stats(False)
 			self._try_next_mirror()
 
+	def _record_mirror_stats(self, success):
+		if self.config.mirror_stats is None:
+			return
+		nbytes = None
+		if success:
+			nbytes = self.digests.get("size")
+		self.config.mirror_stats.record(self._fetch_uri_current, success,
+			duration=self._fetch_duration, nbytes=nbytes)
+
 	def _fetch_digester_exit(self, digester):
 
 		self._assert_current(digester)
@@ -496,12 +629,15 @@ class FetchTask(CompositeTask):
 					self.digests[bad_digest], digester.digests[bad_digest])
 				self.scheduler.output(msg + '\n', background=True,
 					log_path=self._log_path)
+				self._record_mirror_stats(False)
 				try:
 					os.unlink(self._fetch_tmp_file)
 				except OSError:
 					pass
 			else:
-				dest = os.path.join(self.config.options.distfiles, self.distfile)
+				self._record_mirror_stats(True)
+				self._verified_digests = digester.digests
+				dest = self._distfile_path
 				try:
 					os.rename(self._fetch_tmp_file, dest)
 				except OSError:
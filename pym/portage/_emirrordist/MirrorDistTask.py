@@ -17,6 +17,7 @@ from portage.util._async.TaskScheduler import TaskScheduler
 from _emerge.CompositeTask import CompositeTask
 from .FetchIterator import FetchIterator
 from .DeletionIterator import DeletionIterator
+from .SqliteDatabase import discard_missing, expired_keys
 
 if sys.hexversion >= 0x3000000:
 	# pylint: disable=W0622
@@ -89,8 +90,10 @@ class MirrorDistTask(CompositeTask):
 		recycle_db = self._config.recycle_db
 		r_deletion_delay = self._config.options.recycle_deletion_delay
 
-		# Use a dict optimize access.
-		recycle_db_cache = dict(recycle_db.items())
+		expired = frozenset(expired_keys(recycle_db,
+			start_time - r_deletion_delay,
+			timestamp=lambda value: value[1]))
+		existing = set()
 
 		for filename in os.listdir(recycle_dir):
 
@@ -104,16 +107,17 @@ class MirrorDistTask(CompositeTask):
 						"recycle: %s") % (filename, e))
 				continue
 
-			value = recycle_db_cache.pop(filename, None)
+			existing.add(filename)
+			value = recycle_db.get(filename)
 			if value is None:
 				logging.debug(("add '%s' to "
 					"recycle db") % filename)
 				recycle_db[filename] = (st.st_size, start_time)
 			else:
-				r_size, r_time = value
+				r_size = value[0]
 				if long(r_size) != st.st_size:
 					recycle_db[filename] = (st.st_size, start_time)
-				elif r_time + r_deletion_delay < start_time:
+				elif filename in expired:
 					if self._config.options.dry_run:
 						logging.info(("dry-run: delete '%s' from "
 							"recycle") % filename)
@@ -137,17 +141,9 @@ class MirrorDistTask(CompositeTask):
 								logging.debug(("drop '%s' from "
 									"recycle db") % filename)
 
-		# Existing files were popped from recycle_db_cache,
-		# so any remaining entries are for files that no
-		# longer exist.
-		for filename in recycle_db_cache:
-			try:
-				del recycle_db[filename]
-			except KeyError:
-				pass
-			else:
-				logging.debug(("drop non-existent '%s' from "
-					"recycle db") % filename)
+		for filename in discard_missing(recycle_db, existing):
+			logging.debug(("drop non-existent '%s' from "
+				"recycle db") % filename)
 
 	def _scheduled_deletion_log(self):
 
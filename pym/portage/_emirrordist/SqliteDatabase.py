@@ -0,0 +1,229 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import _encodings, _unicode_encode
+
+_sqlite_header = b"SQLite format 3\0"
+
+def is_sqlite_database(filename):
+	"""
+	Return False if filename exists and is not an SQLite database, such
+	as a database that has been created by the shelve backend, and True
+	otherwise. A missing or empty file is initialized by SQLite, which
+	also reports any error that prevents the file from being read.
+	"""
+	try:
+		with open(_unicode_encode(filename,
+			encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+			header = f.read(len(_sqlite_header))
+	except EnvironmentError:
+		return True
+	return not header or header == _sqlite_header
+
+class SqliteDatabase(object):
+	"""
+	A mapping of distfile names to values, stored in an SQLite table with
+	one column per value field. It can be used in place of the shelve
+	databases of emirrordist. Time stamps and owners are stored in
+	indexed columns, so that expired entries can be found with a range
+	scan. Modifications are committed in batches of commit_interval, and
+	when the database is closed.
+
+	Each kind of database has its own value layout:
+
+		distfiles: cpv
+		deletion: timestamp
+		recycle: (size, timestamp)
+		digest: opaque string
+	"""
+
+	_schemas = {
+		"distfiles": (("cpv", "TEXT"),),
+		"deletion": (("timestamp", "REAL"),),
+		"recycle": (("size", "INTEGER"), ("timestamp", "REAL")),
+		"digest": (("value", "TEXT"),),
+	}
+
+	_indexed_columns = {
+		"distfiles": "cpv",
+		"deletion": "timestamp",
+		"recycle": "timestamp",
+	}
+
+	commit_interval = 1000
+
+	def __init__(self, filename, kind, readonly=False):
+		import sqlite3
+		if not is_sqlite_database(filename):
+			raise sqlite3.DatabaseError("'%s' is not an SQLite database "
+				"(existing shelve databases are not converted)" % filename)
+		self._kind = kind
+		self._columns = [column for column, type_ in self._schemas[kind]]
+		self._table = kind
+		self._pending = 0
+		self._connection = sqlite3.connect(filename, timeout=60)
+		if not readonly:
+			self._init_structures()
+
+	def _init_structures(self):
+		columns = ", ".join("%s %s NOT NULL" % column
+			for column in self._schemas[self._kind])
+		cursor = self._connection.cursor()
+		cursor.execute("CREATE TABLE IF NOT EXISTS %s "
+			"(filename TEXT PRIMARY KEY NOT NULL, %s)" %
+			(self._table, columns))
+		indexed = self._indexed_columns.get(self._kind)
+		if indexed is not None:
+			cursor.execute("CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)" %
+				(self._table, indexed, self._table, indexed))
+		self._connection.commit()
+
+	def _decode(self, row):
+		if len(row) == 1:
+			return row[0]
+		return tuple(row)
+
+	def _encode(self, value):
+		if len(self._columns) == 1:
+			return (value,)
+		value = tuple(value)
+		if len(value) != len(self._columns):
+			raise ValueError(value)
+		return value
+
+	def _modified(self):
+		self._pending += 1
+		if self._pending >= self.commit_interval:
+			self.commit()
+
+	def commit(self):
+		self._connection.commit()
+		self._pending = 0
+
+	def close(self):
+		self.commit()
+		self._connection.close()
+
+	def __getitem__(self, filename):
+		row = self._connection.execute(
+			"SELECT %s FROM %s WHERE filename = ?" %
+			(", ".join(self._columns), self._table),
+			(filename,)).fetchone()
+		if row is None:
+			raise KeyError(filename)
+		return self._decode(row)
+
+	def get(self, filename, default=None):
+		try:
+			return self[filename]
+		except KeyError:
+			return default
+
+	def __contains__(self, filename):
+		return self._connection.execute(
+			"SELECT 1 FROM %s WHERE filename = ?" % self._table,
+			(filename,)).fetchone() is not None
+
+	def __setitem__(self, filename, value):
+		self._connection.execute(
+			"INSERT OR REPLACE INTO %s (filename, %s) VALUES (?, %s)" %
+			(self._table, ", ".join(self._columns),
+			", ".join("?" * len(self._columns))),
+			(filename,) + self._encode(value))
+		self._modified()
+
+	def __delitem__(self, filename):
+		cursor = self._connection.execute(
+			"DELETE FROM %s WHERE filename = ?" % self._table,
+			(filename,))
+		if cursor.rowcount < 1:
+			raise KeyError(filename)
+		self._modified()
+
+	def __iter__(self):
+		for row in self._connection.execute(
+			"SELECT filename FROM %s" % self._table).fetchall():
+			yield row[0]
+
+	def keys(self):
+		return list(self)
+
+	def items(self):
+		for row in self._connection.execute(
+			"SELECT filename, %s FROM %s" %
+			(", ".join(self._columns), self._table)).fetchall():
+			yield row[0], self._decode(row[1:])
+
+	def __len__(self):
+		return self._connection.execute(
+			"SELECT COUNT(*) FROM %s" % self._table).fetchone()[0]
+
+	def expired(self, before, inclusive=False):
+		"""
+		Return the names of entries with a timestamp older than
+		before (or equal to it, if inclusive is True), ordered by
+		timestamp.
+		"""
+		return [row[0] for row in self._connection.execute(
+			"SELECT filename FROM %s WHERE timestamp %s ? "
+			"ORDER BY timestamp" %
+			(self._table, "<=" if inclusive else "<"),
+			(before,)).fetchall()]
+
+	def discard_missing(self, existing):
+		"""
+		Remove the entries for files which are not in existing, and
+		return their names.
+		"""
+		cursor = self._connection.cursor()
+		cursor.execute("CREATE TEMP TABLE IF NOT EXISTS existing "
+			"(filename TEXT PRIMARY KEY NOT NULL)")
+		cursor.execute("DELETE FROM existing")
+		cursor.executemany("INSERT OR IGNORE INTO existing VALUES (?)",
+			((filename,) for filename in existing))
+		missing = [row[0] for row in cursor.execute(
+			"SELECT filename FROM %s WHERE filename NOT IN "
+			"(SELECT filename FROM existing)" % self._table).fetchall()]
+		cursor.execute("DELETE FROM %s WHERE filename NOT IN "
+			"(SELECT filename FROM existing)" % self._table)
+		cursor.execute("DELETE FROM existing")
+		self.commit()
+		return missing
+
+
+def expired_keys(db, before, inclusive=False, timestamp=None):
+	"""
+	Return the names of entries of db with a timestamp older than
+	before. This uses an indexed range scan for SqliteDatabase, and
+	iterates over all entries of other mappings, in which case the
+	timestamp function extracts the timestamp from a value.
+	"""
+	expired = getattr(db, "expired", None)
+	if expired is not None:
+		return expired(before, inclusive=inclusive)
+	result = []
+	for filename, value in db.items():
+		if timestamp is not None:
+			value = timestamp(value)
+		if value < before or (inclusive and value == before):
+			result.append(filename)
+	return result
+
+def discard_missing(db, existing):
+	"""
+	Remove the entries of db for files which are not in the set
+	existing, and return their names.
+	"""
+	discard = getattr(db, "discard_missing", None)
+	if discard is not None:
+		return discard(existing)
+	missing = []
+	for filename in list(db):
+		if filename not in existing:
+			try:
+				del db[filename]
+			except KeyError:
+				pass
+			else:
+				missing.append(filename)
+	return missing
@@ -1,4 +1,4 @@
-# Copyright 2013-2015 Gentoo Foundation
+# Copyright 2013-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import argparse
@@ -13,6 +13,7 @@ from portage.util._async.SchedulerInterface import SchedulerInterface
 from portage.util._eventloop.global_event_loop import global_event_loop
 from .Config import Config
 from .MirrorDistTask import MirrorDistTask
+from .SqliteDatabase import is_sqlite_database
 
 if sys.hexversion >= 0x3000000:
 	# pylint: disable=W0622
@@ -45,6 +46,12 @@ common_options = (
 		"help"     : "distfiles directory to use (required)",
 		"metavar"  : "DIR"
 	},
+	{
+		"longopt"  : "--migrate-layout",
+		"help"     : "move distfiles which are not stored under the "
+			"primary layout of the distfiles directory to that layout",
+		"action"   : "store_true"
+	},
 	{
 		"longopt"  : "--jobs",
 		"shortopt" : "-j",
@@ -58,6 +65,14 @@ common_options = (
 		"metavar"  : "LOAD",
 		"type"     : float
 	},
+	{
+		"longopt"  : "--fetch-list-jobs",
+		"help"     : "number of worker processes which compute the "
+			"fetch lists of categories (default is 1)",
+		"default"  : 1,
+		"metavar"  : "JOBS",
+		"type"     : int
+	},
 	{
 		"longopt"  : "--tries",
 		"help"     : "maximum number of tries per file, 0 means unlimited (default is 10)",
@@ -112,6 +127,13 @@ common_options = (
 			"scheduled for delayed deletion",
 		"metavar"  : "FILE"
 	},
+	{
+		"longopt"  : "--db-backend",
+		"help"     : "storage backend of the database files "
+			"(defaults to shelve)",
+		"choices"  : ("shelve", "sqlite"),
+		"default"  : "shelve"
+	},
 	{
 		"longopt"  : "--deletion-delay",
 		"help"     : "delay time for deletion, measured in seconds",
@@ -132,6 +154,12 @@ common_options = (
 		"help"     : "comma delimited list of mirror targets to skip "
 			"when fetching"
 	},
+	{
+		"longopt"  : "--mirror-stats",
+		"help"     : "file used to track the reliability and speed of "
+			"mirrors, in order to try the fastest mirrors first",
+		"metavar"  : "FILE"
+	},
 	{
 		"longopt"  : "--restrict-mirror-exemptions",
 		"help"     : "comma delimited list of mirror targets for which to "
@@ -143,6 +171,22 @@ common_options = (
 			"distfiles are valid",
 		"action"   : "store_true"
 	},
+	{
+		"longopt"  : "--digest-db",
+		"help"     : "database file used to cache the digests of "
+			"distfiles, so that --verify-existing-digest only "
+			"digests files which have changed",
+		"metavar"  : "FILE"
+	},
+	{
+		"longopt"  : "--digest-db-reverify",
+		"help"     : "percentage of distfiles for which --digest-db "
+			"is bypassed on each run, in order to detect "
+			"corruption (defaults to 5)",
+		"default"  : 5,
+		"metavar"  : "PERCENT",
+		"type"     : int
+	},
 	{
 		"longopt"  : "--distfiles-local",
 		"help"     : "distfiles-local directory to use",
@@ -272,6 +316,9 @@ def emirrordist_main(args):
 	if options.load_average is not None:
 		options.load_average = float(options.load_average)
 
+	if options.fetch_list_jobs < 1:
+		parser.error("--fetch-list-jobs must be a positive integer")
+
 	if options.failure_log is not None:
 		options.failure_log = normalize_path(
 			os.path.abspath(options.failure_log))
@@ -346,6 +393,16 @@ def emirrordist_main(args):
 				"--mirror-overrides-file '%s' is not a readable file" %
 				options.mirror_overrides)
 
+	if options.mirror_stats is not None:
+		options.mirror_stats = normalize_path(
+			os.path.abspath(options.mirror_stats))
+
+		parent_dir = os.path.dirname(options.mirror_stats)
+		if not (os.path.isdir(parent_dir) and
+			os.access(parent_dir, os.W_OK|os.X_OK)):
+			parser.error(("--mirror-stats '%s' parent is not a "
+				"writable directory") % options.mirror_stats)
+
 	if options.distfiles_local is not None:
 		options.distfiles_local = normalize_path(
 			os.path.abspath(options.distfiles_local))
@@ -359,6 +416,14 @@ def emirrordist_main(args):
 		options.distfiles_db = normalize_path(
 			os.path.abspath(options.distfiles_db))
 
+	if options.digest_db is not None:
+		options.digest_db = normalize_path(
+			os.path.abspath(options.digest_db))
+
+	if not 0 <= options.digest_db_reverify <= 100:
+		parser.error("--digest-db-reverify must be "
+			"between 0 and 100")
+
 	if options.tries is not None:
 		options.tries = int(options.tries)
 
@@ -390,6 +455,15 @@ def emirrordist_main(args):
 			parser.error(("--fetch-log-dir '%s' is not a "
 				"writable directory") % options.fetch_log_dir)
 
+	if options.db_backend == "sqlite":
+		for db_option in ("deletion_db", "digest_db", "distfiles_db",
+			"recycle_db"):
+			db_file = getattr(options, db_option)
+			if db_file is not None and not is_sqlite_database(db_file):
+				parser.error(("--%s '%s' is not an SQLite database, "
+					"use --db-backend=shelve for existing shelve databases") %
+					(db_option.replace("_", "-"), db_file))
+
 	if options.whitelist_from:
 		normalized_paths = []
 		for x in options.whitelist_from:
@@ -0,0 +1,197 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import errno
+import io
+
+from portage import os
+from portage import _encodings, _unicode_encode
+from portage.cache import volatile
+from portage.cache.cache_errors import CacheError
+from portage.exception import PortageException
+from portage.util import atomic_ofstream, ensure_dirs, writemsg
+
+
+class EclassIndex(object):
+	"""
+	A persistent reverse index which maps eclass names to the cpvs whose
+	metadata cache entries inherit them, so that the packages affected
+	by an eclass change can be found without reading every cache entry.
+
+	Indexes are only kept for the metadata caches that portdbapi writes
+	in depcachedir, and they are stored in depcachedir as well, so that
+	they are never written to a repository. Code that modifies cache
+	entries must either update the index or remove it, since a stale
+	index would cause targeted updates to miss packages. Cache entries
+	are still validated against eclass digests when they are used, so it
+	can never cause stale metadata to be used.
+	"""
+
+	_format_version = "2"
+	_dir_name = "eclass_index"
+
+	def __init__(self, filename, location=""):
+		self.filename = filename
+		self.location = location
+		self._eclasses = {}
+		self._consumers = {}
+		self._loaded = False
+		self._modified = False
+
+	@classmethod
+	def for_repo(cls, portdb, repo_path):
+		"""
+		Return an index instance for the writable metadata cache that
+		portdb uses for the given repository, or None if it has none.
+		The index is stored in depcachedir, and named after the
+		repository.
+		"""
+		cache = portdb.auxdb.get(repo_path)
+		if cache is None or cache.readonly or \
+			isinstance(cache, volatile.database):
+			return None
+		location = getattr(cache, "location", None)
+		repo_name = portdb.getRepositoryName(repo_path)
+		if location is None or repo_name is None:
+			return None
+		return cls(os.path.join(portdb.depcachedir, cls._dir_name,
+			repo_name), location=location)
+
+	def exists(self):
+		return os.path.exists(self.filename)
+
+	def remove(self):
+		"""
+		Remove the index from disk, so that it is not trusted after
+		cache entries have been modified without updating it.
+		"""
+		try:
+			os.unlink(self.filename)
+		except OSError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				writemsg("!!! Failed to remove eclass index: %s: %s\n" %
+					(self.filename, e), noiselevel=-1)
+
+	def load(self):
+		"""
+		Load the index from disk. Returns False if the index does not
+		exist or is invalid, in which case the index is left empty.
+		"""
+		self._loaded = True
+		self._eclasses.clear()
+		self._consumers.clear()
+		self._modified = False
+		try:
+			with io.open(_unicode_encode(self.filename,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace') as f:
+				lines = iter(f)
+				header = next(lines, "").split()
+				if header != ["eclass_index", self._format_version]:
+					return False
+				# The index is named after the repository, so check
+				# that it describes the same cache.
+				if next(lines, "").rstrip("\n") != self.location:
+					return False
+				for line in lines:
+					parts = line.split()
+					if parts:
+						self._set(parts[0], parts[1:])
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				writemsg("!!! Failed to read eclass index: %s: %s\n" %
+					(self.filename, e), noiselevel=-1)
+			return False
+		return True
+
+	def populate(self, cache):
+		"""
+		Rebuild the index from the _eclasses_ of all entries of the
+		given metadata cache.
+		"""
+		self._loaded = True
+		self._eclasses.clear()
+		self._consumers.clear()
+		self._modified = True
+		try:
+			cpvs = list(cache)
+		except CacheError:
+			return
+		for cpv in cpvs:
+			try:
+				entry = cache[cpv]
+			except (KeyError, CacheError):
+				continue
+			self._set(cpv, entry.get("_eclasses_", ()))
+
+	def load_or_populate(self, cache):
+		if not self.load():
+			self.populate(cache)
+
+	def _set(self, cpv, eclasses):
+		eclasses = frozenset(eclasses)
+		old = self._eclasses.get(cpv)
+		if old == eclasses:
+			return False
+		if old is not None:
+			for eclass in old.difference(eclasses):
+				consumers = self._consumers[eclass]
+				consumers.discard(cpv)
+				if not consumers:
+					del self._consumers[eclass]
+		for eclass in eclasses:
+			self._consumers.setdefault(eclass, set()).add(cpv)
+		self._eclasses[cpv] = eclasses
+		return True
+
+	def update(self, cpv, eclasses):
+		"""Record the eclasses inherited by a cache entry."""
+		if self._set(cpv, eclasses):
+			self._modified = True
+
+	def discard(self, cpv):
+		"""Forget a cache entry which has been removed."""
+		if cpv in self._eclasses:
+			self._set(cpv, ())
+			del self._eclasses[cpv]
+			self._modified = True
+
+	def consumers(self, eclass):
+		"""Return the cpvs that inherit the given eclass."""
+		return frozenset(self._consumers.get(eclass, ()))
+
+	def eclasses(self, cpv):
+		"""Return the eclasses inherited by the given cpv."""
+		return self._eclasses.get(cpv, frozenset())
+
+	def __contains__(self, cpv):
+		return cpv in self._eclasses
+
+	def __iter__(self):
+		return iter(self._eclasses)
+
+	def __len__(self):
+		return len(self._eclasses)
+
+	def save(self):
+		"""Write the index to disk, if it has been modified."""
+		if not (self._loaded and self._modified):
+			return
+		try:
+			ensure_dirs(os.path.dirname(self.filename))
+			f = atomic_ofstream(self.filename,
+				encoding=_encodings['repo.content'])
+		except (EnvironmentError, PortageException) as e:
+			writemsg("!!! Failed to write eclass index: %s: %s\n" %
+				(self.filename, e), noiselevel=-1)
+			return
+		f.write("eclass_index %s\n" % self._format_version)
+		f.write("%s\n" % self.location)
+		for cpv in sorted(self._eclasses):
+			f.write("%s\n" % " ".join(
+				[cpv] + sorted(self._eclasses[cpv])))
+		f.close()
+		self._modified = False
@@ -0,0 +1,53 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+from portage.versions import catsplit
+
+def pkg_trigrams(pn):
+	"""
+	Return the set of trigrams of a lower-cased package name, which is
+	padded with ^^ and $$, so that names which start or end with the
+	same character share a trigram, even if they are short.
+	"""
+	name = "^^%s$$" % pn.lower()
+	return set(name[i:i+3] for i in range(len(name) - 2))
+
+def pkg_trigram_index_lines(cps):
+	"""
+	Generate the lines of a trigram index for the given package names,
+	in sorted order. Each line lists a trigram, followed by the names of
+	the packages that contain it.
+	"""
+	index = {}
+	for cp in cps:
+		for trigram in pkg_trigrams(catsplit(cp)[1]):
+			index.setdefault(trigram, []).append(cp)
+
+	for trigram in sorted(index):
+		yield "%s %s\n" % (trigram, " ".join(sorted(index[trigram])))
+
+def pkg_trigram_index_search(lines, pn):
+	"""
+	Return the set of package names from the lines of a trigram index
+	that share at least one trigram with pn. Only the lines for the
+	trigrams of pn are split.
+	"""
+	trigrams = pkg_trigrams(pn)
+	cps = set()
+	for line in lines:
+		if line[:3] in trigrams and line[3:4] == " ":
+			cps.update(line[4:].split())
+	return cps
+
+def similar_cps(db, pn):
+	"""
+	Return the set of package names of db that may be similar to the
+	package name pn, which excludes names that do not share a trigram
+	with pn. Return None if db does not have a trigram index.
+	"""
+	cp_similar = getattr(db, "cp_similar", None)
+	if cp_similar is None:
+		return None
+	return cp_similar(pn)
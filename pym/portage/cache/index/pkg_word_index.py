@@ -0,0 +1,65 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import re
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+def pkg_words(text):
+	"""
+	Return the set of lower-cased words in text.
+	"""
+	return set(word.lower() for word in _word_re.findall(text))
+
+def pkg_word_index_lines(descs):
+	"""
+	Generate the lines of a word index for the given (cp, description)
+	pairs, in sorted order. Each line lists a word, followed by the
+	names of the packages that have it in their description.
+	"""
+	index = {}
+	for cp, desc in descs:
+		for word in pkg_words(desc):
+			index.setdefault(word, []).append(cp)
+
+	for word in sorted(index):
+		yield "%s %s\n" % (word, " ".join(sorted(index[word])))
+
+def pkg_word_index_search(lines, key):
+	"""
+	Return the set of package names from the lines of a word index that
+	may have a description which contains key, ignoring case. Since key
+	may start or end within a word, each word of key matches every
+	indexed word that contains it, and the results for the words of
+	key are intersected. Return None if key does not contain any words.
+	"""
+	key_words = pkg_words(key)
+	if not key_words:
+		return None
+
+	postings = dict((word, set()) for word in key_words)
+	for line in lines:
+		word, sep, cps = line.partition(" ")
+		matched = [x for x in key_words if x in word]
+		if matched:
+			cps = cps.split()
+			for x in matched:
+				postings[x].update(cps)
+
+	postings = sorted(postings.values(), key=len)
+	result = postings[0]
+	for cps in postings[1:]:
+		result.intersection_update(cps)
+	return result
+
+def desc_match_cps(db, key):
+	"""
+	Return the set of package names of db that may have a description
+	which contains key, or None if db does not have a word index.
+	"""
+	cp_desc_match = getattr(db, "cp_desc_match", None)
+	if cp_desc_match is None:
+		return None
+	return cp_desc_match(key)
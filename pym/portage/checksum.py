@@ -566,6 +566,40 @@ def perform_multiple_checksums(filename, hashes=["MD5"], calc_prelink=0):
 	return rVal
 
 
+class _checksum_stream(object):
+	"""
+	Compute a group of checksums of data that is passed to update in
+	chunks, for instance while it is being written to a file, so that
+	the file does not have to be read again.
+	"""
+
+	__slots__ = ("_checksums", "size")
+
+	def __init__(self, hashes):
+		self._checksums = {}
+		for x in hashes:
+			if x not in hashfunc_keys or x == "size":
+				raise portage.exception.DigestException(x+" hash function not available (needs dev-python/pycrypto or >=dev-lang/python-2.5)")
+			self._checksums[x] = hashfunc_map[x]._hashobject()
+		self.size = 0
+
+	def update(self, data):
+		for checksum in self._checksums.values():
+			checksum.update(data)
+		self.size += len(data)
+
+	def digests(self):
+		"""
+		@rtype: dict
+		@return: A dictionary in the same form as returned by
+			perform_multiple_checksums, with an additional "size" key
+		"""
+		digests = dict((x, checksum.hexdigest())
+			for x, checksum in self._checksums.items())
+		digests["size"] = self.size
+		return digests
+
+
 def checksum_str(data, hashname="MD5"):
 	"""
 	Run a specific checksum against a byte string.
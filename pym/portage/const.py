@@ -120,7 +120,9 @@ EBUILD_PHASES            = (
 	"other",
 )
 SUPPORTED_FEATURES       = frozenset([
+	"adaptive-mirrors",
 	"assume-digests",
+	"binpkg-index-journal",
 	"binpkg-logs",
 	"binpkg-multi-instance",
 	"buildpkg",
@@ -175,6 +177,7 @@ SUPPORTED_FEATURES       = frozenset([
 	"protect-owned",
 	"python-trace",
 	"sandbox",
+	"segmented-fetch",
 	"selinux",
 	"sesandbox",
 	"sfperms",
@@ -1,4 +1,4 @@
-# Copyright 2014 Gentoo Foundation
+# Copyright 2014-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -14,6 +14,8 @@ from portage.exception import FileNotFound
 from portage.cache.index.IndexStreamIterator import IndexStreamIterator
 from portage.cache.index.pkg_desc_index import \
 	pkg_desc_index_line_read, pkg_desc_index_node
+from portage.cache.index.pkg_trigram_index import pkg_trigram_index_search
+from portage.cache.index.pkg_word_index import pkg_word_index_search
 from portage.util.iterators.MultiIterGroupBy import MultiIterGroupBy
 from portage.versions import _pkg_str
 
@@ -47,6 +49,27 @@ class IndexedPortdb(object):
 		self._cp_map = None
 		self._unindexed_cp_map = None
 
+	def _open_index(self, repo_path, basename):
+		"""
+		Open an index file that egencache has generated for a repository,
+		either inside of the repository, or in the depcachedir if the
+		repository is not writable.
+
+		@raise FileNotFound: if the index does not exist
+		"""
+		outside_repo = os.path.join(self._portdb.depcachedir,
+			repo_path.lstrip(os.sep))
+		for parent_dir in (repo_path, outside_repo):
+			filename = os.path.join(parent_dir, "metadata", basename)
+			try:
+				return io.open(filename,
+					encoding=_encodings["repo.content"])
+			except IOError as e:
+				if e.errno not in (errno.ENOENT, errno.ESTALE):
+					raise
+
+		raise FileNotFound(filename)
+
 	def _init_index(self):
 
 		cp_map = {}
@@ -57,30 +80,10 @@ class IndexedPortdb(object):
 
 		streams = []
 		for repo_path in self._portdb.porttrees:
-			outside_repo = os.path.join(self._portdb.depcachedir,
-				repo_path.lstrip(os.sep))
-			filenames = []
-			for parent_dir in (repo_path, outside_repo):
-				filenames.append(os.path.join(parent_dir,
-					"metadata", "pkg_desc_index"))
-
 			repo_name = self._portdb.getRepositoryName(repo_path)
 
 			try:
-				f = None
-				for filename in filenames:
-					try:
-						f = io.open(filename,
-							encoding=_encodings["repo.content"])
-					except IOError as e:
-						if e.errno not in (errno.ENOENT, errno.ESTALE):
-							raise
-					else:
-						break
-
-				if f is None:
-					raise FileNotFound(filename)
-
+				f = self._open_index(repo_path, "pkg_desc_index")
 				streams.append(iter(IndexStreamIterator(f,
 					functools.partial(pkg_desc_index_line_read,
 					repo = repo_name))))
@@ -136,6 +139,54 @@ class IndexedPortdb(object):
 			return self._init_index()
 		return iter(sorted(self._cp_map)) if sort else iter(self._cp_map)
 
+	def _search_index(self, basename, search, key):
+		"""
+		Returns the union of search(f, key) for the index file with the
+		given basename of each repository, and all package names of
+		repositories that do not have the index. Returns None if no
+		repository has the index, or if search returns None.
+		"""
+		cps = set()
+		index_missing = []
+		for repo_path in self._portdb.porttrees:
+			try:
+				f = self._open_index(repo_path, basename)
+			except FileNotFound:
+				index_missing.append(repo_path)
+				continue
+			with f:
+				result = search(f, key)
+			if result is None:
+				return None
+			cps.update(result)
+
+		if len(index_missing) == len(self._portdb.porttrees):
+			return None
+		if index_missing:
+			cps.update(self._portdb.cp_all(trees=index_missing))
+		return cps
+
+	def cp_similar(self, pn):
+		"""
+		Returns the set of package names that share a trigram with the
+		package name pn, using the trigram index of each repository,
+		and all package names of repositories that have no trigram
+		index. Returns None if no repository has a trigram index.
+		"""
+		return self._search_index("pkg_trigram_index",
+			pkg_trigram_index_search, pn)
+
+	def cp_desc_match(self, key):
+		"""
+		Returns the set of package names that may have a DESCRIPTION
+		which contains key, using the word index of each repository,
+		and all package names of repositories that have no word index.
+		Returns None if no repository has a word index, or if key
+		does not contain any words.
+		"""
+		return self._search_index("pkg_word_index",
+			pkg_word_index_search, key)
+
 	def match(self, atom):
 		"""
 		For performance reasons, only package name and version
@@ -1,8 +1,9 @@
-# Copyright 2011-2012 Gentoo Foundation
+# Copyright 2011-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import difflib
 
+from portage.cache.index.pkg_trigram_index import similar_cps
 from portage.versions import catsplit
 
 def similar_name_search(dbs, atom):
@@ -12,9 +13,13 @@ def similar_name_search(dbs, atom):
 	if cat == "null":
 		cat = None
 
+	# Names that do not share a trigram with the package name are
+	# excluded by databases that have a trigram index, since
+	# the difflib comparisons are expensive for all names.
 	all_cp = set()
 	for db in dbs:
-		all_cp.update(db.cp_all())
+		cps = similar_cps(db, catsplit(atom.cp)[1])
+		all_cp.update(db.cp_all() if cps is None else cps)
 
 	# discard dir containing no ebuilds
 	all_cp.discard(atom.cp)
@@ -18,6 +18,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.util:atomic_ofstream,ensure_dirs,normalize_path,' + \
 		'writemsg,writemsg_stdout',
 	'portage.util.path:first_existing',
+	'portage.util._thread_pool:thread_map',
 	'portage.util._urlopen:urlopen@_urlopen,have_pep_476@_have_pep_476',
 	'portage.versions:best,catpkgsplit,catsplit,_pkg_str',
 )
@@ -309,6 +310,15 @@ class binarytree(object):
 			self._pkgindex_version = 0
 			self._pkgindex_hashes = ["MD5","SHA1"]
 			self._pkgindex_file = os.path.join(self.pkgdir, "Packages")
+			self._pkgindex_journal_file = self._pkgindex_file + ".journal"
+			# Number of journaled entries which triggers compaction.
+			self._pkgindex_journal_max = 100
+			# Age in seconds of the Packages file beyond which it is
+			# rewritten instead of journaled, so that binhost clients,
+			# which only read Packages, do not fall behind for long.
+			self._pkgindex_journal_max_age = 300
+			self._pkgindex_journal_required_keys = \
+				frozenset(["CPV", "MD5", "SIZE", "_mtime_"])
 			self._pkgindex_keys = self.dbapi._aux_cache_keys.copy()
 			self._pkgindex_keys.update(["CPV", "SIZE"])
 			self._pkgindex_aux_keys = \
@@ -598,7 +608,7 @@ class binarytree(object):
 				basename = os.path.basename(path)
 				basename_index.setdefault(basename, []).append(d)
 
-			update_pkgindex = False
+			candidates = []
 			for mydir, file_names in dir_files.items():
 				try:
 					mydir = _unicode_decode(mydir,
@@ -614,187 +624,201 @@ class binarytree(object):
 					if not myfile.endswith(SUPPORTED_XPAK_EXTENSIONS):
 						continue
 					mypath = os.path.join(mydir, myfile)
-					full_path = os.path.join(self.pkgdir, mypath)
+					candidates.append((mydir, myfile, mypath,
+						os.path.join(self.pkgdir, mypath)))
+
+			# Stat the files, and read the xpak segments of those that
+			# the package index does not describe, from a number of
+			# threads, since the latency of these operations dominates
+			# on network filesystems. The results are only a cache for
+			# the loop below, which repeats any call that failed here
+			# so that errors are handled exactly like before.
+			scan_jobs = self._scan_jobs()
+			metadata_keys = tuple(chain(self.dbapi._aux_cache_keys,
+				("PF", "CATEGORY")))
+			stats = thread_map(os.lstat,
+				[candidate[3] for candidate in candidates], scan_jobs)
+			unindexed = []
+			for mydir, myfile, mypath, full_path in candidates:
+				s = stats.get(full_path)
+				if s is not None and stat.S_ISREG(s.st_mode) and \
+					self._pkgindex_match(basename_index.get(myfile),
+					s, minimum_keys) is None:
+					unindexed.append(full_path)
+			prefetched = thread_map(
+				lambda path: self._read_metadata(path, stats[path],
+				keys=metadata_keys), unindexed, scan_jobs)
+
+			update_pkgindex = False
+			for mydir, myfile, mypath, full_path in candidates:
+				s = stats.get(full_path)
+				if s is None:
 					s = os.lstat(full_path)
 
-					if not stat.S_ISREG(s.st_mode):
-						continue
+				if not stat.S_ISREG(s.st_mode):
+					continue
 
-					# Validate data from the package index and try to avoid
-					# reading the xpak if possible.
-					possibilities = basename_index.get(myfile)
-					if possibilities:
-						match = None
-						for d in possibilities:
-							try:
-								if long(d["_mtime_"]) != s[stat.ST_MTIME]:
-									continue
-							except (KeyError, ValueError):
-								continue
-							try:
-								if long(d["SIZE"]) != long(s.st_size):
-									continue
-							except (KeyError, ValueError):
-								continue
-							if not minimum_keys.difference(d):
-								match = d
-								break
-						if match:
-							mycpv = match["CPV"]
-							instance_key = _instance_key(mycpv)
-							pkg_paths[instance_key] = mypath
-							# update the path if the package has been moved
-							oldpath = d.get("PATH")
-							if oldpath and oldpath != mypath:
-								update_pkgindex = True
-							# Omit PATH if it is the default path for
-							# the current Packages format version.
-							if mypath != mycpv + ".tbz2":
-								d["PATH"] = mypath
-								if not oldpath:
-									update_pkgindex = True
-							else:
-								d.pop("PATH", None)
-								if oldpath:
-									update_pkgindex = True
-							self.dbapi.cpv_inject(mycpv)
-							continue
-					if not os.access(full_path, os.R_OK):
-						writemsg(_("!!! Permission denied to read " \
-							"binary package: '%s'\n") % full_path,
-							noiselevel=-1)
-						self.invalids.append(myfile[:-5])
-						continue
+				# Validate data from the package index and try to avoid
+				# reading the xpak if possible.
+				match = self._pkgindex_match(basename_index.get(myfile),
+					s, minimum_keys)
+				if match:
+					mycpv = match["CPV"]
+					instance_key = _instance_key(mycpv)
+					pkg_paths[instance_key] = mypath
+					# update the path if the package has been moved
+					oldpath = match.get("PATH")
+					if oldpath and oldpath != mypath:
+						update_pkgindex = True
+					# Omit PATH if it is the default path for
+					# the current Packages format version.
+					if mypath != mycpv + ".tbz2":
+						match["PATH"] = mypath
+						if not oldpath:
+							update_pkgindex = True
+					else:
+						match.pop("PATH", None)
+						if oldpath:
+							update_pkgindex = True
+					self.dbapi.cpv_inject(mycpv)
+					continue
+				if not os.access(full_path, os.R_OK):
+					writemsg(_("!!! Permission denied to read " \
+						"binary package: '%s'\n") % full_path,
+						noiselevel=-1)
+					self.invalids.append(myfile[:-5])
+					continue
+				pkg_metadata = prefetched.pop(full_path, None)
+				if pkg_metadata is None:
 					pkg_metadata = self._read_metadata(full_path, s,
-						keys=chain(self.dbapi._aux_cache_keys,
-						("PF", "CATEGORY")))
-					mycat = pkg_metadata.get("CATEGORY", "")
-					mypf = pkg_metadata.get("PF", "")
-					slot = pkg_metadata.get("SLOT", "")
-					mypkg = myfile[:-5]
-					if not mycat or not mypf or not slot:
-						#old-style or corrupt package
-						writemsg(_("\n!!! Invalid binary package: '%s'\n") % full_path,
-							noiselevel=-1)
-						missing_keys = []
-						if not mycat:
-							missing_keys.append("CATEGORY")
-						if not mypf:
-							missing_keys.append("PF")
-						if not slot:
-							missing_keys.append("SLOT")
-						msg = []
-						if missing_keys:
-							missing_keys.sort()
-							msg.append(_("Missing metadata key(s): %s.") % \
-								", ".join(missing_keys))
-						msg.append(_(" This binary package is not " \
-							"recoverable and should be deleted."))
-						for line in textwrap.wrap("".join(msg), 72):
-							writemsg("!!! %s\n" % line, noiselevel=-1)
-						self.invalids.append(mypkg)
-						continue
+						keys=metadata_keys)
+				mycat = pkg_metadata.get("CATEGORY", "")
+				mypf = pkg_metadata.get("PF", "")
+				slot = pkg_metadata.get("SLOT", "")
+				mypkg = myfile[:-5]
+				if not mycat or not mypf or not slot:
+					#old-style or corrupt package
+					writemsg(_("\n!!! Invalid binary package: '%s'\n") % full_path,
+						noiselevel=-1)
+					missing_keys = []
+					if not mycat:
+						missing_keys.append("CATEGORY")
+					if not mypf:
+						missing_keys.append("PF")
+					if not slot:
+						missing_keys.append("SLOT")
+					msg = []
+					if missing_keys:
+						missing_keys.sort()
+						msg.append(_("Missing metadata key(s): %s.") % \
+							", ".join(missing_keys))
+					msg.append(_(" This binary package is not " \
+						"recoverable and should be deleted."))
+					for line in textwrap.wrap("".join(msg), 72):
+						writemsg("!!! %s\n" % line, noiselevel=-1)
+					self.invalids.append(mypkg)
+					continue
 
-					multi_instance = False
-					invalid_name = False
-					build_id = None
-					if myfile.endswith(".xpak"):
-						multi_instance = True
-						build_id = self._parse_build_id(myfile)
-						if build_id < 1:
-							invalid_name = True
-						elif myfile != "%s-%s.xpak" % (
-							mypf, build_id):
-							invalid_name = True
-						else:
-							mypkg = mypkg[:-len(str(build_id))-1]
-					elif myfile != mypf + ".tbz2":
+				multi_instance = False
+				invalid_name = False
+				build_id = None
+				if myfile.endswith(".xpak"):
+					multi_instance = True
+					build_id = self._parse_build_id(myfile)
+					if build_id < 1:
+						invalid_name = True
+					elif myfile != "%s-%s.xpak" % (
+						mypf, build_id):
 						invalid_name = True
+					else:
+						mypkg = mypkg[:-len(str(build_id))-1]
+				elif myfile != mypf + ".tbz2":
+					invalid_name = True
 
-					if invalid_name:
-						writemsg(_("\n!!! Binary package name is "
-							"invalid: '%s'\n") % full_path,
-							noiselevel=-1)
-						continue
+				if invalid_name:
+					writemsg(_("\n!!! Binary package name is "
+						"invalid: '%s'\n") % full_path,
+						noiselevel=-1)
+					continue
 
-					if pkg_metadata.get("BUILD_ID"):
-						try:
-							build_id = long(pkg_metadata["BUILD_ID"])
-						except ValueError:
-							writemsg(_("!!! Binary package has "
-								"invalid BUILD_ID: '%s'\n") %
-								full_path, noiselevel=-1)
-							continue
-					else:
-						build_id = None
-
-					if multi_instance:
-						name_split = catpkgsplit("%s/%s" %
-							(mycat, mypf))
-						if (name_split is None or
-							tuple(catsplit(mydir)) != name_split[:2]):
-							continue
-					elif mycat != mydir and mydir != "All":
-						continue
-					if mypkg != mypf.strip():
+				if pkg_metadata.get("BUILD_ID"):
+					try:
+						build_id = long(pkg_metadata["BUILD_ID"])
+					except ValueError:
+						writemsg(_("!!! Binary package has "
+							"invalid BUILD_ID: '%s'\n") %
+							full_path, noiselevel=-1)
 						continue
-					mycpv = mycat + "/" + mypkg
-					if not self.dbapi._category_re.match(mycat):
-						writemsg(_("!!! Binary package has an " \
-							"unrecognized category: '%s'\n") % full_path,
-							noiselevel=-1)
-						writemsg(_("!!! '%s' has a category that is not" \
-							" listed in %setc/portage/categories\n") % \
-							(mycpv, self.settings["PORTAGE_CONFIGROOT"]),
-							noiselevel=-1)
+				else:
+					build_id = None
+
+				if multi_instance:
+					name_split = catpkgsplit("%s/%s" %
+						(mycat, mypf))
+					if (name_split is None or
+						tuple(catsplit(mydir)) != name_split[:2]):
 						continue
-					if build_id is not None:
-						pkg_metadata["BUILD_ID"] = _unicode(build_id)
-					pkg_metadata["SIZE"] = _unicode(s.st_size)
-					# Discard items used only for validation above.
-					pkg_metadata.pop("CATEGORY")
-					pkg_metadata.pop("PF")
-					mycpv = _pkg_str(mycpv,
-						metadata=self.dbapi._aux_cache_slot_dict(
-						pkg_metadata))
-					pkg_paths[_instance_key(mycpv)] = mypath
-					self.dbapi.cpv_inject(mycpv)
-					update_pkgindex = True
-					d = metadata.get(_instance_key(mycpv),
-						pkgindex._pkg_slot_dict())
-					if d:
-						try:
-							if long(d["_mtime_"]) != s[stat.ST_MTIME]:
-								d.clear()
-						except (KeyError, ValueError):
+				elif mycat != mydir and mydir != "All":
+					continue
+				if mypkg != mypf.strip():
+					continue
+				mycpv = mycat + "/" + mypkg
+				if not self.dbapi._category_re.match(mycat):
+					writemsg(_("!!! Binary package has an " \
+						"unrecognized category: '%s'\n") % full_path,
+						noiselevel=-1)
+					writemsg(_("!!! '%s' has a category that is not" \
+						" listed in %setc/portage/categories\n") % \
+						(mycpv, self.settings["PORTAGE_CONFIGROOT"]),
+						noiselevel=-1)
+					continue
+				if build_id is not None:
+					pkg_metadata["BUILD_ID"] = _unicode(build_id)
+				pkg_metadata["SIZE"] = _unicode(s.st_size)
+				# Discard items used only for validation above.
+				pkg_metadata.pop("CATEGORY")
+				pkg_metadata.pop("PF")
+				mycpv = _pkg_str(mycpv,
+					metadata=self.dbapi._aux_cache_slot_dict(
+					pkg_metadata))
+				pkg_paths[_instance_key(mycpv)] = mypath
+				self.dbapi.cpv_inject(mycpv)
+				update_pkgindex = True
+				d = metadata.get(_instance_key(mycpv),
+					pkgindex._pkg_slot_dict())
+				if d:
+					try:
+						if long(d["_mtime_"]) != s[stat.ST_MTIME]:
 							d.clear()
-					if d:
-						try:
-							if long(d["SIZE"]) != long(s.st_size):
-								d.clear()
-						except (KeyError, ValueError):
+					except (KeyError, ValueError):
+						d.clear()
+				if d:
+					try:
+						if long(d["SIZE"]) != long(s.st_size):
 							d.clear()
+					except (KeyError, ValueError):
+						d.clear()
 
-					for k in self._pkgindex_allowed_pkg_keys:
-						v = pkg_metadata.get(k)
-						if v:
-							d[k] = v
-					d["CPV"] = mycpv
+				for k in self._pkgindex_allowed_pkg_keys:
+					v = pkg_metadata.get(k)
+					if v:
+						d[k] = v
+				d["CPV"] = mycpv
 
-					try:
-						self._eval_use_flags(mycpv, d)
-					except portage.exception.InvalidDependString:
-						writemsg(_("!!! Invalid binary package: '%s'\n") % \
-							self.getname(mycpv), noiselevel=-1)
-						self.dbapi.cpv_remove(mycpv)
-						del pkg_paths[_instance_key(mycpv)]
-
-					# record location if it's non-default
-					if mypath != mycpv + ".tbz2":
-						d["PATH"] = mypath
-					else:
-						d.pop("PATH", None)
-					metadata[_instance_key(mycpv)] = d
+				try:
+					self._eval_use_flags(mycpv, d)
+				except portage.exception.InvalidDependString:
+					writemsg(_("!!! Invalid binary package: '%s'\n") % \
+						self.getname(mycpv), noiselevel=-1)
+					self.dbapi.cpv_remove(mycpv)
+					del pkg_paths[_instance_key(mycpv)]
+
+				# record location if it's non-default
+				if mypath != mycpv + ".tbz2":
+					d["PATH"] = mypath
+				else:
+					d.pop("PATH", None)
+				metadata[_instance_key(mycpv)] = d
 
 			for instance_key in list(metadata):
 				if instance_key not in pkg_paths:
@@ -807,6 +831,51 @@ class binarytree(object):
 
 		return pkgindex if update_pkgindex else None
 
+	@staticmethod
+	def _pkgindex_match(possibilities, st, minimum_keys):
+		"""
+		Return the package index entry among possibilities that is
+		up to date with respect to the given stat result, or None.
+		"""
+		if not possibilities:
+			return None
+		for d in possibilities:
+			try:
+				if long(d["_mtime_"]) != st[stat.ST_MTIME]:
+					continue
+			except (KeyError, ValueError):
+				continue
+			try:
+				if long(d["SIZE"]) != long(st.st_size):
+					continue
+			except (KeyError, ValueError):
+				continue
+			if not minimum_keys.difference(d):
+				return d
+		return None
+
+	def _scan_jobs(self):
+		"""
+		Return the number of threads used to examine the files of
+		PKGDIR, according to PORTAGE_BINPKG_SCAN_JOBS.
+		"""
+		scan_jobs_default = 8
+		v = self.settings.get("PORTAGE_BINPKG_SCAN_JOBS")
+		if not v:
+			return scan_jobs_default
+		try:
+			scan_jobs = int(v)
+		except ValueError:
+			scan_jobs = 0
+		if scan_jobs < 1:
+			writemsg(_("!!! Variable PORTAGE_BINPKG_SCAN_JOBS"
+				" contains an invalid value: '%s'\n") % v, noiselevel=-1)
+			writemsg(_("!!! Using PORTAGE_BINPKG_SCAN_JOBS "
+				"default value: %s\n") % scan_jobs_default,
+				noiselevel=-1)
+			scan_jobs = scan_jobs_default
+		return scan_jobs
+
 	def _populate_remote(self, getbinpkg_refresh=True):
 
 		self._remote_has_index = False
@@ -830,7 +899,9 @@ class binarytree(object):
 					host = host[:-len(port_str)]
 			pkgindex_file = os.path.join(self.settings["EROOT"], CACHE_PATH, "binhost",
 				host, parsed_url.path.lstrip("/"), "Packages")
-			pkgindex = self._new_pkgindex()
+			# Remote indexes can be large, so their entries are only
+			# parsed as far as they are actually used.
+			pkgindex = self._new_pkgindex(lazy=True)
 			try:
 				f = io.open(_unicode_encode(pkgindex_file,
 					encoding=_encodings['fs'], errors='strict'),
@@ -850,7 +921,7 @@ class binarytree(object):
 			except ValueError:
 				download_timestamp = 0
 			remote_timestamp = None
-			rmt_idx = self._new_pkgindex()
+			rmt_idx = self._new_pkgindex(lazy=True)
 			proc = None
 			tmp_filename = None
 			try:
@@ -1042,7 +1113,7 @@ class binarytree(object):
 
 				self._remote_has_index = True
 
-	def inject(self, cpv, filename=None):
+	def inject(self, cpv, filename=None, digests=None):
 		"""Add a freshly built package to the database.  This updates
 		$PKGDIR/Packages with the new package metadata (including MD5).
 		@param cpv: The cpv of the new package to inject
@@ -1050,6 +1121,10 @@ class binarytree(object):
 		@param filename: File path of the package to inject, or None if it's
 			already in the location returned by getname()
 		@type filename: string
+		@param digests: Checksums of the package file, including its size,
+			which were computed while it was written, so that it does not
+			have to be read again (see portage.util._binpkg_writer)
+		@type digests: dict
 		@rtype: _pkg_str or None
 		@return: A _pkg_str instance on success, or None on failure.
 		"""
@@ -1134,15 +1209,32 @@ class binarytree(object):
 				binary_data[b"BUILD_ID"] = _unicode_encode(
 					metadata["BUILD_ID"])
 				binpkg.recompose_mem(portage.xpak.xpak_mem(binary_data))
+				# The checksums no longer apply to the modified file.
+				digests = None
 
 			self._file_permissions(full_path)
-			pkgindex = self._load_pkgindex()
-			if not self._pkgindex_version_supported(pkgindex):
-				pkgindex = self._new_pkgindex()
-
-			d = self._inject_file(pkgindex, cpv, full_path)
-			self._update_pkgindex_header(pkgindex.header)
-			self._pkgindex_write(pkgindex)
+			d = None
+			journal_size = None
+			if "binpkg-index-journal" in self.settings.features:
+				# Append to the journal instead of rewriting the
+				# whole index, unless the journal needs compaction.
+				d = self._inject_file(None, cpv, full_path,
+					digests=digests)
+				journal_size = self._pkgindex_journal_append(d)
+
+			if journal_size is None or \
+				journal_size >= self._pkgindex_journal_max:
+				pkgindex = self._load_pkgindex()
+				if not self._pkgindex_version_supported(pkgindex):
+					pkgindex = self._new_pkgindex()
+
+				if d is None:
+					d = self._inject_file(pkgindex, cpv, full_path,
+						digests=digests)
+				elif journal_size is None:
+					self._pkgindex_replace_entry(pkgindex.packages, d)
+				self._update_pkgindex_header(pkgindex.header)
+				self._pkgindex_write(pkgindex)
 
 		finally:
 			if pkgindex_lock:
@@ -1193,18 +1285,20 @@ class binarytree(object):
 					metadata[k] = " ".join(v.split())
 		return metadata
 
-	def _inject_file(self, pkgindex, cpv, filename):
+	def _inject_file(self, pkgindex, cpv, filename, digests=None):
 		"""
 		Add a package to internal data structures, and add an
 		entry to the given pkgindex.
 		@param pkgindex: The PackageIndex instance to which an entry
-			will be added.
+			will be added, or None if the entry is only to be returned.
 		@type pkgindex: PackageIndex
 		@param cpv: A _pkg_str instance corresponding to the package
 			being injected.
 		@type cpv: _pkg_str
 		@param filename: Absolute file path of the package to inject.
 		@type filename: string
+		@param digests: Precomputed checksums of the file (see inject).
+		@type digests: dict
 		@rtype: dict
 		@return: A dict corresponding to the new entry which has been
 			added to pkgindex. This may be used to access the checksums
@@ -1217,22 +1311,31 @@ class binarytree(object):
 
 		self.dbapi.cpv_inject(cpv)
 		self._pkg_paths[instance_key] = filename[len(self.pkgdir)+1:]
-		d = self._pkgindex_entry(cpv)
+		d = self._pkgindex_entry(cpv, digests=digests)
+		if pkgindex is not None:
+			self._pkgindex_replace_entry(pkgindex.packages, d)
+		return d
 
+	@staticmethod
+	def _pkgindex_replace_entry(packages, d):
+		"""
+		Add entry d to the given list of package index entries,
+		replacing any entries for the same package file.
+		"""
 		# If found, remove package(s) with duplicate path.
+		cpv = d["CPV"]
 		path = d.get("PATH", "")
-		for i in range(len(pkgindex.packages) - 1, -1, -1):
-			d2 = pkgindex.packages[i]
+		for i in range(len(packages) - 1, -1, -1):
+			d2 = packages[i]
 			if path and path == d2.get("PATH"):
 				# Handle path collisions in $PKGDIR/All
 				# when CPV is not identical.
-				del pkgindex.packages[i]
+				del packages[i]
 			elif cpv == d2.get("CPV"):
 				if path == d2.get("PATH", ""):
-					del pkgindex.packages[i]
+					del packages[i]
 
-		pkgindex.packages.append(d)
-		return d
+		packages.append(d)
 
 	def _pkgindex_write(self, pkgindex):
 		contents = codecs.getwriter(_encodings['repo.content'])(io.BytesIO())
@@ -1257,10 +1360,142 @@ class binarytree(object):
 			# some seconds might have elapsed since TIMESTAMP
 			os.utime(fname, (atime, mtime))
 
-	def _pkgindex_entry(self, cpv):
+		# The index has been written from a view which includes the
+		# journal (see _load_pkgindex), so the journal is obsolete.
+		try:
+			os.unlink(self._pkgindex_journal_file)
+		except OSError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise
+
+	def _pkgindex_compact(self):
+		"""
+		Merge the Packages journal into the Packages file. This must
+		be called while holding the Packages lock.
+		"""
+		pkgindex = self._load_pkgindex()
+		if not self._pkgindex_version_supported(pkgindex):
+			return
+		self._update_pkgindex_header(pkgindex.header)
+		self._pkgindex_write(pkgindex)
+
+	def _read_pkgindex_journal(self, pkgindex=None):
+		"""
+		Read the Packages journal. Entries which lack required keys,
+		as may result from an interrupted append, are skipped.
+		@param pkgindex: a PackageIndex used to parse the journal
+		@type pkgindex: PackageIndex
+		@rtype: tuple
+		@return: a (header, entries) tuple, where header is None if
+			there is no journal
+		"""
+		if pkgindex is None:
+			pkgindex = self._new_pkgindex()
+		try:
+			f = io.open(_unicode_encode(self._pkgindex_journal_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+		except EnvironmentError:
+			return None, []
+
+		entries = []
+		with f:
+			header = pkgindex._readpkgindex(f, pkg_entry=False)
+			while True:
+				d = pkgindex._readpkgindex(f)
+				if not d:
+					break
+				if not self._pkgindex_journal_required_keys.difference(d):
+					entries.append(d)
+		return header, entries
+
+	def _pkgindex_journal_append(self, d):
+		"""
+		Append a package entry to the Packages journal. A journal only
+		applies to the Packages file with the TIMESTAMP recorded in its
+		header, so a new journal is started if the existing one belongs
+		to a different Packages file. This must be called while
+		holding the Packages lock.
+		@param d: a package entry, as returned by _pkgindex_entry
+		@type d: dict
+		@rtype: int or None
+		@return: the number of entries in the journal, or None if there
+			is no usable Packages file to which the journal would apply,
+			or if the Packages file is older than
+			_pkgindex_journal_max_age and should be rewritten instead
+		"""
+		pkgindex = self._new_pkgindex()
+		try:
+			with io.open(_unicode_encode(self._pkgindex_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace') as f:
+				pkgindex.readHeader(f)
+		except EnvironmentError:
+			return None
+		timestamp = pkgindex.header.get("TIMESTAMP")
+		if not timestamp or not self._pkgindex_version_supported(pkgindex):
+			return None
+		try:
+			if time.time() - long(timestamp) >= \
+				self._pkgindex_journal_max_age:
+				return None
+		except ValueError:
+			return None
+
+		header, entries = self._read_pkgindex_journal(pkgindex)
+		contents = io.StringIO()
+		if header is not None and header.get("TIMESTAMP") == timestamp:
+			mode = 'a'
+			journal_size = len(entries) + 1
+		else:
+			mode = 'w'
+			journal_size = 1
+			pkgindex._writepkgindex(contents,
+				[("JOURNAL", "1"), ("TIMESTAMP", timestamp)])
+		pkgindex._writepkgindex(contents,
+			[(k, d[k]) for k in sorted(d) if d[k]])
+
+		with io.open(_unicode_encode(self._pkgindex_journal_file,
+			encoding=_encodings['fs'], errors='strict'),
+			mode=mode, encoding=_encodings['repo.content'],
+			errors='backslashreplace') as f:
+			f.write(contents.getvalue())
+			f.flush()
+			os.fsync(f.fileno())
+		self._file_permissions(self._pkgindex_journal_file)
+		return journal_size
+
+	def _apply_pkgindex_journal(self, pkgindex):
+		"""
+		Apply the entries of the Packages journal to pkgindex, if the
+		journal belongs to the Packages file that pkgindex was read from.
+		@rtype: int
+		@return: the number of journal entries applied
+		"""
+		header, entries = self._read_pkgindex_journal(pkgindex)
+		if header is None or \
+			header.get("TIMESTAMP") != pkgindex.header.get("TIMESTAMP"):
+			return 0
+		for d in entries:
+			for k, v in self._pkgindex_default_pkg_data.items():
+				d.setdefault(k, v)
+			for k in self._pkgindex_inherited_keys:
+				v = pkgindex.header.get(k)
+				if v is not None:
+					d.setdefault(k, v)
+			self._pkgindex_replace_entry(pkgindex.packages, d)
+		return len(entries)
+
+	def _pkgindex_entry(self, cpv, digests=None):
 		"""
 		Performs checksums, and gets size and mtime via lstat.
 		Raises InvalidDependString if necessary.
+		@param digests: Precomputed checksums of the package file, which
+			are used instead of reading it if they include all of the
+			required hashes and its current size.
+		@type digests: dict
 		@rtype: dict
 		@return: a dict containing entry for the give cpv.
 		"""
@@ -1268,11 +1503,16 @@ class binarytree(object):
 		pkg_path = self.getname(cpv)
 
 		d = dict(cpv._metadata.items())
-		d.update(perform_multiple_checksums(
-			pkg_path, hashes=self._pkgindex_hashes))
+		st = os.lstat(pkg_path)
+		if digests is not None and digests.get("size") == st.st_size and \
+			all(k in digests for k in self._pkgindex_hashes):
+			for k in self._pkgindex_hashes:
+				d[k] = digests[k]
+		else:
+			d.update(perform_multiple_checksums(
+				pkg_path, hashes=self._pkgindex_hashes))
 
 		d["CPV"] = cpv
-		st = os.lstat(pkg_path)
 		d["_mtime_"] = _unicode(st[stat.ST_MTIME])
 		d["SIZE"] = _unicode(st.st_size)
 
@@ -1283,13 +1523,14 @@ class binarytree(object):
 
 		return d
 
-	def _new_pkgindex(self):
+	def _new_pkgindex(self, lazy=False):
 		return portage.getbinpkg.PackageIndex(
 			allowed_pkg_keys=self._pkgindex_allowed_pkg_keys,
 			default_header_data=self._pkgindex_default_header_data,
 			default_pkg_data=self._pkgindex_default_pkg_data,
 			inherited_keys=self._pkgindex_inherited_keys,
-			translated_keys=self._pkgindex_translated_keys)
+			translated_keys=self._pkgindex_translated_keys,
+			lazy=lazy)
 
 	def _update_pkgindex_header(self, header):
 		portdir = normalize_path(os.path.realpath(self.settings["PORTDIR"]))
@@ -1538,7 +1779,7 @@ class binarytree(object):
 		self.inject(pkgname)
 
 	def _load_pkgindex(self):
-		pkgindex = self._new_pkgindex()
+		pkgindex = self._new_pkgindex(lazy=True)
 		try:
 			f = io.open(_unicode_encode(self._pkgindex_file,
 				encoding=_encodings['fs'], errors='strict'),
@@ -1551,6 +1792,7 @@ class binarytree(object):
 				pkgindex.read(f)
 			finally:
 				f.close()
+			self._apply_pkgindex_journal(pkgindex)
 		return pkgindex
 
 	def _get_digests(self, pkg):
@@ -1,4 +1,4 @@
-# Copyright 1998-2015 Gentoo Foundation
+# Copyright 1998-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -14,13 +14,16 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.dbapi.dep_expand:dep_expand',
 	'portage.dep:Atom,dep_getkey,match_from_list,use_reduce,_match_slot',
 	'portage.package.ebuild.doebuild:doebuild',
+	'portage.package.ebuild._distfiles_layout:distfile_path',
 	'portage.util:ensure_dirs,shlex_split,writemsg,writemsg_level',
 	'portage.util.listdir:listdir',
 	'portage.versions:best,catsplit,catpkgsplit,_pkgsplit@pkgsplit,ver_regexp,_pkg_str',
+	'_emerge.EbuildMetadataPhase:EbuildMetadataPhase',
 )
 
 from portage.cache import volatile
 from portage.cache.cache_errors import CacheError
+from portage.cache.index.eclass_index import EclassIndex
 from portage.cache.mappings import Mapping
 from portage.dbapi import dbapi
 from portage.exception import PortageException, PortageKeyError, \
@@ -37,7 +40,6 @@ from portage import _unicode_encode
 from portage import OrderedDict
 from portage.util._eventloop.EventLoop import EventLoop
 from portage.util._eventloop.global_event_loop import global_event_loop
-from _emerge.EbuildMetadataPhase import EbuildMetadataPhase
 
 import os as _os
 import sys
@@ -374,6 +376,20 @@ class portdbapi(dbapi):
 		for x in self.auxdb.values():
 			x.sync()
 
+	def _invalidate_eclass_index(self, repo_path):
+		"""
+		Remove the reverse eclass inheritance index of the writable
+		cache for the given repository, before entries of the cache are
+		modified by code that does not maintain the index. Loading the
+		index here would make the first cache write of an emerge run
+		read the whole cache, so it is rebuilt later, when it is needed.
+		Since that may happen at any time, the index is removed for each
+		write, which is cheap compared to the generation of the entry.
+		"""
+		index = EclassIndex.for_repo(self, repo_path)
+		if index is not None:
+			index.remove()
+
 	def findLicensePath(self, license_name):
 		for x in reversed(self.porttrees):
 			license_path = os.path.join(x, "licenses", license_name)
@@ -513,6 +529,7 @@ class portdbapi(dbapi):
 			cache = None
 
 		if cache is not None:
+			self._invalidate_eclass_index(repo_path)
 			try:
 				cache[cpv] = metadata
 			except CacheError:
@@ -715,7 +732,7 @@ class portdbapi(dbapi):
 				if debug:
 					writemsg(_("[bad digest]: missing %(file)s for %(pkg)s\n") % {"file":myfile, "pkg":mypkg})
 				continue
-			file_path = os.path.join(self.settings["DISTDIR"], myfile)
+			file_path = distfile_path(self.settings["DISTDIR"], myfile)
 			mystat = None
 			try:
 				mystat = os.stat(file_path)
@@ -727,7 +744,7 @@ class portdbapi(dbapi):
 				if ro_distdirs is not None:
 					for x in shlex_split(ro_distdirs):
 						try:
-							mystat = os.stat(os.path.join(x, myfile))
+							mystat = os.stat(distfile_path(x, myfile))
 						except OSError:
 							pass
 						else:
@@ -779,7 +796,7 @@ class portdbapi(dbapi):
 			else:
 				try:
 					ok, reason = portage.checksum.verify_all(
-						os.path.join(self.settings["DISTDIR"], x), mysums[x])
+						distfile_path(self.settings["DISTDIR"], x), mysums[x])
 				except FileNotFound as e:
 					ok = False
 					reason = _("File Not Found: '%s'") % (e,)
@@ -1,4 +1,4 @@
-# Copyright 1998-2017 Gentoo Foundation
+# Copyright 1998-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, unicode_literals
@@ -47,6 +47,11 @@ portage.proxy.lazyimport.lazyimport(globals(),
 		'_get_slot_re,_pkgsplit@pkgsplit,_pkg_str,_unknown_repo',
 	'subprocess',
 	'tarfile',
+	'_emerge.EbuildBuildDir:EbuildBuildDir',
+	'_emerge.EbuildPhase:EbuildPhase',
+	'_emerge.emergelog:emergelog',
+	'_emerge.MiscFunctionsProcess:MiscFunctionsProcess',
+	'_emerge.SpawnProcess:SpawnProcess',
 )
 
 from portage.const import CACHE_PATH, CONFIG_MEMORY_FILE, \
@@ -69,11 +74,6 @@ from portage import _unicode_decode
 from portage import _unicode_encode
 from ._VdbMetadataDelta import VdbMetadataDelta
 
-from _emerge.EbuildBuildDir import EbuildBuildDir
-from _emerge.EbuildPhase import EbuildPhase
-from _emerge.emergelog import emergelog
-from _emerge.MiscFunctionsProcess import MiscFunctionsProcess
-from _emerge.SpawnProcess import SpawnProcess
 from ._ContentsCaseSensitivityManager import ContentsCaseSensitivityManager
 
 import errno
@@ -595,7 +595,7 @@ class vardbapi(dbapi):
 			# clear cache entry
 			self.mtdircache[mycat] = curmtime
 			self.matchcache[mycat] = {}
-		if mydep not in self.matchcache[mycat]:
+		if cache_key not in self.matchcache[mycat]:
 			mymatch = list(self._iter_match(mydep,
 				self.cp_list(mydep.cp, use_cache=use_cache)))
 			self.matchcache[mycat][cache_key] = mymatch
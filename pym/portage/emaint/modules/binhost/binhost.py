@@ -86,6 +86,10 @@ class BinhostHandler(object):
 		stale = set(metadata).difference(cpv_all)
 		for cpv in stale:
 			errors.append("'%s' is not in the repository" % cpv)
+		journal_size = len(self._bintree._read_pkgindex_journal()[1])
+		if journal_size:
+			errors.append("%d Packages journal entries are not "
+				"compacted" % journal_size)
 		if errors:
 			return (False, errors)
 		return (True, None)
@@ -175,6 +179,16 @@ class BinhostHandler(object):
 			finally:
 				locks.unlockfile(pkgindex_lock)
 
+		elif os.path.exists(bintree._pkgindex_journal_file):
+			# Merge journaled entries into the Packages file.
+			from portage import locks
+			pkgindex_lock = locks.lockfile(
+				self._pkgindex_file, wantnewlockfile=1)
+			try:
+				bintree._pkgindex_compact()
+			finally:
+				locks.unlockfile(pkgindex_lock)
+
 		if onProgress:
 			if maxval == 0:
 				maxval = 1
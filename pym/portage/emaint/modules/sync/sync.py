@@ -371,7 +371,9 @@ class SyncScheduler(AsyncScheduler):
 		hooks_enabled = True
 		returncode = task.returncode
 		if task.returncode == os.EX_OK:
-			returncode, message, updatecache_flg, hooks_enabled = task.result
+			# The changed paths are only used by the sync callback.
+			returncode, message, updatecache_flg, hooks_enabled = \
+				task.result[:4]
 			if message:
 				self.msgs.append(message)
 		repo = task.kwargs['repo'].name
@@ -5,7 +5,7 @@
 from __future__ import unicode_literals
 
 from portage.output import colorize
-from portage.cache.mappings import slot_dict_class
+from portage.cache.mappings import MutableMapping, slot_dict_class
 from portage.localization import _
 import portage
 from portage import os
@@ -824,18 +824,169 @@ def _cmp_cpv(d1, d2):
 	else:
 		return -1
 
+class _PackageIndexText(object):
+	"""
+	The body text of a package index read in lazy mode, which is shared
+	by all of its entries, along with the values of the inherited keys
+	of the header at the time that the body was read.
+	"""
+
+	__slots__ = ('index', 'text', 'inherited')
+
+	def __init__(self, index, text, inherited):
+		self.index = index
+		self.text = text
+		self.inherited = inherited
+
+class _PackageIndexEntry(MutableMapping):
+	"""
+	A package entry of a PackageIndex read in lazy mode. It refers to
+	the span of its stanza in the body text, and looks values up in that
+	span on demand. Assigned values are kept apart, so that the common
+	pattern of looking a few keys up and setting a few others does not
+	parse the stanza. Any other modification materializes the entry as
+	a regular package dict, which is then used for everything else.
+	"""
+
+	__slots__ = ('_source', '_start', '_end', '_overrides', '_data')
+
+	def __init__(self, source, start, end):
+		self._source = source
+		self._start = start
+		self._end = end
+		self._overrides = None
+		self._data = None
+
+	def _lookup(self, key):
+		"""
+		Return the value of key, as it would be in the materialized
+		entry, or None if it is missing.
+		"""
+		if self._overrides is not None and key in self._overrides:
+			return self._overrides[key]
+		source = self._source
+		index = source.index
+		value = index._stanza_value(source.text,
+			self._start, self._end, key)
+		if value is None:
+			if index._default_pkg_data:
+				value = index._default_pkg_data.get(key)
+			if value is None:
+				value = source.inherited.get(key)
+		return value
+
+	def _parse(self):
+		"""
+		Return a new package dict parsed from the stanza, including
+		defaults, inherited values and assigned values.
+		"""
+		source = self._source
+		index = source.index
+		d = index._readpkgindex(
+			source.text[self._start:self._end].split("\n"))
+		index._apply_pkg_defaults(d, source.inherited)
+		if self._overrides is not None:
+			d.update(self._overrides)
+		return d
+
+	def _materialize(self):
+		if self._data is None:
+			self._data = self._parse()
+			self._source = None
+			self._overrides = None
+		return self._data
+
+	def __getitem__(self, key):
+		if self._data is not None:
+			return self._data[key]
+		value = self._lookup(key)
+		if value is None:
+			raise KeyError(key)
+		return value
+
+	def get(self, key, default=None):
+		if self._data is not None:
+			return self._data.get(key, default)
+		value = self._lookup(key)
+		if value is None:
+			return default
+		return value
+
+	def __contains__(self, key):
+		if self._data is not None:
+			return key in self._data
+		return self._lookup(key) is not None
+
+	def __setitem__(self, key, value):
+		if self._data is not None:
+			self._data[key] = value
+			return
+		allowed_keys = self._source.index._allowed_pkg_keys
+		if allowed_keys is not None and key not in allowed_keys:
+			# Fail like the materialized entry does.
+			self._materialize()[key] = value
+			return
+		if self._overrides is None:
+			self._overrides = {}
+		self._overrides[key] = value
+
+	def __delitem__(self, key):
+		del self._materialize()[key]
+
+	def _view(self):
+		# Read-only operations on all keys parse a temporary copy,
+		# so that an unmodified entry stays compact.
+		if self._data is not None:
+			return self._data
+		return self._parse()
+
+	def __iter__(self):
+		return iter(list(self._view()))
+
+	def keys(self):
+		return list(self._view())
+
+	def __len__(self):
+		return len(self._view())
+
+	def copy(self):
+		return self._view().copy()
+
+	def clear(self):
+		self._materialize().clear()
+
+	def setdefault(self, key, default=None):
+		return self._materialize().setdefault(key, default)
+
+	def pop(self, key, *args):
+		return self._materialize().pop(key, *args)
+
+	def update(self, *args, **kwargs):
+		self._materialize().update(*args, **kwargs)
+
 class PackageIndex(object):
+	"""
+	The Packages index of a binary package repository. In lazy mode,
+	readBody keeps the body text and only records the span of each
+	stanza, and the package entries parse their values on access,
+	which is much cheaper than parsing every entry up front when only
+	a few keys of most entries are ever used.
+	"""
 
 	def __init__(self,
 		allowed_pkg_keys=None,
 		default_header_data=None,
 		default_pkg_data=None,
 		inherited_keys=None,
-		translated_keys=None):
+		translated_keys=None,
+		lazy=False):
 
+		self._lazy = lazy
+		self._allowed_pkg_keys = None
 		self._pkg_slot_dict = None
 		if allowed_pkg_keys is not None:
 			self._pkg_slot_dict = slot_dict_class(allowed_pkg_keys)
+			self._allowed_pkg_keys = self._pkg_slot_dict.allowed_keys
 
 		self._default_header_data = default_header_data
 		self._default_pkg_data = default_pkg_data
@@ -890,7 +1041,52 @@ class PackageIndex(object):
 	def readHeader(self, pkgfile):
 		self.header.update(self._readpkgindex(pkgfile, pkg_entry=False))
 
+	def _inherited_values(self):
+		inherited = {}
+		if self._inherited_keys:
+			for k in self._inherited_keys:
+				v = self.header.get(k)
+				if v is not None:
+					inherited[k] = v
+		return inherited
+
+	def _apply_pkg_defaults(self, d, inherited):
+		if self._default_pkg_data:
+			for k, v in self._default_pkg_data.items():
+				d.setdefault(k, v)
+		for k, v in inherited.items():
+			d.setdefault(k, v)
+
+	def _stanza_value(self, text, start, end, key):
+		"""
+		Return the value of key in the stanza that spans text[start:end],
+		or None if it is missing. Like _readpkgindex, the last line for
+		a key wins, and keys that are not allowed are ignored.
+		"""
+		if self._allowed_pkg_keys is not None and \
+			key not in self._allowed_pkg_keys:
+			return None
+		file_key = self._write_translation_map.get(key, key)
+		if file_key == key and key in self._read_translation_map:
+			# This name is translated to another key when read.
+			return None
+		# Every stanza is preceded by a newline, so that the search
+		# only matches at the start of a line.
+		needle = "\n%s:" % file_key
+		pos = text.rfind(needle, start - 1, end)
+		if pos == -1:
+			return None
+		pos += len(needle)
+		line_end = text.find("\n", pos, end)
+		if line_end == -1:
+			line_end = end
+		return text[pos + 1:line_end]
+
 	def readBody(self, pkgfile):
+		if self._lazy:
+			self._readBodyLazy(pkgfile)
+			return
+		inherited = self._inherited_values()
 		while True:
 			d = self._readpkgindex(pkgfile)
 			if not d:
@@ -898,16 +1094,31 @@ class PackageIndex(object):
 			mycpv = d.get("CPV")
 			if not mycpv:
 				continue
-			if self._default_pkg_data:
-				for k, v in self._default_pkg_data.items():
-					d.setdefault(k, v)
-			if self._inherited_keys:
-				for k in self._inherited_keys:
-					v = self.header.get(k)
-					if v is not None:
-						d.setdefault(k, v)
+			self._apply_pkg_defaults(d, inherited)
 			self.packages.append(d)
 
+	def _readBodyLazy(self, pkgfile):
+		"""
+		Record the span of each stanza of the body, in a single pass
+		over the text, and append an entry that parses its values on
+		access.
+		"""
+		text = "\n" + "".join(pkgfile)
+		source = _PackageIndexText(self, text, self._inherited_values())
+		stanza_value = self._stanza_value
+		packages = self.packages
+		start = 1
+		length = len(text)
+		while start < length and text[start] != "\n":
+			end = text.find("\n\n", start)
+			if end == -1:
+				end = length
+			else:
+				end += 1
+			if stanza_value(text, start, end, "CPV"):
+				packages.append(_PackageIndexEntry(source, start, end))
+			start = end + 1
+
 	def write(self, pkgfile):
 		if self.modified:
 			self.header["TIMESTAMP"] = str(long(time.time()))
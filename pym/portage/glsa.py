@@ -1,22 +1,26 @@
-# Copyright 2003-2017 Gentoo Foundation
+# Copyright 2003-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import absolute_import, unicode_literals
 
 import io
 import sys
-try:
-	from urllib.request import urlopen as urllib_request_urlopen
-except ImportError:
-	from urllib import urlopen as urllib_request_urlopen
 import codecs
 import re
 import operator
-import xml.dom.minidom
 from io import StringIO
 from functools import reduce
 
 import portage
+portage.proxy.lazyimport.lazyimport(globals(),
+	'xml.dom.minidom',
+)
+if sys.hexversion >= 0x3000000:
+	portage.proxy.lazyimport.lazyimport(globals(),
+		'urllib.request:urlopen@urllib_request_urlopen')
+else:
+	portage.proxy.lazyimport.lazyimport(globals(),
+		'urllib:urlopen@urllib_request_urlopen')
 from portage import os
 from portage import _encodings
 from portage import _unicode_decode
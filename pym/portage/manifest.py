@@ -15,6 +15,7 @@ import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum:get_valid_checksum_keys,perform_multiple_checksums,' + \
 		'verify_all,_apply_hash_filter,_filter_unaccelarated_hashes',
+	'portage.package.ebuild._distfiles_layout:distfile_path',
 	'portage.repository.config:_find_invalid_path_char',
 	'portage.util:write_atomic,writemsg_level',
 )
@@ -497,7 +498,7 @@ class Manifest(object):
 		required_hash_types.add("size")
 		required_hash_types.update(self.required_hashes)
 		for f in distlist:
-			fname = os.path.join(self.distdir, f)
+			fname = distfile_path(self.distdir, f)
 			mystat = None
 			try:
 				mystat = os.stat(fname)
@@ -598,7 +599,7 @@ class Manifest(object):
 
 	def _getAbsname(self, ftype, fname):
 		if ftype == "DIST":
-			absname = os.path.join(self.distdir, fname)
+			absname = distfile_path(self.distdir, fname)
 		elif ftype == "AUX":
 			absname = os.path.join(self.pkgdir, "files", fname)
 		else:
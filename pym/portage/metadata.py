@@ -11,11 +11,18 @@ from portage import os
 from portage import eapi_is_supported
 from portage.util import writemsg_level
 from portage.cache.cache_errors import CacheError
+from portage.cache.index.eclass_index import EclassIndex
 from _emerge.ProgressHandler import ProgressHandler
 from portage.eclass_cache import hashed_path
 
 
-def action_metadata(settings, portdb, myopts, porttrees=None):
+def action_metadata(settings, portdb, myopts, porttrees=None, cp_iter=None):
+	"""
+	Transfer pregenerated metadata cache entries to the local cache.
+	If cp_iter is given, only the entries of the given cps are
+	transferred and cleansed, which is useful when the set of
+	changed packages is known, such as after a sync.
+	"""
 	if porttrees is None:
 		porttrees = portdb.porttrees
 	portage.writemsg_stdout("\n>>> Updating Portage cache\n")
@@ -33,13 +40,23 @@ def action_metadata(settings, portdb, myopts, porttrees=None):
 	auxdbkeys = portdb._known_keys
 
 	class TreeData(object):
-		__slots__ = ('dest_db', 'eclass_db', 'path', 'src_db', 'valid_nodes')
+		__slots__ = ('dest_db', 'eclass_db', 'eclass_index', 'path',
+			'src_db', 'valid_nodes')
 		def __init__(self, dest_db, eclass_db, path, src_db):
 			self.dest_db = dest_db
 			self.eclass_db = eclass_db
 			self.path = path
 			self.src_db = src_db
 			self.valid_nodes = set()
+			# Keep the reverse eclass inheritance index of the
+			# destination cache up to date if it exists. Otherwise,
+			# it is built by the next affected_cps call, since
+			# building it here would read the whole cache.
+			self.eclass_index = EclassIndex.for_repo(portdb, path)
+			if self.eclass_index is not None and \
+				not self.eclass_index.load():
+				self.eclass_index.remove()
+				self.eclass_index = None
 
 	porttrees_data = []
 	for path in porttrees:
@@ -72,14 +89,19 @@ def action_metadata(settings, portdb, myopts, porttrees=None):
 				portage.output.get_term_size()
 		signal.signal(signal.SIGWINCH, sigwinch_handler)
 
-	# Temporarily override portdb.porttrees so portdb.cp_all()
-	# will only return the relevant subset.
-	portdb_porttrees = portdb.porttrees
-	portdb.porttrees = porttrees
-	try:
-		cp_all = portdb.cp_all()
-	finally:
-		portdb.porttrees = portdb_porttrees
+	if cp_iter is None:
+		# Temporarily override portdb.porttrees so portdb.cp_all()
+		# will only return the relevant subset.
+		portdb_porttrees = portdb.porttrees
+		portdb.porttrees = porttrees
+		try:
+			cp_all = portdb.cp_all()
+		finally:
+			portdb.porttrees = portdb_porttrees
+		cp_set = None
+	else:
+		cp_all = sorted(cp_iter)
+		cp_set = frozenset(cp_all)
 
 	curval = 0
 	maxval = len(cp_all)
@@ -174,6 +196,10 @@ def action_metadata(settings, portdb, myopts, porttrees=None):
 				except CacheError:
 					# ignore it; can't do anything about it.
 					pass
+				else:
+					if tree_data.eclass_index is not None:
+						tree_data.eclass_index.update(cpv,
+							src.get('_eclasses_', ()))
 
 		curval += 1
 		if onProgress is not None:
@@ -191,12 +217,20 @@ def action_metadata(settings, portdb, myopts, porttrees=None):
 				level=logging.ERROR, noiselevel=-1)
 			del e
 		else:
+			if cp_set is not None:
+				dead_nodes = set(cpv for cpv in dead_nodes
+					if portage.cpv_getkey(cpv) in cp_set)
 			dead_nodes.difference_update(tree_data.valid_nodes)
 			for cpv in dead_nodes:
 				try:
 					del tree_data.dest_db[cpv]
 				except (KeyError, CacheError):
 					pass
+				if tree_data.eclass_index is not None:
+					tree_data.eclass_index.discard(cpv)
+
+		if tree_data.eclass_index is not None:
+			tree_data.eclass_index.save()
 
 	if not quiet:
 		# make sure the final progress is displayed
@@ -1,4 +1,4 @@
-# Copyright 2010-2014 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = (
@@ -9,7 +9,8 @@ from _emerge.Package import Package
 from portage import os
 from portage.dep import ExtendedAtomDict, _repo_separator, _slot_separator
 from portage.localization import _
-from portage.package.ebuild._config.helper import ordered_by_atom_specificity
+from portage.package.ebuild._config.helper import AtomIndex, \
+	ordered_by_atom_specificity
 from portage.util import grabdict_package, stack_lists, writemsg
 from portage.versions import _pkg_str
 
@@ -18,6 +19,10 @@ class KeywordsManager(object):
 
 	def __init__(self, profiles, abs_user_config, user_config=True,
 				global_accept_keywords=""):
+		# AtomIndex instances for the atoms that each of the package.*
+		# keywords files lists for a cp, created on demand.
+		self._atom_indexes = {}
+
 		self._pkeywords_list = []
 		rawpkeywords = [grabdict_package(
 			os.path.join(x.location, "package.keywords"),
@@ -76,6 +81,11 @@ class KeywordsManager(object):
 					v = tuple(v)
 				self.pkeywordsdict.setdefault(k.cp, {})[k] = v
 
+	def _atom_index(self, key, cpdict):
+		index = self._atom_indexes.get(key)
+		if index is None:
+			index = self._atom_indexes[key] = AtomIndex(cpdict)
+		return index
 
 	def getKeywords(self, cpv, slot, keywords, repo):
 		try:
@@ -86,10 +96,11 @@ class KeywordsManager(object):
 			pkg = cpv
 		cp = pkg.cp
 		keywords = [[x for x in keywords.split() if x != "-*"]]
-		for pkeywords_dict in self._pkeywords_list:
+		for i, pkeywords_dict in enumerate(self._pkeywords_list):
 			cpdict = pkeywords_dict.get(cp)
 			if cpdict:
-				pkg_keywords = ordered_by_atom_specificity(cpdict, pkg)
+				pkg_keywords = ordered_by_atom_specificity(cpdict, pkg,
+					index=self._atom_index(("keywords", i, cp), cpdict))
 				if pkg_keywords:
 					keywords.extend(pkg_keywords)
 		return stack_lists(keywords, incremental=True)
@@ -304,11 +315,12 @@ class KeywordsManager(object):
 		if self._p_accept_keywords:
 			accept_keywords_defaults = tuple('~' + keyword for keyword in \
 				pgroups if keyword[:1] not in "~-")
-			for d in self._p_accept_keywords:
+			for i, d in enumerate(self._p_accept_keywords):
 				cpdict = d.get(cp)
 				if cpdict:
-					pkg_accept_keywords = \
-						ordered_by_atom_specificity(cpdict, cpv)
+					pkg_accept_keywords = ordered_by_atom_specificity(
+						cpdict, cpv, index=self._atom_index(
+						("accept_keywords", i, cp), cpdict))
 					if pkg_accept_keywords:
 						for x in pkg_accept_keywords:
 							if not x:
@@ -317,8 +329,8 @@ class KeywordsManager(object):
 
 		pkgdict = self.pkeywordsdict.get(cp)
 		if pkgdict:
-			pkg_accept_keywords = \
-				ordered_by_atom_specificity(pkgdict, cpv)
+			pkg_accept_keywords = ordered_by_atom_specificity(pkgdict, cpv,
+				index=self._atom_index(("user", cp), pkgdict))
 			if pkg_accept_keywords:
 				for x in pkg_accept_keywords:
 					unmaskgroups.extend(x)
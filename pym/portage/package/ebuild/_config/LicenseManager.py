@@ -1,4 +1,4 @@
-# Copyright 2010-2015 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = (
@@ -17,6 +17,10 @@ from portage.package.ebuild._config.helper import ordered_by_atom_specificity
 
 class LicenseManager(object):
 
+	# Maximum number of per-package results that _getPkgAcceptLicense
+	# memoizes. The memo is cleared when it is full.
+	_memo_max_size = 4096
+
 	def __init__(self, license_group_locations, abs_user_config, user_config=True):
 
 		self._accept_license_str = None
@@ -24,6 +28,7 @@ class LicenseManager(object):
 		self._license_groups = {}
 		self._plicensedict = ExtendedAtomDict(dict)
 		self._undef_lic_groups = set()
+		self._pkg_accept_license_memo = {}
 
 		if user_config:
 			license_group_locations = list(license_group_locations) + [abs_user_config]
@@ -116,16 +121,28 @@ class LicenseManager(object):
 		Get an ACCEPT_LICENSE list, accounting for package.license.
 		"""
 		accept_license = self._accept_license
-		cp = cpv_getkey(cpv)
+		cp = getattr(cpv, "cp", None)
+		if cp is None:
+			cp = cpv_getkey(cpv)
 		cpdict = self._plicensedict.get(cp)
 		if cpdict:
 			if not hasattr(cpv, "slot"):
 				cpv = _pkg_str(cpv, slot=slot, repo=repo)
+			key = (cpv, getattr(cpv, "slot", None),
+				getattr(cpv, "sub_slot", None), getattr(cpv, "repo", None),
+				getattr(cpv, "build_id", None))
+			memo = self._pkg_accept_license_memo
+			result = memo.get(key)
+			if result is not None:
+				return result
 			plicence_list = ordered_by_atom_specificity(cpdict, cpv)
 			if plicence_list:
 				accept_license = list(self._accept_license)
 				for x in plicence_list:
 					accept_license.extend(x)
+			if len(memo) >= self._memo_max_size:
+				memo.clear()
+			memo[key] = accept_license
 		return accept_license
 
 	def get_prunned_accept_license(self, cpv, use, lic, slot, repo):
@@ -235,3 +252,4 @@ class LicenseManager(object):
 		if accept_license_str != self._accept_license_str:
 			self._accept_license_str = accept_license_str
 			self._accept_license = tuple(self.expandLicenseTokens(accept_license_str.split()))
+			self._pkg_accept_license_memo.clear()
@@ -1,4 +1,4 @@
-# Copyright 2010-2014 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = (
@@ -8,8 +8,9 @@ __all__ = (
 import warnings
 
 from portage import os
-from portage.dep import ExtendedAtomDict, match_from_list
+from portage.dep import ExtendedAtomDict
 from portage.localization import _
+from portage.package.ebuild._config.helper import AtomIndex
 from portage.util import append_repo, grabfile_package, stack_lists, writemsg
 from portage.versions import _pkg_str
 
@@ -22,6 +23,9 @@ class MaskManager(object):
 		# Preserves atoms that are eliminated by negative
 		# incrementals in user_pkgmasklines.
 		self._pmaskdict_raw = ExtendedAtomDict(list)
+		# AtomIndex instances for the atoms that _pmaskdict and
+		# _punmaskdict list for each cp, created on demand.
+		self._atom_indexes = {}
 
 		#Read profile/package.mask from every repo.
 		#Repositories inherit masks from their parent profiles and
@@ -179,7 +183,13 @@ class MaskManager(object):
 			for k, v in d.items():
 				d[k] = tuple(v)
 
-	def _getMaskAtom(self, cpv, slot, repo, unmask_atoms=None):
+	def _atom_index(self, key, atoms):
+		index = self._atom_indexes.get(key)
+		if index is None:
+			index = self._atom_indexes[key] = AtomIndex(atoms)
+		return index
+
+	def _getMaskAtom(self, cpv, slot, repo, unmask=False):
 		"""
 		Take a package and return a matching package.mask atom, or None if no
 		such atom exists or it has been cancelled by package.unmask. PROVIDE
@@ -191,8 +201,8 @@ class MaskManager(object):
 		@type slot: String
 		@param repo: The package's repository [optional]
 		@type repo: String
-		@param unmask_atoms: if desired pass in self._punmaskdict.get(cp)
-		@type unmask_atoms: list
+		@param unmask: whether to apply package.unmask
+		@type unmask: bool
 		@rtype: String
 		@return: A matching atom string or None if one is not found.
 		"""
@@ -205,17 +215,16 @@ class MaskManager(object):
 			pkg = cpv
 
 		mask_atoms = self._pmaskdict.get(pkg.cp)
-		if mask_atoms:
-			pkg_list = [pkg]
-			for x in mask_atoms:
-				if not match_from_list(x, pkg_list):
-					continue
-				if unmask_atoms:
-					for y in unmask_atoms:
-						if match_from_list(y, pkg_list):
-							return None
-				return x
-		return None
+		if not mask_atoms:
+			return None
+		mask_atom = self._atom_index(("mask", pkg.cp),
+			mask_atoms).first_match(pkg)
+		if mask_atom is not None and unmask:
+			unmask_atoms = self._punmaskdict.get(pkg.cp)
+			if unmask_atoms and self._atom_index(("unmask", pkg.cp),
+				unmask_atoms).first_match(pkg) is not None:
+				return None
+		return mask_atom
 
 
 	def getMaskAtom(self, cpv, slot, repo):
@@ -241,8 +250,7 @@ class MaskManager(object):
 		else:
 			pkg = cpv
 
-		return self._getMaskAtom(pkg, slot, repo,
-			self._punmaskdict.get(pkg.cp))
+		return self._getMaskAtom(pkg, slot, repo, unmask=True)
 
 
 	def getRawMaskAtom(self, cpv, slot, repo):
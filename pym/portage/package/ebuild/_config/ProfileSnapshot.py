@@ -0,0 +1,247 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+__all__ = (
+	'ProfileSnapshot',
+)
+
+import errno
+import gc
+import io
+import stat
+import sys
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+import portage
+from portage import os, _encodings, _unicode_encode
+from portage.const import CACHE_PATH, VCS_DIRS
+from portage.exception import PortageException
+from portage.localization import _
+from portage.process import atexit_register
+from portage.util import apply_secpass_permissions, atomic_ofstream, \
+	ensure_dirs, writemsg
+
+class ProfileSnapshot(object):
+	"""
+	A compiled snapshot of the parsed profile stack, repository profiles
+	and user configuration. While a snapshot is registered, the results
+	of grabfile, grabdict, grabfile_package and grabdict_package calls
+	for the files that it covers are loaded from the snapshot, which is
+	read from CACHE_PATH in one piece. Each result is validated against
+	the stat signatures of all files that contribute to it (every file
+	below a directory, and the corresponding eapi file), and it is
+	computed again if any of them have changed. Messages that were shown
+	while a result was computed, such as invalid atom warnings, are shown
+	again whenever the result is loaded.
+
+	Since results are pickled separately, every call returns new objects
+	that the caller is free to modify. Results are only computed for the
+	snapshot if it can be saved, which only root does. Since the snapshot
+	is unpickled, it is ignored unless it is owned by root or by the
+	current user.
+	"""
+
+	_snapshot_version = "1"
+
+	def __init__(self, eroot):
+		self.filename = os.path.join(eroot, CACHE_PATH,
+			"profile_snapshot.pickle")
+		self._eroot = eroot
+		self._roots = ()
+		self._entries = None
+		self._used = set()
+		self._modified = False
+		self._computing = False
+		self._save = None
+
+	@classmethod
+	def register(cls, eroot, roots):
+		"""
+		Return the snapshot for eroot, and make it cover the given
+		directories. The snapshot is created and registered with
+		portage.util if necessary, and it is saved at exit if it has
+		been modified.
+		"""
+		for snapshot in portage.util._profile_snapshots:
+			if snapshot._eroot == eroot:
+				break
+		else:
+			snapshot = cls(eroot)
+			portage.util._profile_snapshots.append(snapshot)
+			atexit_register(snapshot.flush)
+		snapshot.add_roots(roots)
+		return snapshot
+
+	def add_roots(self, roots):
+		new_roots = set(self._roots)
+		for root in roots:
+			if root:
+				for path in (root, os.path.realpath(root)):
+					new_roots.add(path.rstrip(os.sep) + os.sep)
+		self._roots = tuple(sorted(new_roots))
+
+	def covers(self, filename):
+		if self._computing:
+			return False
+		for root in self._roots:
+			if filename.startswith(root):
+				return True
+		return False
+
+	def call(self, func, filename, args, kwargs):
+		"""
+		Return the result of func(filename, *args, **kwargs), from the
+		snapshot if possible.
+		"""
+		key = (func.__name__, filename, args,
+			tuple(sorted(kwargs.items())))
+		try:
+			hash(key)
+		except TypeError:
+			return func(filename, *args, **kwargs)
+
+		entry = self._load().get(key)
+		if entry is None and not self._can_save():
+			return func(filename, *args, **kwargs)
+
+		signature = self._signature(filename)
+		if signature is None:
+			return func(filename, *args, **kwargs)
+
+		self._used.add(key)
+		if entry is not None and entry[0] == signature:
+			# Unpickling creates many objects at once, so avoid the
+			# cost of repeated garbage collection while it runs.
+			gc_enabled = gc.isenabled()
+			gc.disable()
+			try:
+				result = pickle.loads(entry[1])
+			finally:
+				if gc_enabled:
+					gc.enable()
+			if entry[2]:
+				writemsg(entry[2], noiselevel=-1)
+			return result
+
+		if not self._can_save():
+			return func(filename, *args, **kwargs)
+
+		stderr_orig = sys.stderr
+		out = io.StringIO()
+		self._computing = True
+		try:
+			sys.stderr = out
+			result = func(filename, *args, **kwargs)
+		finally:
+			sys.stderr = stderr_orig
+			self._computing = False
+			messages = out.getvalue()
+			if messages:
+				writemsg(messages, noiselevel=-1)
+
+		self._entries[key] = (signature,
+			pickle.dumps(result, protocol=2), messages)
+		self._modified = True
+		return result
+
+	def _can_save(self):
+		# This does not use secpass, since snapshots are used while
+		# the config that secpass is initialized from is created.
+		if self._save is None:
+			self._save = os.geteuid() == 0 and os.path.isdir(self._eroot)
+		return self._save
+
+	def _signature(self, filename):
+		"""
+		Return the stat signature of filename, including everything
+		below it if it is a directory, and the eapi file in the same
+		directory. Return None if something could not be accessed,
+		since the result should not be cached in that case.
+		"""
+		signature = []
+		stack = [filename, os.path.join(os.path.dirname(filename), "eapi")]
+		stack.reverse()
+		while stack:
+			path = stack.pop()
+			try:
+				st = os.stat(path)
+			except OSError as e:
+				if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.ESTALE):
+					return None
+				signature.append((path, None))
+				continue
+
+			signature.append((path, st.st_mtime, st.st_size))
+			if stat.S_ISDIR(st.st_mode):
+				try:
+					children = os.listdir(path)
+				except OSError:
+					return None
+				children.sort(reverse=True)
+				stack.extend(os.path.join(path, x) for x in children
+					if x not in VCS_DIRS)
+		return tuple(signature)
+
+	def _load(self):
+		if self._entries is not None:
+			return self._entries
+
+		snapshot = None
+		try:
+			with open(_unicode_encode(self.filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				# Unpickling a file that another user could have
+				# written would allow them to run code as this user.
+				if os.fstat(f.fileno()).st_uid in (0, os.geteuid()):
+					snapshot = pickle.load(f)
+		except (SystemExit, KeyboardInterrupt):
+			raise
+		except Exception as e:
+			if isinstance(e, EnvironmentError) and \
+				getattr(e, 'errno', None) in (errno.ENOENT, errno.EACCES):
+				pass
+			else:
+				writemsg(_("!!! Error loading '%s': %s\n") % \
+					(self.filename, e), noiselevel=-1)
+			del e
+
+		if not isinstance(snapshot, dict) or \
+			snapshot.get("version") != self._snapshot_version or \
+			snapshot.get("portage_version") != portage.VERSION or \
+			not isinstance(snapshot.get("entries"), dict):
+			snapshot = {"entries": {}}
+
+		self._entries = snapshot["entries"]
+		return self._entries
+
+	def flush(self):
+		"""
+		Save the snapshot if it has been modified, and the current user
+		has permission. Entries that have not been used by this process
+		are discarded if their file no longer exists.
+		"""
+		if not self._modified or not self._can_save():
+			return
+
+		entries = dict((k, v) for k, v in self._entries.items()
+			if k in self._used or os.path.exists(k[1]))
+
+		try:
+			ensure_dirs(os.path.dirname(self.filename))
+			f = atomic_ofstream(self.filename, 'wb')
+			pickle.dump({
+				"version": self._snapshot_version,
+				"portage_version": portage.VERSION,
+				"entries": entries,
+			}, f, protocol=2)
+			f.close()
+			apply_secpass_permissions(self.filename, mode=0o644)
+		except (IOError, OSError, PortageException) as e:
+			writemsg(_("!!! Error saving '%s': %s\n") % \
+				(self.filename, e), noiselevel=-1)
+		else:
+			self._modified = False
@@ -1,10 +1,12 @@
-# Copyright 2010-2014 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = (
 	'UseManager',
 )
 
+from itertools import chain
+
 from _emerge.Package import Package
 from portage import os
 from portage.dep import Atom, dep_getrepo, dep_getslot, ExtendedAtomDict, remove_slot, _get_useflag_re, _repo_separator
@@ -107,6 +109,27 @@ class UseManager(object):
 
 		self.repositories = repositories
 
+		# The layers that getUseMask and getUseForce stack, in the
+		# order (repositories, then profiles) that they are stacked.
+		self._use_stack_layers = {
+			"mask": (self._repo_usemask_dict, self._repo_usestablemask_dict,
+				self._repo_pusemask_dict, self._repo_pusestablemask_dict,
+				self._usemask_list, self._usestablemask_list,
+				self._pusemask_list, self._pusestablemask_list),
+			"force": (self._repo_useforce_dict, self._repo_usestableforce_dict,
+				self._repo_puseforce_dict, self._repo_pusestableforce_dict,
+				self._useforce_list, self._usestableforce_list,
+				self._puseforce_list, self._pusestableforce_list),
+		}
+		self._use_stack_cps = {}
+		self._use_stack_base = {}
+		self._pkg_repos_cache = {}
+		self._memo = {}
+
+	# Maximum number of per-package results that getUseMask, getUseForce
+	# and getPUSE memoize. The memo is cleared when it is full.
+	_memo_max_size = 4096
+
 	def _parse_file_to_tuple(self, file_name, recursive=True,
 		eapi_filter=None, eapi=None, eapi_default="0"):
 		"""
@@ -381,25 +404,27 @@ class UseManager(object):
 		# stable check against the correct profile here.
 		return self._is_stable(pkg)
 
-	def getUseMask(self, pkg=None, stable=None):
-		if pkg is None:
-			return frozenset(stack_lists(
-				self._usemask_list, incremental=True))
+	@staticmethod
+	def _pkg_memo_key(pkg):
+		return (pkg.cpv, getattr(pkg, "slot", None),
+			getattr(pkg, "sub_slot", None), getattr(pkg, "repo", None),
+			getattr(pkg, "build_id", None))
 
-		slot = None
-		cp = getattr(pkg, "cp", None)
-		if cp is None:
-			slot = dep_getslot(pkg)
-			repo = dep_getrepo(pkg)
-			pkg = _pkg_str(remove_slot(pkg), slot=slot, repo=repo)
-			cp = pkg.cp
-
-		if stable is None:
-			stable = self._isStable(pkg)
+	def _memoize(self, key, value):
+		if len(self._memo) >= self._memo_max_size:
+			self._memo.clear()
+		self._memo[key] = value
+		return value
 
-		usemask = []
-
-		if hasattr(pkg, "repo") and pkg.repo != Package.UNKNOWN_REPO:
+	def _pkg_repos(self, pkg):
+		"""
+		Return the names of the masters of the repository of pkg,
+		followed by the name of the repository itself.
+		"""
+		if not hasattr(pkg, "repo") or pkg.repo == Package.UNKNOWN_REPO:
+			return ()
+		repos = self._pkg_repos_cache.get(pkg.repo)
+		if repos is None:
 			repos = []
 			try:
 				repos.extend(repo.name for repo in
@@ -407,46 +432,84 @@ class UseManager(object):
 			except KeyError:
 				pass
 			repos.append(pkg.repo)
-			for repo in repos:
-				usemask.append(self._repo_usemask_dict.get(repo, {}))
-				if stable:
-					usemask.append(self._repo_usestablemask_dict.get(repo, {}))
-				cpdict = self._repo_pusemask_dict.get(repo, {}).get(cp)
+			repos = tuple(repos)
+			self._pkg_repos_cache[pkg.repo] = repos
+		return repos
+
+	def _has_package_layers(self, kind, cp):
+		"""
+		Return True if any package.use.mask or package.use.force file
+		(depending on kind) may contain an atom that matches cp.
+		"""
+		cps = self._use_stack_cps.get(kind)
+		if cps is None:
+			repo_pflags, repo_stable_pflags = \
+				self._use_stack_layers[kind][2:4]
+			pflags, stable_pflags = self._use_stack_layers[kind][6:8]
+			cps = set()
+			for d in chain(repo_pflags.values(),
+				repo_stable_pflags.values(), pflags, stable_pflags):
+				if isinstance(d, ExtendedAtomDict) and d._extended:
+					# Wildcard atoms may match any package.
+					cps = None
+					break
+				cps.update(d)
+			self._use_stack_cps[kind] = cps
+		return cps is None or cp in cps
+
+	def _stack_use_layers(self, kind, pkg, cp, stable, repos):
+		"""
+		Stack the use.mask or use.force layers (depending on kind) that
+		apply to pkg. If pkg is None, then only the global layers are
+		stacked, which is the result for any package that has no
+		package-specific settings.
+		"""
+		repo_flags, repo_stable_flags, repo_pflags, repo_stable_pflags, \
+			flags, stable_flags, pflags, stable_pflags = \
+			self._use_stack_layers[kind]
+
+		useflags = []
+
+		for repo in repos:
+			useflags.append(repo_flags.get(repo, {}))
+			if stable:
+				useflags.append(repo_stable_flags.get(repo, {}))
+			if pkg is None:
+				continue
+			cpdict = repo_pflags.get(repo, {}).get(cp)
+			if cpdict:
+				pkg_useflags = ordered_by_atom_specificity(cpdict, pkg)
+				if pkg_useflags:
+					useflags.extend(pkg_useflags)
+			if stable:
+				cpdict = repo_stable_pflags.get(repo, {}).get(cp)
 				if cpdict:
-					pkg_usemask = ordered_by_atom_specificity(cpdict, pkg)
-					if pkg_usemask:
-						usemask.extend(pkg_usemask)
-				if stable:
-					cpdict = self._repo_pusestablemask_dict.get(repo, {}).get(cp)
-					if cpdict:
-						pkg_usemask = ordered_by_atom_specificity(cpdict, pkg)
-						if pkg_usemask:
-							usemask.extend(pkg_usemask)
-
-		for i, pusemask_dict in enumerate(self._pusemask_list):
-			if self._usemask_list[i]:
-				usemask.append(self._usemask_list[i])
-			if stable and self._usestablemask_list[i]:
-				usemask.append(self._usestablemask_list[i])
-			cpdict = pusemask_dict.get(cp)
+					pkg_useflags = ordered_by_atom_specificity(cpdict, pkg)
+					if pkg_useflags:
+						useflags.extend(pkg_useflags)
+
+		for i, pflags_dict in enumerate(pflags):
+			if flags[i]:
+				useflags.append(flags[i])
+			if stable and stable_flags[i]:
+				useflags.append(stable_flags[i])
+			if pkg is None:
+				continue
+			cpdict = pflags_dict.get(cp)
 			if cpdict:
-				pkg_usemask = ordered_by_atom_specificity(cpdict, pkg)
-				if pkg_usemask:
-					usemask.extend(pkg_usemask)
+				pkg_useflags = ordered_by_atom_specificity(cpdict, pkg)
+				if pkg_useflags:
+					useflags.extend(pkg_useflags)
 			if stable:
-				cpdict = self._pusestablemask_list[i].get(cp)
+				cpdict = stable_pflags[i].get(cp)
 				if cpdict:
-					pkg_usemask = ordered_by_atom_specificity(cpdict, pkg)
-					if pkg_usemask:
-						usemask.extend(pkg_usemask)
+					pkg_useflags = ordered_by_atom_specificity(cpdict, pkg)
+					if pkg_useflags:
+						useflags.extend(pkg_useflags)
 
-		return frozenset(stack_lists(usemask, incremental=True))
-
-	def getUseForce(self, pkg=None, stable=None):
-		if pkg is None:
-			return frozenset(stack_lists(
-				self._useforce_list, incremental=True))
+		return frozenset(stack_lists(useflags, incremental=True))
 
+	def _getUseStack(self, kind, pkg, stable):
 		cp = getattr(pkg, "cp", None)
 		if cp is None:
 			slot = dep_getslot(pkg)
@@ -456,51 +519,40 @@ class UseManager(object):
 
 		if stable is None:
 			stable = self._isStable(pkg)
+		stable = bool(stable)
+
+		repos = self._pkg_repos(pkg)
+
+		if not self._has_package_layers(kind, cp):
+			# Most packages share the result of the global layers.
+			key = (kind, repos, stable)
+			result = self._use_stack_base.get(key)
+			if result is None:
+				result = self._stack_use_layers(kind, None, cp,
+					stable, repos)
+				self._use_stack_base[key] = result
+			return result
+
+		key = (kind, stable) + self._pkg_memo_key(pkg)
+		result = self._memo.get(key)
+		if result is None:
+			result = self._memoize(key,
+				self._stack_use_layers(kind, pkg, cp, stable, repos))
+		return result
 
-		useforce = []
+	def getUseMask(self, pkg=None, stable=None):
+		if pkg is None:
+			return frozenset(stack_lists(
+				self._usemask_list, incremental=True))
 
-		if hasattr(pkg, "repo") and pkg.repo != Package.UNKNOWN_REPO:
-			repos = []
-			try:
-				repos.extend(repo.name for repo in
-					self.repositories[pkg.repo].masters)
-			except KeyError:
-				pass
-			repos.append(pkg.repo)
-			for repo in repos:
-				useforce.append(self._repo_useforce_dict.get(repo, {}))
-				if stable:
-					useforce.append(self._repo_usestableforce_dict.get(repo, {}))
-				cpdict = self._repo_puseforce_dict.get(repo, {}).get(cp)
-				if cpdict:
-					pkg_useforce = ordered_by_atom_specificity(cpdict, pkg)
-					if pkg_useforce:
-						useforce.extend(pkg_useforce)
-				if stable:
-					cpdict = self._repo_pusestableforce_dict.get(repo, {}).get(cp)
-					if cpdict:
-						pkg_useforce = ordered_by_atom_specificity(cpdict, pkg)
-						if pkg_useforce:
-							useforce.extend(pkg_useforce)
-
-		for i, puseforce_dict in enumerate(self._puseforce_list):
-			if self._useforce_list[i]:
-				useforce.append(self._useforce_list[i])
-			if stable and self._usestableforce_list[i]:
-				useforce.append(self._usestableforce_list[i])
-			cpdict = puseforce_dict.get(cp)
-			if cpdict:
-				pkg_useforce = ordered_by_atom_specificity(cpdict, pkg)
-				if pkg_useforce:
-					useforce.extend(pkg_useforce)
-			if stable:
-				cpdict = self._pusestableforce_list[i].get(cp)
-				if cpdict:
-					pkg_useforce = ordered_by_atom_specificity(cpdict, pkg)
-					if pkg_useforce:
-						useforce.extend(pkg_useforce)
+		return self._getUseStack("mask", pkg, stable)
+
+	def getUseForce(self, pkg=None, stable=None):
+		if pkg is None:
+			return frozenset(stack_lists(
+				self._useforce_list, incremental=True))
 
-		return frozenset(stack_lists(useforce, incremental=True))
+		return self._getUseStack("force", pkg, stable)
 
 	def getUseAliases(self, pkg):
 		if hasattr(pkg, "eapi") and not eapi_has_use_aliases(pkg.eapi):
@@ -556,12 +608,18 @@ class UseManager(object):
 		ret = ""
 		cpdict = self._pusedict.get(cp)
 		if cpdict:
+			key = ("puse",) + self._pkg_memo_key(pkg)
+			ret = self._memo.get(key)
+			if ret is not None:
+				return ret
+			ret = ""
 			puse_matches = ordered_by_atom_specificity(cpdict, pkg)
 			if puse_matches:
 				puse_list = []
 				for x in puse_matches:
 					puse_list.extend(x)
 				ret = " ".join(puse_list)
+			self._memoize(key, ret)
 		return ret
 
 	def extract_global_USE_changes(self, old=""):
@@ -1,14 +1,193 @@
-# Copyright 2010-2012 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = (
-	'ordered_by_atom_specificity', 'prune_incremental',
+	'AtomIndex', 'ordered_by_atom_specificity', 'prune_incremental',
 )
 
+from bisect import bisect_left, bisect_right
+
 from _emerge.Package import Package
-from portage.dep import best_match_to_list, _repo_separator
+from portage.dep import best_match_to_list, match_from_list, _repo_separator
+from portage.util import cmp_sort_key
+from portage.versions import vercmp
 
-def ordered_by_atom_specificity(cpdict, pkg, repo=None):
+class AtomIndex(object):
+	"""
+	An index of the atoms that a package.* config file lists for a
+	particular cp, which finds the atoms that match a package without
+	calling match_from_list for each of them. Versioned atoms are split
+	by operator and sorted by version, so that the atoms whose version
+	ranges contain the version of the package are found by bisection,
+	and ~ atoms are found by a dict lookup. Only the candidates found
+	this way are checked with match_from_list, which applies the slot,
+	repository and build-id parts of the atoms. Atoms with extended
+	syntax and =* atoms are always checked.
+	"""
+
+	__slots__ = ('_atoms', '_ranges', '_tilde', '_unversioned')
+
+	_version_key = cmp_sort_key(vercmp)
+
+	def __init__(self, atoms):
+		"""
+		@param atoms: atoms, in the order that they are listed
+		@type atoms: iterable
+		"""
+		self._atoms = tuple(atoms)
+		self._tilde = {}
+		self._unversioned = []
+		ranges = {}
+		for i, atom in enumerate(self._atoms):
+			if atom.extended_syntax or atom.operator in (None, "=*"):
+				self._unversioned.append(i)
+			elif atom.operator == "~":
+				self._tilde.setdefault(atom.cpv.cpv_split[2], []).append(i)
+			else:
+				ranges.setdefault(atom.operator, []).append(
+					(self._version_key(atom.version), i))
+
+		self._ranges = []
+		for operator, entries in ranges.items():
+			entries.sort(key=lambda x: x[0])
+			self._ranges.append((operator,
+				[x[0] for x in entries], [x[1] for x in entries]))
+
+	def _candidates(self, pkg):
+		"""
+		Return the indexes of the atoms that may match pkg, in the
+		order that the atoms are listed.
+		"""
+		candidates = list(self._unversioned)
+		if self._tilde:
+			candidates.extend(self._tilde.get(pkg.cpv_split[2], ()))
+		if self._ranges:
+			version = self._version_key(pkg.version)
+			for operator, keys, indexes in self._ranges:
+				if operator == "=":
+					candidates.extend(indexes[bisect_left(keys, version):
+						bisect_right(keys, version)])
+				elif operator == ">=":
+					candidates.extend(indexes[:bisect_right(keys, version)])
+				elif operator == ">":
+					candidates.extend(indexes[:bisect_left(keys, version)])
+				elif operator == "<=":
+					candidates.extend(indexes[bisect_left(keys, version):])
+				else:
+					candidates.extend(indexes[bisect_right(keys, version):])
+		candidates.sort()
+		return candidates
+
+	def match(self, pkg):
+		"""
+		Return the atoms that match pkg, in the order that they are
+		listed.
+
+		@param pkg: a package, which has cpv_split and version attributes
+		@type pkg: _pkg_str or Package
+		@rtype: list
+		"""
+		pkg_list = [pkg]
+		return [self._atoms[i] for i in self._candidates(pkg)
+			if match_from_list(self._atoms[i], pkg_list)]
+
+	def first_match(self, pkg):
+		"""
+		Return the first atom that matches pkg, or None if none does.
+
+		@param pkg: a package, which has cpv_split and version attributes
+		@type pkg: _pkg_str or Package
+		@rtype: Atom
+		"""
+		pkg_list = [pkg]
+		for i in self._candidates(pkg):
+			if match_from_list(self._atoms[i], pkg_list):
+				return self._atoms[i]
+		return None
+
+	def match_by_specificity(self, pkg):
+		"""
+		Return the atoms that match pkg, in ascending order by atom
+		specificity. The order is the same as that of repeated calls to
+		best_match_to_list, but the atoms are grouped by the values that
+		best_match_to_list assigns to them, and versions are compared only
+		once, so that it takes much less time for many atoms.
+
+		@param pkg: a package, which has cpv_split and version attributes
+		@type pkg: _pkg_str or Package
+		@rtype: list
+		"""
+		groups = {}
+		for atom in self.match(pkg):
+			if atom.extended_syntax:
+				if atom.operator == "=*":
+					value = 0
+				elif atom.slot is not None:
+					value = -1
+				else:
+					value = -2
+			else:
+				value = self._operator_values[atom.operator]
+				if atom.slot is not None:
+					value = max(value, 3)
+			groups.setdefault(value, []).append(atom)
+
+		results = []
+		for value in sorted(groups, reverse=True):
+			if value == 2:
+				results.extend(self._closest_first(pkg, groups[value]))
+			else:
+				results.extend(groups[value])
+
+		# reverse, so the most specific atoms come last
+		results.reverse()
+		return results
+
+	_operator_values = {'=':6, '~':5, '=*':4,
+		'>':2, '<':2, '>=':2, '<=':2, None:1}
+
+	@classmethod
+	def _closest_first(cls, pkg, atoms):
+		"""
+		Order >, <, >= and <= atoms without slots like best_match_to_list
+		does, which prefers the atom with the version closest to that of
+		pkg. Versions are replaced with their ranks, so that they are
+		compared with vercmp only while they are sorted.
+		"""
+		pkg_cpv = pkg.cpv
+		versions = sorted(set([pkg.version] + [x.version for x in atoms]),
+			key=cls._version_key)
+		ranks = {}
+		rank = 0
+		for i, version in enumerate(versions):
+			if i and vercmp(versions[i - 1], version) != 0:
+				rank += 1
+			ranks[version] = rank
+		pkg_rank = ranks[pkg.version]
+
+		results = []
+		remaining = list(atoms)
+		while remaining:
+			bestm = remaining[0]
+			for x in remaining[1:]:
+				if bestm.cpv == pkg_cpv or bestm.cpv == x.cpv:
+					pass
+				elif x.cpv == pkg_cpv:
+					bestm = x
+				else:
+					# Sort the cpvs to find the one closest to pkg_cpv,
+					# where sorted() is stable like list.sort().
+					cpv_list = sorted(((ranks[bestm.version], 0),
+						(pkg_rank, 1), (ranks[x.version], 2)),
+						key=lambda y: y[0])
+					if cpv_list[0][1] == 1 or cpv_list[-1][1] == 1:
+						if cpv_list[1][1] == 2:
+							bestm = x
+			remaining.remove(bestm)
+			results.append(bestm)
+		return results
+
+def ordered_by_atom_specificity(cpdict, pkg, repo=None, index=None):
 	"""
 	Return a list of matched values from the given cpdict,
 	in ascending order by atom specificity. The rationale
@@ -23,10 +202,17 @@ def ordered_by_atom_specificity(cpdict, pkg, repo=None):
 	to the order that atoms are listed in the config file in
 	order to achieve desired results (and thus corrupting
 	the ChangeLog like ordering of the file).
+
+	If an AtomIndex of the keys of cpdict is given, then it is used to
+	find the matching atoms, in which case pkg must be a _pkg_str or
+	Package instance.
 	"""
 	if not hasattr(pkg, 'repo') and repo and repo != Package.UNKNOWN_REPO:
 		pkg = pkg + _repo_separator + repo
 
+	if index is not None:
+		return [cpdict[x] for x in index.match_by_specificity(pkg)]
+
 	results = []
 	keys = list(cpdict)
 
@@ -0,0 +1,295 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import itertools
+import json
+import time
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.checksum import checksum_str, get_valid_checksum_keys
+from portage.util import atomic_ofstream, writemsg
+from portage.util.configparser import (ConfigParserError, RawConfigParser,
+	read_configs)
+
+LAYOUT_CONF = "layout.conf"
+
+
+class FlatLayout(object):
+	"""All distfiles are stored in the top directory."""
+
+	def get_path(self, filename):
+		return filename
+
+	@staticmethod
+	def verify_args(args):
+		return len(args) == 1
+
+
+class FilenameHashLayout(object):
+	"""
+	Distfiles are stored in sub-directories named after leading parts
+	of the hex digest of the file name. The cutoffs are the numbers of
+	digest bits used for each directory level, so that the structure
+	"filename-hash BLAKE2B 8" stores foo.tar.gz in a directory named
+	after the first two hex digits of the BLAKE2B digest of its name.
+	"""
+
+	def __init__(self, algo, cutoffs):
+		self.algo = algo
+		self.cutoffs = [int(x) for x in cutoffs.split(":")]
+
+	def get_path(self, filename):
+		fnhash = checksum_str(_unicode_encode(filename,
+			encoding=_encodings["fs"], errors="strict"), self.algo)
+		path = []
+		for cutoff in self.cutoffs:
+			length = cutoff // 4
+			path.append(fnhash[:length])
+			fnhash = fnhash[length:]
+		path.append(filename)
+		return "/".join(path)
+
+	@staticmethod
+	def verify_args(args):
+		if len(args) != 3:
+			return False
+		if args[1] not in get_valid_checksum_keys():
+			return False
+		for cutoff in args[2].split(":"):
+			try:
+				cutoff = int(cutoff)
+			except ValueError:
+				return False
+			if cutoff <= 0 or cutoff % 4 != 0:
+				return False
+		return True
+
+
+class MirrorLayoutConfig(object):
+	"""
+	The [structure] section of a layout.conf file, which lists the
+	layouts of a distfiles directory in the order of preference:
+
+		[structure]
+		0=filename-hash BLAKE2B 8
+		1=flat
+
+	New files are stored under the first supported layout, and the
+	remaining layouts may still be used to look files up.
+	"""
+
+	def __init__(self):
+		self.structure = ()
+
+	def read_from_file(self, f):
+		"""
+		Read the structure from the given path or io.StringIO. This may
+		raise a ConfigParserError for a malformed file.
+		"""
+		cp = RawConfigParser()
+		read_configs(cp, [f])
+		vals = []
+		for i in itertools.count():
+			try:
+				vals.append(tuple(cp.get("structure", "%d" % i).split()))
+			except ConfigParserError:
+				break
+		self.structure = tuple(x for x in vals if x)
+
+	def serialize(self):
+		return self.structure
+
+	def deserialize(self, data):
+		self.structure = tuple(tuple(x) for x in data)
+
+	@staticmethod
+	def validate_structure(val):
+		if val[0] == "flat":
+			return FlatLayout.verify_args(val)
+		if val[0] == "filename-hash":
+			return FilenameHashLayout.verify_args(val)
+		return False
+
+	@staticmethod
+	def _make_layout(val):
+		if val[0] == "flat":
+			return FlatLayout()
+		return FilenameHashLayout(*val[1:])
+
+	def get_all_layouts(self):
+		"""
+		Return the supported layouts in the order of preference. Since
+		files can always be found under the flat layout, it is returned
+		for an empty or unsupported structure.
+		"""
+		layouts = [self._make_layout(val) for val in self.structure
+			if self.validate_structure(val)]
+		if not layouts:
+			layouts.append(FlatLayout())
+		return layouts
+
+
+_flat_layouts = (FlatLayout(),)
+_directory_layouts = {}
+
+def directory_layouts(directory):
+	"""
+	Return the layouts of a local distfiles directory, as described by
+	its layout.conf file, in the order of preference. Results are
+	cached until the layout.conf file changes.
+	"""
+	conf_path = os.path.join(directory, LAYOUT_CONF)
+	try:
+		st = os.stat(conf_path)
+	except OSError:
+		return _flat_layouts
+
+	key = (st.st_ino, st.st_size, st.st_mtime)
+	cached = _directory_layouts.get(directory)
+	if cached is not None and cached[0] == key:
+		return cached[1]
+
+	conf = MirrorLayoutConfig()
+	try:
+		conf.read_from_file(conf_path)
+	except ConfigParserError as e:
+		writemsg("!!! Invalid layout.conf: %s: %s\n" % (conf_path, e),
+			noiselevel=-1)
+	layouts = tuple(conf.get_all_layouts())
+	_directory_layouts[directory] = (key, layouts)
+	return layouts
+
+def lookup_layouts(layouts):
+	"""
+	Return the layouts under which existing files are looked up, which
+	are the given layouts followed by the flat layout.
+	"""
+	if any(isinstance(layout, FlatLayout) for layout in layouts):
+		return tuple(layouts)
+	return tuple(layouts) + _flat_layouts
+
+def distfile_path(directory, filename, layouts=None):
+	"""
+	Return the path of a distfile in a local distfiles directory. If the
+	file exists under any of the layouts of the directory, or under the
+	flat layout, then that path is returned. Otherwise, the path under
+	the primary layout is returned, which is where the file should be
+	stored.
+	"""
+	if layouts is None:
+		layouts = directory_layouts(directory)
+	primary = os.path.join(directory, layouts[0].get_path(filename))
+	if isinstance(layouts[0], FlatLayout):
+		return primary
+	for layout in lookup_layouts(layouts):
+		path = os.path.join(directory, layout.get_path(filename))
+		if os.path.lexists(path):
+			return path
+	return primary
+
+def walk_distfiles(directory, layouts=None):
+	"""
+	Generate a (filename, path) pair for each file stored under one of
+	the layouts of a distfiles directory (or under the flat layout).
+	The tree is walked one directory at a time, so that large trees do
+	not have to be listed up front. Hidden directories are skipped, as
+	well as files that are not at the location assigned to their name,
+	such as layout.conf or temporary files.
+	"""
+	if layouts is None:
+		layouts = directory_layouts(directory)
+	layouts = lookup_layouts(layouts)
+	for dirpath, dirnames, filenames in os.walk(directory):
+		dirnames[:] = [x for x in dirnames if not x.startswith(b".")]
+		try:
+			dirpath = _unicode_decode(dirpath,
+				encoding=_encodings["fs"], errors="strict")
+		except UnicodeDecodeError:
+			continue
+		relative = os.path.relpath(dirpath, directory)
+		for filename in filenames:
+			try:
+				filename = _unicode_decode(filename,
+					encoding=_encodings["fs"], errors="strict")
+			except UnicodeDecodeError:
+				continue
+			if relative == os.curdir:
+				relpath = filename
+				if filename == LAYOUT_CONF:
+					continue
+			else:
+				relpath = relative.replace(os.sep, "/") + "/" + filename
+			if any(layout.get_path(filename) == relpath
+				for layout in layouts):
+				yield filename, os.path.join(dirpath, filename)
+
+
+class MirrorLayoutCache(object):
+	"""
+	A persistent cache of the layout.conf structures of remote mirrors,
+	so that they are retrieved at most once per ttl seconds.
+	"""
+
+	_format_version = 1
+	ttl = 24 * 60 * 60
+
+	def __init__(self, filename, clock=None):
+		self.filename = filename
+		self._clock = clock or time.time
+		self._mirrors = None
+
+	def _load(self):
+		self._mirrors = {}
+		try:
+			with open(_unicode_encode(self.filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				content = f.read()
+		except EnvironmentError:
+			return
+		try:
+			d = json.loads(_unicode_decode(content,
+				encoding=_encodings['repo.content'], errors='strict'))
+		except ValueError:
+			return
+		if isinstance(d, dict) and \
+			d.get("version") == self._format_version and \
+			isinstance(d.get("mirrors"), dict):
+			self._mirrors = d["mirrors"]
+
+	def get(self, mirror):
+		"""
+		Return the cached structure of the mirror, or None if there is
+		no entry that is recent enough.
+		"""
+		if self._mirrors is None:
+			self._load()
+		try:
+			timestamp, structure = self._mirrors[mirror]
+			if not 0 <= self._clock() - float(timestamp) < self.ttl:
+				return None
+			conf = MirrorLayoutConfig()
+			conf.deserialize(structure)
+		except (KeyError, TypeError, ValueError):
+			return None
+		return conf
+
+	def set(self, mirror, conf):
+		if self._mirrors is None:
+			self._load()
+		self._mirrors[mirror] = [self._clock(), conf.serialize()]
+		try:
+			f = atomic_ofstream(self.filename)
+			f.write(json.dumps({
+				"version": self._format_version,
+				"mirrors": self._mirrors,
+			}, sort_keys=True))
+			f.close()
+		except EnvironmentError as e:
+			# The cache is an optimization, so an unprivileged user
+			# simply retrieves the layout again next time.
+			if e.errno not in (errno.EACCES, errno.EPERM, errno.ENOENT,
+				errno.EROFS):
+				writemsg("!!! Failed to write mirror layout cache: "
+					"%s: %s\n" % (self.filename, e), noiselevel=-1)
@@ -0,0 +1,271 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import errno
+import json
+import random
+import time
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
+
+try:
+	from urllib.parse import urlparse
+except ImportError:
+	from urlparse import urlparse
+
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.exception import PortageException
+from portage.locks import lockfile, unlockfile
+from portage.util import atomic_ofstream, writemsg
+
+
+def mirror_key(uri):
+	"""
+	Return the key under which statistics for the server of the given
+	URI are recorded, or None for URIs without a network location.
+	"""
+	parsed = urlparse(uri)
+	if not (parsed.scheme and parsed.netloc):
+		return None
+	return "%s://%s" % (parsed.scheme.lower(),
+		parsed.netloc.rpartition("@")[2].lower())
+
+
+class MirrorStats(object):
+	"""
+	A persistent store of per-mirror download statistics, used to try
+	mirrors in the order of their predicted fetch time.
+
+	For each mirror the store keeps exponentially decayed counts of
+	successful and failed downloads, and moving averages of the time to
+	first byte and of the throughput. The predicted cost of a mirror is
+	its expected time to deliver reference_size bytes, plus a penalty
+	of failure_penalty seconds weighted by its estimated failure rate.
+	Since counts decay with a half life of half_life seconds, mirrors
+	that recover are eventually preferred again, and a fraction
+	probe_rate of orderings moves a rarely used mirror to the front so
+	that fresh statistics keep being gathered.
+
+	Observations are applied in memory as they are recorded, and merged
+	into the file by save(), so that concurrent processes sharing the
+	file do not lose each other's updates.
+	"""
+
+	_format_version = 1
+
+	half_life = 7 * 24 * 60 * 60
+	probe_rate = 0.05
+	failure_penalty = 60.0
+	reference_size = 1024 * 1024
+
+	_ewma_alpha = 0.3
+	_default_ttfb = 1.0
+	_default_rate = 1024 * 1024
+	# Mirrors with fewer (decayed) samples than this may be probed.
+	_probe_samples = 3.0
+	# Entries which have not been updated for this many half lives
+	# carry no information anymore, and are dropped on save.
+	_expire_half_lives = 10
+
+	def __init__(self, filename, clock=None, rng=None):
+		self.filename = filename
+		self._clock = clock or time.time
+		self._random = rng or random.Random()
+		self._stats = {}
+		self._observations = []
+		self._lock = threading.Lock()
+
+	def _read(self):
+		try:
+			with open(_unicode_encode(self.filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				content = f.read()
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				writemsg("!!! Failed to read mirror statistics: %s: %s\n" %
+					(self.filename, e), noiselevel=-1)
+			return {}
+
+		try:
+			d = json.loads(_unicode_decode(content,
+				encoding=_encodings['repo.content'], errors='strict'))
+		except ValueError:
+			return {}
+		if not isinstance(d, dict) or \
+			d.get("version") != self._format_version or \
+			not isinstance(d.get("mirrors"), dict):
+			return {}
+
+		stats = {}
+		for key, record in d["mirrors"].items():
+			try:
+				stats[key] = {
+					"ok": float(record["ok"]),
+					"fail": float(record["fail"]),
+					"ttfb": None if record.get("ttfb") is None
+						else float(record["ttfb"]),
+					"rate": None if record.get("rate") is None
+						else float(record["rate"]),
+					"time": float(record["time"]),
+				}
+			except (KeyError, TypeError, ValueError):
+				continue
+		return stats
+
+	def load(self):
+		"""Load statistics from disk, discarding unsaved observations."""
+		stats = self._read()
+		with self._lock:
+			self._stats = stats
+			del self._observations[:]
+
+	def _decay(self, record, now):
+		elapsed = now - record["time"]
+		if elapsed <= 0:
+			return 1.0
+		return 0.5 ** (elapsed / self.half_life)
+
+	def _apply(self, stats, observation):
+		key, timestamp, success, ttfb, rate = observation
+		record = stats.get(key)
+		if record is None:
+			record = {"ok": 0.0, "fail": 0.0, "ttfb": None,
+				"rate": None, "time": timestamp}
+			stats[key] = record
+		decay = self._decay(record, timestamp)
+		record["ok"] *= decay
+		record["fail"] *= decay
+		record["time"] = max(record["time"], timestamp)
+		if not success:
+			record["fail"] += 1
+			return
+		record["ok"] += 1
+		alpha = self._ewma_alpha
+		if ttfb is not None:
+			record["ttfb"] = ttfb if record["ttfb"] is None else \
+				alpha * ttfb + (1 - alpha) * record["ttfb"]
+		if rate is not None:
+			record["rate"] = rate if record["rate"] is None else \
+				alpha * rate + (1 - alpha) * record["rate"]
+
+	def record(self, uri, success, duration=None, nbytes=None, ttfb=None):
+		"""
+		Record the outcome of a download attempt from the given URI.
+
+		@param success: whether the download succeeded
+		@type success: bool
+		@param duration: seconds spent transferring nbytes
+		@type duration: float
+		@param nbytes: number of bytes transferred
+		@type nbytes: int
+		@param ttfb: seconds until the first byte was received
+		@type ttfb: float
+		"""
+		key = mirror_key(uri)
+		if key is None:
+			return
+		rate = None
+		if success and nbytes and duration is not None and \
+			nbytes >= self.reference_size // 16:
+			# Transfers which are too small to measure throughput
+			# are still counted as successes.
+			rate = nbytes / max(duration, 0.001)
+		observation = (key, self._clock(), bool(success), ttfb, rate)
+		with self._lock:
+			self._observations.append(observation)
+			self._apply(self._stats, observation)
+
+	def predict(self, uri):
+		"""
+		Return the predicted cost, in seconds, of fetching
+		reference_size bytes from the given URI.
+		"""
+		key = mirror_key(uri)
+		record = None if key is None else self._stats.get(key)
+		ok = fail = 0.0
+		ttfb = self._default_ttfb
+		rate = self._default_rate
+		if record is not None:
+			decay = self._decay(record, self._clock())
+			ok = record["ok"] * decay
+			fail = record["fail"] * decay
+			if record["ttfb"] is not None:
+				ttfb = record["ttfb"]
+			if record["rate"] is not None:
+				rate = record["rate"]
+		failure_rate = (fail + 1) / (ok + fail + 2)
+		return ttfb + self.reference_size / rate + \
+			failure_rate * self.failure_penalty
+
+	def _samples(self, uri):
+		key = mirror_key(uri)
+		record = None if key is None else self._stats.get(key)
+		if record is None:
+			return 0.0
+		return (record["ok"] + record["fail"]) * \
+			self._decay(record, self._clock())
+
+	def order(self, uris):
+		"""
+		Return the given URIs sorted by predicted cost. The sort is
+		stable, so URIs with equal predictions keep their order.
+		"""
+		with self._lock:
+			result = sorted(uris, key=self.predict)
+			if len(result) > 1 and self._random.random() < self.probe_rate:
+				candidates = [uri for uri in result
+					if self._samples(uri) < self._probe_samples]
+				if candidates:
+					uri = self._random.choice(candidates)
+					result.remove(uri)
+					result.insert(0, uri)
+		return result
+
+	def save(self):
+		"""
+		Merge the observations recorded since the last load or save
+		into the statistics file.
+		"""
+		with self._lock:
+			observations = self._observations[:]
+			del self._observations[:]
+		if not observations:
+			return
+
+		lock = None
+		try:
+			lock = lockfile(self.filename, wantnewlockfile=1)
+			stats = self._read()
+			for observation in observations:
+				self._apply(stats, observation)
+
+			now = self._clock()
+			expire = self._expire_half_lives * self.half_life
+			mirrors = {}
+			for key, record in stats.items():
+				if now - record["time"] < expire:
+					mirrors[key] = record
+
+			f = atomic_ofstream(self.filename, mode='wb')
+			f.write(_unicode_encode(json.dumps(
+				{"version": self._format_version, "mirrors": mirrors},
+				sort_keys=True), encoding=_encodings['repo.content'],
+				errors='strict'))
+			f.close()
+		except (EnvironmentError, PortageException) as e:
+			writemsg("!!! Failed to save mirror statistics: %s: %s\n" %
+				(self.filename, e), noiselevel=-1)
+			return
+		finally:
+			if lock is not None:
+				unlockfile(lock)
+
+		with self._lock:
+			for observation in self._observations:
+				self._apply(stats, observation)
+			self._stats = stats
@@ -0,0 +1,321 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import io
+import re
+import socket
+import time
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
+
+try:
+	import urllib.request as urllib_request
+	from urllib.error import URLError
+	from http.client import HTTPException
+except ImportError:
+	import urllib2 as urllib_request
+	from urllib2 import URLError
+	from httplib import HTTPException
+
+from portage import os, _encodings, _unicode_encode
+from portage.checksum import verify_all
+from portage.util import writemsg
+
+# Segments smaller than this are not worth a separate request.
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+# Aim for a few segments per connection, so that a slow mirror does
+# not hold up the whole download for long.
+_SEGMENTS_PER_CONNECTION = 4
+
+_SUPPORTED_PROTOCOLS = ("http", "https")
+
+_content_range_re = re.compile(r'^bytes\s+(\d+)-(\d+)/(\d+|\*)$')
+
+
+class _SegmentError(Exception):
+	pass
+
+
+class _RangeNotSupported(_SegmentError):
+	pass
+
+
+class SegmentedFetch(object):
+	"""
+	Download a file of known size by requesting byte ranges from
+	several HTTP(S) mirrors over concurrent connections.
+
+	Data is written to a partial file next to the destination, and
+	completed segments are recorded in a state file, so that an
+	interrupted download resumes with the missing segments only. When
+	all segments have been received, the partial file is verified
+	against the given digests and then renamed to the destination.
+	Mirrors that fail repeatedly, or which do not honor range requests,
+	are dropped for the rest of the download. If a MirrorStats instance
+	is given, the outcome of every range request is recorded in it.
+	"""
+
+	_state_header = "segments 1"
+
+	def __init__(self, uris, filename, size, digests=None, connections=4,
+		segment_size=None, proxies=None, timeout=60, max_failures=2,
+		user_agent=None, mirror_stats=None):
+		self.uris = [uri for uri in uris if supported_uri(uri)]
+		self.filename = filename
+		self.size = size
+		self.digests = digests
+		self.connections = max(1, connections)
+		if segment_size is None:
+			segment_size = -(-size //
+				(self.connections * _SEGMENTS_PER_CONNECTION))
+			segment_size = max(MIN_SEGMENT_SIZE, segment_size)
+		self.segment_size = segment_size
+		self.timeout = timeout
+		self.max_failures = max_failures
+		self.user_agent = user_agent
+		self.mirror_stats = mirror_stats
+		self.partial_filename = filename + ".__download__"
+		self.state_filename = self.partial_filename + ".segments"
+
+		handlers = []
+		if proxies is not None:
+			handlers.append(urllib_request.ProxyHandler(proxies))
+		self._opener = urllib_request.build_opener(*handlers)
+
+		self._lock = threading.Lock()
+		self._pending = []
+		self._completed = set()
+		self._failures = {}
+		self._disabled = set()
+		self._errors = []
+
+	def _segments(self):
+		return [(offset, min(self.segment_size, self.size - offset))
+			for offset in range(0, self.size, self.segment_size)]
+
+	def _load_state(self):
+		"""
+		Return the offsets of segments completed by a previous attempt,
+		or an empty set if there is nothing usable to resume.
+		"""
+		try:
+			if os.stat(self.partial_filename).st_size != self.size:
+				return set()
+			with io.open(_unicode_encode(self.state_filename,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['content'],
+				errors='replace') as f:
+				lines = f.read().splitlines()
+		except EnvironmentError:
+			return set()
+
+		if not lines or lines[0] != "%s %d %d" % \
+			(self._state_header, self.size, self.segment_size):
+			return set()
+
+		completed = set()
+		for line in lines[1:]:
+			try:
+				offset = int(line)
+			except ValueError:
+				return set()
+			if offset % self.segment_size or not 0 <= offset < self.size:
+				return set()
+			completed.add(offset)
+		return completed
+
+	def _init_files(self, completed):
+		if completed:
+			return
+		with open(_unicode_encode(self.partial_filename,
+			encoding=_encodings['fs'], errors='strict'), 'wb') as f:
+			f.truncate(self.size)
+		with io.open(_unicode_encode(self.state_filename,
+			encoding=_encodings['fs'], errors='strict'),
+			mode='w', encoding=_encodings['content']) as f:
+			f.write("%s %d %d\n" %
+				(self._state_header, self.size, self.segment_size))
+
+	def _record(self, offset):
+		# Called with self._lock held. The data must be on disk
+		# before the segment is recorded as complete.
+		with io.open(_unicode_encode(self.state_filename,
+			encoding=_encodings['fs'], errors='strict'),
+			mode='a', encoding=_encodings['content']) as f:
+			f.write("%d\n" % offset)
+		self._completed.add(offset)
+
+	def _next_task(self, worker_id):
+		"""
+		Return the next (offset, length, uri) to fetch, or None when
+		there is nothing left to do or no usable mirror remains.
+		"""
+		with self._lock:
+			if not self._pending:
+				return None
+			uris = [uri for uri in self.uris if uri not in self._disabled]
+			if not uris:
+				return None
+			# Spread connections across mirrors, preferring mirrors
+			# that have failed less often.
+			uris.sort(key=lambda uri: self._failures.get(uri, 0))
+			uri = uris[worker_id % len(uris)]
+			offset, length = self._pending.pop(0)
+			return offset, length, uri
+
+	def _fail(self, offset, length, uri, e):
+		with self._lock:
+			self._pending.append((offset, length))
+			self._errors.append((uri, e))
+			failures = self._failures.get(uri, 0) + 1
+			self._failures[uri] = failures
+			if isinstance(e, _RangeNotSupported) or \
+				failures >= self.max_failures:
+				self._disabled.add(uri)
+
+	def _fetch_segment(self, f, offset, length, uri):
+		end = offset + length - 1
+		request = urllib_request.Request(uri)
+		request.add_header("Range", "bytes=%d-%d" % (offset, end))
+		if self.user_agent is not None:
+			request.add_header("User-Agent", self.user_agent)
+
+		start_time = time.time()
+		response = self._opener.open(request, timeout=self.timeout)
+		ttfb = time.time() - start_time
+		try:
+			status = getattr(response, "status", None)
+			if status is None:
+				status = response.getcode()
+			if status != 206:
+				raise _RangeNotSupported(
+					"server ignored range request (status %s)" % status)
+			content_range = _content_range_re.match(
+				response.info().get("Content-Range", "").strip())
+			if content_range is None or \
+				int(content_range.group(1)) != offset or \
+				int(content_range.group(2)) != end or \
+				content_range.group(3) not in ("*", str(self.size)):
+				raise _RangeNotSupported("unexpected Content-Range: %s" %
+					response.info().get("Content-Range"))
+
+			f.seek(offset)
+			remaining = length
+			while remaining:
+				buf = response.read(min(remaining, 65536))
+				if not buf:
+					break
+				f.write(buf)
+				remaining -= len(buf)
+			if remaining:
+				raise _SegmentError("short read: %d of %d bytes" %
+					(length - remaining, length))
+			f.flush()
+		finally:
+			response.close()
+
+		if self.mirror_stats is not None:
+			self.mirror_stats.record(uri, True,
+				duration=time.time() - start_time - ttfb,
+				nbytes=length, ttfb=ttfb)
+
+	def _worker(self, worker_id):
+		with open(_unicode_encode(self.partial_filename,
+			encoding=_encodings['fs'], errors='strict'), 'r+b') as f:
+			while True:
+				task = self._next_task(worker_id)
+				if task is None:
+					break
+				offset, length, uri = task
+				requeue = True
+				try:
+					self._fetch_segment(f, offset, length, uri)
+				except (_SegmentError, URLError, HTTPException,
+					socket.error, EnvironmentError, ValueError) as e:
+					requeue = False
+					self._fail(offset, length, uri, e)
+					if self.mirror_stats is not None:
+						self.mirror_stats.record(uri, False)
+				else:
+					with self._lock:
+						self._record(offset)
+					requeue = False
+				finally:
+					if requeue:
+						# Put the segment back if an unexpected exception
+						# ends this worker, so that it is not lost.
+						with self._lock:
+							self._pending.append((offset, length))
+
+	def discard(self):
+		"""Remove the partial file and its state."""
+		for filename in (self.partial_filename, self.state_filename):
+			try:
+				os.unlink(filename)
+			except OSError as e:
+				if e.errno not in (errno.ENOENT, errno.ESTALE):
+					raise
+
+	def run(self):
+		"""
+		Download the file. Returns True if the destination file has
+		been created and verified, and False otherwise. On a download
+		failure, the completed segments are preserved for a later
+		resume. On a verification failure, everything is discarded.
+		"""
+		if not self.uris or self.size <= 0:
+			return False
+
+		completed = self._load_state()
+		try:
+			self._init_files(completed)
+		except EnvironmentError as e:
+			writemsg("!!! %s\n" % (e,), noiselevel=-1)
+			return False
+		self._completed = completed
+		self._pending = [segment for segment in self._segments()
+			if segment[0] not in completed]
+
+		if completed and self._pending:
+			writemsg(">>> Resuming segmented download "
+				"(%d of %d segments done)\n" % (len(completed),
+				len(completed) + len(self._pending)), noiselevel=-1)
+
+		workers = [threading.Thread(target=self._worker, args=(i,))
+			for i in range(min(self.connections, len(self._pending)))]
+		for worker in workers:
+			worker.daemon = True
+			worker.start()
+		for worker in workers:
+			worker.join()
+
+		# Every segment must have been recorded as complete, even if
+		# a worker was terminated by an unexpected exception.
+		if self._pending or \
+			len(self._completed) != len(self._segments()):
+			for uri, e in self._errors:
+				writemsg("!!! %s: %s\n" % (uri, e), noiselevel=-1)
+			return False
+
+		if self.digests:
+			verified_ok, reason = verify_all(
+				self.partial_filename, self.digests)
+			if not verified_ok:
+				writemsg("!!! Segmented download of %s failed "
+					"verification: %s\n" % (os.path.basename(self.filename),
+					reason[0]), noiselevel=-1)
+				self.discard()
+				return False
+
+		os.rename(self.partial_filename, self.filename)
+		self.discard()
+		return True
+
+
+def supported_uri(uri):
+	return uri.partition("://")[0].lower() in _SUPPORTED_PROTOCOLS
@@ -63,6 +63,7 @@ from portage.package.ebuild._config.LicenseManager import LicenseManager
 from portage.package.ebuild._config.UseManager import UseManager
 from portage.package.ebuild._config.LocationsManager import LocationsManager
 from portage.package.ebuild._config.MaskManager import MaskManager
+from portage.package.ebuild._config.ProfileSnapshot import ProfileSnapshot
 from portage.package.ebuild._config.VirtualsManager import VirtualsManager
 from portage.package.ebuild._config.helper import ordered_by_atom_specificity, prune_incremental
 from portage.package.ebuild._config.unpack_dependencies import load_unpack_dependencies_configuration
@@ -564,7 +565,14 @@ class config(object):
 			expand_map["PORTDIR_OVERLAY"] = self["PORTDIR_OVERLAY"]
 
 			locations_manager.set_port_dirs(self["PORTDIR"], self["PORTDIR_OVERLAY"])
+
+			# Load the parsed profile stack, repository profiles and
+			# user configuration from a compiled snapshot, as far as
+			# the files have not changed since it was saved.
+			profile_snapshot = ProfileSnapshot.register(eroot,
+				chain(known_repos, [abs_user_config]))
 			locations_manager.load_profiles(self.repositories, known_repos)
+			profile_snapshot.add_roots(locations_manager.profiles)
 
 			profiles_complex = locations_manager.profiles_complex
 			self.profiles = locations_manager.profiles
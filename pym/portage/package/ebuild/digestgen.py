@@ -7,6 +7,7 @@ import errno
 
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.package.ebuild._distfiles_layout:distfile_path',
 	'portage.package.ebuild._spawn_nofetch:spawn_nofetch',
 )
 
@@ -90,7 +91,7 @@ def digestgen(myarchives=None, mysettings=None, myportdb=None):
 			myhashes = dist_hashes.get(myfile)
 			if not myhashes:
 				try:
-					st = os.stat(os.path.join(mysettings["DISTDIR"], myfile))
+					st = os.stat(distfile_path(mysettings["DISTDIR"], myfile))
 				except OSError:
 					st = None
 				if st is None or st.st_size == 0:
@@ -99,7 +100,7 @@ def digestgen(myarchives=None, mysettings=None, myportdb=None):
 			size = myhashes.get("size")
 
 			try:
-				st = os.stat(os.path.join(mysettings["DISTDIR"], myfile))
+				st = os.stat(distfile_path(mysettings["DISTDIR"], myfile))
 			except OSError as e:
 				if e.errno != errno.ENOENT:
 					raise
@@ -141,7 +142,7 @@ def digestgen(myarchives=None, mysettings=None, myportdb=None):
 			mysettings["PORTAGE_RESTRICT"] = " ".join(all_restrict)
 
 			try:
-				st = os.stat(os.path.join(mysettings["DISTDIR"], myfile))
+				st = os.stat(distfile_path(mysettings["DISTDIR"], myfile))
 			except OSError:
 				st = None
 
@@ -188,7 +189,7 @@ def digestgen(myarchives=None, mysettings=None, myportdb=None):
 			auto_assumed = []
 			for filename in distlist:
 				if not os.path.exists(
-					os.path.join(mysettings["DISTDIR"], filename)):
+					distfile_path(mysettings["DISTDIR"], filename)):
 					auto_assumed.append(filename)
 			if auto_assumed:
 				cp = os.path.sep.join(mysettings["O"].split(os.path.sep)[-2:])
@@ -32,6 +32,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.package.ebuild.digestgen:digestgen',
 	'portage.package.ebuild.fetch:fetch',
 	'portage.package.ebuild.prepare_build_dirs:_prepare_fake_distdir',
+	'portage.package.ebuild._distfiles_layout:distfile_path',
 	'portage.package.ebuild._ipc.QueryCommand:QueryCommand',
 	'portage.dep._slot_operator:evaluate_slot_operator_equal_deps',
 	'portage.package.ebuild._spawn_nofetch:spawn_nofetch',
@@ -81,7 +82,7 @@ from portage.util import ( apply_recursive_permissions,
 	)
 from portage.util.cpuinfo import get_cpu_count
 from portage.util.lafilefixer import rewrite_lafile
-from portage.util.compression_probe import _compressors
+from portage.util.compression_probe import _compress_command, _compressors
 from portage.util.socks5 import get_socks5_proxy
 from portage.versions import _pkgsplit
 from _emerge.BinpkgEnvExtractor import BinpkgEnvExtractor
@@ -543,9 +544,7 @@ def doebuild_environment(myebuild, mydo, myroot=None, settings=None,
 					missing_package = compression["package"]
 					writemsg("Warning: File compression unsupported %s. Missing package: %s" % (binpkg_compression, missing_package))
 				else:
-					cmd = [varexpand(x, mydict=settings) for x in shlex_split(compression["compress"])]
-					# Filter empty elements
-					cmd = [x for x in cmd if x != ""]
+					cmd = _compress_command(binpkg_compression, settings)
 					mysettings['PORTAGE_COMPRESSION_COMMAND'] = ' '.join(cmd)
 
 _doebuild_manifest_cache = None
@@ -919,7 +918,7 @@ def doebuild(myebuild, mydo, _unused=DeprecationWarning, settings=None, debug=0,
 					for x in alist:
 						writemsg_stdout(">>> Checking %s's mtime...\n" % x)
 						try:
-							x_st = os.stat(os.path.join(
+							x_st = os.stat(distfile_path(
 								mysettings["DISTDIR"], x))
 						except OSError:
 							# file not fetched yet
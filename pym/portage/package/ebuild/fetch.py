@@ -13,6 +13,13 @@ import re
 import stat
 import sys
 import tempfile
+import time
+import traceback
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
 
 try:
 	from urllib.parse import urlparse
@@ -25,13 +32,19 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.package.ebuild.doebuild:doebuild_environment,' + \
 		'_doebuild_spawn',
 	'portage.package.ebuild.prepare_build_dirs:prepare_build_dirs',
+	'portage.package.ebuild._distfiles_layout:FlatLayout,' + \
+		'MirrorLayoutCache,MirrorLayoutConfig,directory_layouts,' + \
+		'distfile_path',
+	'portage.package.ebuild._mirror_stats:MirrorStats',
+	'portage.package.ebuild._segmented_fetch:MIN_SEGMENT_SIZE,' + \
+		'SegmentedFetch,supported_uri',
 )
 
 from portage import OrderedDict, os, selinux, shutil, _encodings, \
 	_shell_quote, _unicode_encode
 from portage.checksum import (get_valid_checksum_keys, perform_md5, verify_all,
 	_filter_unaccelarated_hashes, _hash_filter, _apply_hash_filter)
-from portage.const import BASH_BINARY, CUSTOM_MIRRORS_FILE, \
+from portage.const import BASH_BINARY, CACHE_PATH, CUSTOM_MIRRORS_FILE, \
 	GLOBAL_CONFIG_PATH
 from portage.data import portage_gid, portage_uid, secpass, userpriv_groups
 from portage.exception import FileNotFound, OperationNotPermitted, \
@@ -39,9 +52,11 @@ from portage.exception import FileNotFound, OperationNotPermitted, \
 from portage.localization import _
 from portage.locks import lockfile, unlockfile
 from portage.output import colorize, EOutput
+from portage.util.configparser import ConfigParserError
 from portage.util import apply_recursive_permissions, \
 	apply_secpass_permissions, ensure_dirs, grabdict, shlex_split, \
 	varexpand, writemsg, writemsg_level, writemsg_stdout
+from portage.util._thread_pool import ThreadPool
 from portage.process import spawn
 
 _userpriv_spawn_kwargs = (
@@ -54,6 +69,15 @@ _userpriv_spawn_kwargs = (
 def _hide_url_passwd(url):
 	return re.sub(r'//(.+):.+@(.+)', r'//\1:*password*@\2', url)
 
+def _want_userfetch(settings):
+	"""
+	Return True if fetchers should run with privileges dropped to the
+	portage user, as requested by FEATURES=userfetch.
+	"""
+	return "userfetch" in settings.features and \
+		os.getuid() == 0 and bool(portage_gid and portage_uid) and \
+		hasattr(os, "setgroups")
+
 def _spawn_fetch(settings, args, **kwargs):
 	"""
 	Spawn a process with appropriate settings for fetching, including
@@ -74,9 +98,7 @@ def _spawn_fetch(settings, args, **kwargs):
 		}
 
 	logname = None
-	if "userfetch" in settings.features and \
-		os.getuid() == 0 and portage_gid and portage_uid and \
-		hasattr(os, "setgroups"):
+	if _want_userfetch(settings):
 		kwargs.update(_userpriv_spawn_kwargs)
 		logname = portage.data._portage_username
 
@@ -108,6 +130,83 @@ def _spawn_fetch(settings, args, **kwargs):
 
 	return rval
 
+def _run_segmented_fetch(settings, fetcher):
+	"""
+	Run a SegmentedFetch instance, with privileges dropped for userfetch
+	in the same way as _spawn_fetch. Returns True on success.
+	"""
+	if not _want_userfetch(settings):
+		return fetcher.run()
+
+	pid = os.fork()
+	if pid == 0:
+		rval = 1
+		try:
+			os.setgid(portage_gid)
+			os.setgroups(userpriv_groups)
+			os.setuid(portage_uid)
+			os.umask(0o02)
+			if fetcher.run():
+				rval = os.EX_OK
+		except Exception:
+			traceback.print_exc()
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			os._exit(rval)
+	return os.waitpid(pid, 0)[1] == os.EX_OK
+
+def _get_mirror_layouts(mysettings, mirror, layout_cache):
+	"""
+	Return the layouts of the distfiles directory of a mirror, as
+	described by its layout.conf file. The file is downloaded into
+	DISTDIR with FETCHCOMMAND, and its structure is stored in
+	layout_cache. If the file cannot be retrieved, the mirror is
+	assumed to use the flat layout.
+	"""
+	conf = layout_cache.get(mirror)
+	if conf is not None:
+		return conf.get_all_layouts()
+
+	conf = MirrorLayoutConfig()
+	uri = mirror + "/distfiles/layout.conf"
+	protocol = uri[0:uri.find("://")]
+	fetchcommand = mysettings.get("FETCHCOMMAND_" + protocol.upper()) or \
+		mysettings.get("FETCHCOMMAND")
+	distdir = mysettings["DISTDIR"]
+	tmp_basename = ".layout.conf._fetch_.%s.%s" % \
+		(os.getpid(), threading.current_thread().ident)
+	tmp_path = os.path.join(distdir, tmp_basename)
+	if fetchcommand and "${FILE}" in fetchcommand:
+		variables = {
+			"DISTDIR": distdir,
+			"URI":     uri,
+			"FILE":    tmp_basename,
+		}
+		v = mysettings.get("PORTAGE_SSH_OPTS")
+		if v is not None:
+			variables["PORTAGE_SSH_OPTS"] = v
+		args = [varexpand(x, mydict=variables)
+			for x in shlex_split(fetchcommand)]
+		null_fd = os.open(os.devnull, os.O_RDWR)
+		try:
+			returncode = _spawn_fetch(mysettings, args,
+				fd_pipes={0: null_fd, 1: null_fd, 2: null_fd})
+		finally:
+			os.close(null_fd)
+		if returncode == os.EX_OK:
+			try:
+				conf.read_from_file(tmp_path)
+			except ConfigParserError as e:
+				writemsg(_("!!! Invalid layout.conf on mirror: %s: %s\n") %
+					(_hide_url_passwd(mirror), e), noiselevel=-1)
+		try:
+			os.unlink(tmp_path)
+		except OSError:
+			pass
+	layout_cache.set(mirror, conf)
+	return conf.get_all_layouts()
+
 _userpriv_test_write_file_cache = {}
 _userpriv_test_write_cmd_script = ">> %(file_path)s 2>/dev/null ; rval=$? ; " + \
 	"rm -f  %(file_path)s ; exit $rval"
@@ -245,6 +344,43 @@ _size_suffix_map = {
 	'Y' : 80,
 }
 
+def _concurrent_fetch(file_uris, mysettings, mydigests, jobs, **kwargs):
+	"""
+	Fetch each file of file_uris with a separate fetch() call, running
+	up to jobs calls concurrently. Every call locks, downloads and
+	verifies its file exactly like a sequential fetch() would, using
+	a private clone of mysettings.
+
+	@param file_uris: mapping of distfile name to its SRC_URI list
+	@type file_uris: OrderedDict
+	@param jobs: maximum number of files fetched concurrently
+	@type jobs: int
+	@rtype: dict
+	@return: mapping of distfile name to True if the file has been
+		fetched and verified, or False if fetch() failed for it
+	"""
+	results = {}
+
+	def fetch_file(myfile, settings):
+		digests = {}
+		if myfile in mydigests:
+			digests[myfile] = dict(mydigests[myfile])
+		result = 0
+		try:
+			result = fetch({myfile: file_uris[myfile]}, settings,
+				fetchonly=1, digests=digests, **kwargs)
+		except Exception:
+			traceback.print_exc()
+		results[myfile] = bool(result)
+
+	pool = ThreadPool(min(jobs, len(file_uris)))
+	for myfile in file_uris:
+		# Clone settings in the calling thread, since config instances
+		# are not safe to share or to clone from concurrent threads.
+		pool.submit(fetch_file, myfile, config(clone=mysettings))
+	pool.wait()
+	return results
+
 def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	locks_in_subdir=".locks", use_locks=1, try_mirrors=1, digests=None,
 	allow_missing_digests=True):
@@ -317,6 +453,40 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	fetch_resume_size = int(match.group(1)) * \
 		2 ** _size_suffix_map[match.group(2).upper()]
 
+	fetch_jobs_default = 1
+	fetch_jobs = fetch_jobs_default
+	v = mysettings.get("PORTAGE_FETCH_JOBS")
+	if v:
+		try:
+			fetch_jobs = int(v)
+		except ValueError:
+			fetch_jobs = 0
+		if fetch_jobs < 1:
+			writemsg(_("!!! Variable PORTAGE_FETCH_JOBS"
+				" contains an invalid value: '%s'\n") % v, noiselevel=-1)
+			writemsg(_("!!! Using PORTAGE_FETCH_JOBS "
+				"default value: %s\n") % fetch_jobs_default,
+				noiselevel=-1)
+			fetch_jobs = fetch_jobs_default
+
+	segmented_fetch = "segmented-fetch" in features
+	segmented_connections_default = 4
+	segmented_connections = segmented_connections_default
+	if segmented_fetch:
+		v = mysettings.get("PORTAGE_SEGMENTED_FETCH_CONNECTIONS")
+		if v:
+			try:
+				segmented_connections = int(v)
+			except ValueError:
+				segmented_connections = 0
+			if segmented_connections < 1:
+				writemsg(_("!!! Variable PORTAGE_SEGMENTED_FETCH_CONNECTIONS"
+					" contains an invalid value: '%s'\n") % v, noiselevel=-1)
+				writemsg(_("!!! Using PORTAGE_SEGMENTED_FETCH_CONNECTIONS "
+					"default value: %s\n") % segmented_connections_default,
+					noiselevel=-1)
+				segmented_connections = segmented_connections_default
+
 	# Behave like the package has RESTRICT="primaryuri" after a
 	# couple of checksum failures, to increase the probablility
 	# of success before checksum_failure_max_tries is reached.
@@ -339,6 +509,14 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 
 	mymirrors=[]
 
+	mirror_stats = None
+	layout_cache = None
+	mirror_layouts = {}
+	if "adaptive-mirrors" in features and not listonly:
+		mirror_stats = MirrorStats(os.path.join(mysettings["EROOT"],
+			CACHE_PATH, "mirror_stats.json"))
+		mirror_stats.load()
+
 	if listonly or ("distlocks" not in features):
 		use_locks = 0
 
@@ -364,7 +542,10 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 		pass
 	else:
 		if try_mirrors:
-			mymirrors += [x.rstrip("/") for x in mysettings["GENTOO_MIRRORS"].split() if x]
+			gentoo_mirrors = [x.rstrip("/") for x in mysettings["GENTOO_MIRRORS"].split() if x]
+			if mirror_stats is not None:
+				gentoo_mirrors = mirror_stats.order(gentoo_mirrors)
+			mymirrors += gentoo_mirrors
 
 	hash_filter = _hash_filter(mysettings.get("PORTAGE_CHECKSUM_FILTER", ""))
 	if hash_filter.transparent:
@@ -405,6 +586,10 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	else:
 		locations = mymirrors
 
+	# Maps the distfile URIs of the mirrors in locations to their
+	# mirror, so that the layout of the mirror can be applied once
+	# the file actually needs to be downloaded.
+	mirror_uris = {}
 	file_uri_tuples = []
 	# Check for 'items' attribute since OrderedDict is not a dict.
 	if hasattr(myuris, 'items'):
@@ -427,7 +612,9 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 		if myfile not in filedict:
 			filedict[myfile]=[]
 			for y in range(0,len(locations)):
-				filedict[myfile].append(locations[y]+"/distfiles/"+myfile)
+				uri = locations[y]+"/distfiles/"+myfile
+				filedict[myfile].append(uri)
+				mirror_uris[uri] = locations[y]
 		if myuri is None:
 			continue
 		if myuri[:9]=="mirror://":
@@ -447,6 +634,8 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 					uris = [locmirr.rstrip("/") + "/" + path \
 						for locmirr in thirdpartymirrors[mirrorname]]
 					random.shuffle(uris)
+					if mirror_stats is not None:
+						uris = mirror_stats.order(uris)
 					filedict[myfile].extend(uris)
 					thirdpartymirror_uris.setdefault(myfile, []).extend(uris)
 
@@ -549,11 +738,25 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 		can_fetch = False
 
 	distdir_writable = can_fetch and not fetch_to_ro
+	distdir_layouts = directory_layouts(mysettings["DISTDIR"])
 	failed_files = set()
 	restrict_fetch_msg = False
 	valid_hashes = set(get_valid_checksum_keys())
 	valid_hashes.discard("size")
 
+	concurrent_results = {}
+	if fetch_jobs > 1 and len(filedict) > 1 and distdir_writable and \
+		not (listonly or restrict_fetch):
+		file_uris = OrderedDict()
+		for myfile, myuri in file_uri_tuples:
+			uris = file_uris.setdefault(myfile, [])
+			if myuri is not None:
+				uris.append(myuri)
+		concurrent_results = _concurrent_fetch(file_uris, mysettings,
+			mydigests, fetch_jobs, locks_in_subdir=locks_in_subdir,
+			use_locks=use_locks, try_mirrors=try_mirrors,
+			allow_missing_digests=allow_missing_digests)
+
 	for myfile in filedict:
 		"""
 		fetched  status
@@ -563,6 +766,16 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 		"""
 		fetched = 0
 
+		if myfile in concurrent_results:
+			# The file has already been fetched and verified, or
+			# its failure has been reported, by _concurrent_fetch.
+			if concurrent_results[myfile]:
+				continue
+			if fetchonly:
+				failed_files.add(myfile)
+				continue
+			return 0
+
 		orig_digests = mydigests.get(myfile, {})
 
 		if not (allow_missing_digests or listonly):
@@ -599,7 +812,12 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 			if size is not None:
 				pruned_digests["size"] = size
 
-		myfile_path = os.path.join(mysettings["DISTDIR"], myfile)
+		# With a hashed layout, files are stored in sub-directories of
+		# DISTDIR, while existing files are still found in the flat
+		# layout.
+		myfile_path = distfile_path(mysettings["DISTDIR"], myfile,
+			distdir_layouts)
+		myfile_dir = os.path.dirname(myfile_path)
 		has_space = True
 		has_space_superuser = True
 		file_lock = None
@@ -640,6 +858,13 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 					elif userfetch:
 						has_space = False
 
+			if distdir_writable and myfile_dir != mysettings["DISTDIR"]:
+				try:
+					ensure_dirs(myfile_dir, gid=dir_gid, mode=dirmode,
+						mask=modemask)
+				except PortageException as e:
+					writemsg("!!! %s\n" % (e,), noiselevel=-1)
+
 			if distdir_writable and use_locks:
 
 				lock_kwargs = {}
@@ -715,14 +940,14 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 								"ME_MIN_SIZE)\n") % mystat.st_size)
 							temp_filename = \
 								_checksum_failure_temp_file(
-								mysettings["DISTDIR"], myfile)
+								myfile_dir, myfile)
 							writemsg_stdout(_("Refetching... "
 								"File renamed to '%s'\n\n") % \
 								temp_filename, noiselevel=-1)
 						elif mystat.st_size >= size:
 							temp_filename = \
 								_checksum_failure_temp_file(
-								mysettings["DISTDIR"], myfile)
+								myfile_dir, myfile)
 							writemsg_stdout(_("Refetching... "
 								"File renamed to '%s'\n\n") % \
 								temp_filename, noiselevel=-1)
@@ -730,7 +955,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 				if distdir_writable and ro_distdirs:
 					readonly_file = None
 					for x in ro_distdirs:
-						filename = os.path.join(x, myfile)
+						filename = distfile_path(x, myfile)
 						match, mystat = _check_distfile(
 							filename, pruned_digests, eout, hash_filter=hash_filter)
 						if match:
@@ -762,7 +987,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 
 				if fsmirrors and not os.path.exists(myfile_path) and has_space:
 					for mydir in fsmirrors:
-						mirror_file = os.path.join(mydir, myfile)
+						mirror_file = distfile_path(mydir, myfile)
 						try:
 							shutil.copyfile(mirror_file, myfile_path)
 							writemsg(_("Local mirror has file: %s\n") % myfile)
@@ -836,7 +1061,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 								if distdir_writable:
 									temp_filename = \
 										_checksum_failure_temp_file(
-										mysettings["DISTDIR"], myfile)
+										myfile_dir, myfile)
 									writemsg_stdout(_("Refetching... "
 										"File renamed to '%s'\n\n") % \
 										temp_filename, noiselevel=-1)
@@ -852,9 +1077,76 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 									eout.eend(0)
 								continue # fetch any remaining files
 
+			if can_fetch and fetched != 2 and has_space:
+				# Try the paths given by the layouts of the mirrors
+				# first, and their flat paths as a fallback.
+				uris = []
+				for uri in filedict[myfile]:
+					mirror = mirror_uris.get(uri)
+					if mirror is not None:
+						if mirror not in mirror_layouts:
+							if layout_cache is None:
+								layout_cache = MirrorLayoutCache(
+									os.path.join(mysettings["EROOT"],
+									CACHE_PATH, "mirror_layouts.json"))
+							mirror_layouts[mirror] = _get_mirror_layouts(
+								mysettings, mirror, layout_cache)
+						for layout in mirror_layouts[mirror]:
+							if not isinstance(layout, FlatLayout):
+								uris.append(mirror + "/distfiles/" +
+									layout.get_path(myfile))
+					uris.append(uri)
+				filedict[myfile] = uris
+
+			segmented = None
+			if segmented_fetch and fetched != 2 and distdir_writable and \
+				has_space and not listonly and \
+				not mysettings.selinux_enabled() and \
+				size is not None and size >= 2 * MIN_SEGMENT_SIZE and \
+				any(supported_uri(uri) for uri in filedict[myfile]):
+				digests = _filter_unaccelarated_hashes(mydigests[myfile])
+				if hash_filter is not None:
+					digests = _apply_hash_filter(digests, hash_filter)
+				proxies = dict((k[:-len("_proxy")], mysettings[k])
+					for k in ("http_proxy", "https_proxy")
+					if mysettings.get(k))
+				segmented = SegmentedFetch(filedict[myfile], myfile_path,
+					size, digests=digests,
+					connections=segmented_connections,
+					proxies=proxies or None,
+					mirror_stats=(None if _want_userfetch(mysettings)
+						else mirror_stats))
+				writemsg_stdout(_(">>> Downloading '%s' in segments from "
+					"%d location(s)\n") % (myfile, len(segmented.uris)))
+				segmented_ok = _run_segmented_fetch(mysettings, segmented)
+				if segmented.mirror_stats is not None:
+					segmented.mirror_stats.save()
+				if segmented_ok:
+					try:
+						apply_secpass_permissions(myfile_path,
+							gid=portage_gid, mode=0o664, mask=0o2)
+					except PortageException as e:
+						if not os.access(myfile_path, os.R_OK):
+							writemsg(_("!!! Failed to adjust permissions:"
+								" %s\n") % str(e), noiselevel=-1)
+						del e
+					eout = EOutput()
+					eout.quiet = mysettings.get("PORTAGE_QUIET", None) == "1"
+					if digests:
+						eout.ebegin("%s %s ;-)" % \
+							(myfile, " ".join(sorted(digests))))
+						eout.eend(0)
+					fetched = 2
+					segmented = None
+				else:
+					writemsg(_(">>> Segmented download failed, falling "
+						"back to FETCHCOMMAND\n"), noiselevel=-1)
+
 			# Create a reversed list since that is optimal for list.pop().
 			uri_list = filedict[myfile][:]
 			uri_list.reverse()
+			if fetched == 2:
+				del uri_list[:]
 			checksum_failure_count = 0
 			tried_locations = set()
 			while uri_list:
@@ -981,23 +1273,38 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 					writemsg_stdout(_(">>> Downloading '%s'\n") % \
 						_hide_url_passwd(loc))
 					variables = {
+						"DISTDIR": myfile_dir,
 						"URI":     loc,
 						"FILE":    myfile
 					}
 
-					for k in ("DISTDIR", "PORTAGE_SSH_OPTS"):
-						v = mysettings.get(k)
-						if v is not None:
-							variables[k] = v
+					v = mysettings.get("PORTAGE_SSH_OPTS")
+					if v is not None:
+						variables["PORTAGE_SSH_OPTS"] = v
 
 					myfetch = shlex_split(locfetch)
 					myfetch = [varexpand(x, mydict=variables) for x in myfetch]
 					myret = -1
+					try:
+						start_size = os.stat(myfile_path).st_size
+					except OSError:
+						start_size = 0
+					start_time = time.time()
 					try:
 
 						myret = _spawn_fetch(mysettings, myfetch)
 
 					finally:
+						if mirror_stats is not None:
+							try:
+								end_size = os.stat(myfile_path).st_size
+							except OSError:
+								end_size = 0
+							mirror_stats.record(loc,
+								myret == os.EX_OK and end_size > 0,
+								duration=time.time() - start_time,
+								nbytes=end_size - start_size)
+							mirror_stats.save()
 						try:
 							apply_secpass_permissions(myfile_path,
 								gid=portage_gid, mode=0o664, mask=0o2)
@@ -1069,7 +1376,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 										) as f:
 										if html404.search(f.read()):
 											try:
-												os.unlink(mysettings["DISTDIR"]+"/"+myfile)
+												os.unlink(myfile_path)
 												writemsg(_(">>> Deleting invalid distfile. (Improper 404 redirect from server.)\n"))
 												fetched = 0
 												continue
@@ -1097,7 +1404,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 										return 0
 									temp_filename = \
 										_checksum_failure_temp_file(
-										mysettings["DISTDIR"], myfile)
+										myfile_dir, myfile)
 									writemsg_stdout(_("Refetching... "
 										"File renamed to '%s'\n\n") % \
 										temp_filename, noiselevel=-1)
@@ -1132,6 +1439,11 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 						elif mydigests!=None:
 							writemsg(_("No digest file available and download failed.\n\n"),
 								noiselevel=-1)
+
+			if segmented is not None and fetched == 2:
+				# The file has been fetched by other means, so the
+				# state of the segmented download is obsolete.
+				segmented.discard()
 		finally:
 			if use_locks and file_lock:
 				unlockfile(file_lock)
@@ -17,6 +17,7 @@ from portage.exception import DirectoryNotFound, FileNotFound, \
 	OperationNotPermitted, PermissionDenied, PortageException
 from portage.localization import _
 from portage.output import colorize
+from portage.package.ebuild._distfiles_layout import distfile_path
 from portage.util import apply_recursive_permissions, \
 	apply_secpass_permissions, ensure_dirs, normalize_path, writemsg
 from portage.const import EPREFIX
@@ -429,7 +430,7 @@ def _prepare_fake_distdir(settings, alist):
 	# Check for existing symlinks and recreate if necessary.
 	for x in alist:
 		symlink_path = os.path.join(edpath, x)
-		target = os.path.join(orig_distdir, x)
+		target = distfile_path(orig_distdir, x)
 		try:
 			link_target = os.readlink(symlink_path)
 		except OSError:
@@ -1,11 +1,14 @@
-# Copyright 2014-2015 Gentoo Foundation
+# Copyright 2014-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import os
 
+import portage
+portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.sync.controller:SyncManager',
+)
 from portage import OrderedDict
 from portage.module import Modules
-from portage.sync.controller import SyncManager
 from portage.sync.config_checks import check_type
 
 _SUBMODULE_PATH_MAP = OrderedDict([
@@ -0,0 +1,156 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+'''
+Translate the list of files that a sync operation modified into the
+set of packages whose metadata cache entries need to be regenerated.
+'''
+
+import io
+
+from portage import os, _encodings, _unicode_decode, _unicode_encode
+from portage.cache.cache_errors import CacheError
+from portage.versions import cpv_getkey
+
+# Files which influence the metadata of every ebuild in a repository,
+# so that a change to any of them requires a full regeneration.
+_GLOBAL_PATHS = frozenset([
+	'metadata/layout.conf',
+	'profiles/repo_name',
+])
+
+_NON_CATEGORY_DIRS = frozenset([
+	'eclass',
+	'licenses',
+	'metadata',
+	'profiles',
+	'scripts',
+])
+
+
+def parse_changed_paths(paths):
+	'''
+	Classify repository relative paths reported by a sync module.
+
+	@param paths: paths relative to the repository root
+	@type paths: iterable
+	@rtype: tuple or None
+	@return: a (cps, eclasses) tuple containing the set of cps that
+		have changed ebuilds or pregenerated cache entries, and the set
+		of eclass names that have changed, or None if the changes may
+		affect every package in the repository
+	'''
+	cps = set()
+	eclasses = set()
+	for path in paths:
+		path = os.path.normpath(path.strip()).lstrip(os.sep)
+		if not path or path == os.curdir:
+			continue
+		if path in _GLOBAL_PATHS:
+			return None
+		parts = path.split(os.sep)
+		if parts[0] == 'eclass':
+			if len(parts) == 2 and parts[1].endswith('.eclass'):
+				eclasses.add(parts[1][:-len('.eclass')])
+		elif parts[0] == 'metadata':
+			if len(parts) == 4 and parts[1] == 'md5-cache':
+				cp = cpv_getkey(parts[2] + '/' + parts[3])
+				if cp is not None:
+					cps.add(cp)
+		elif parts[0] not in _NON_CATEGORY_DIRS and len(parts) == 3 and \
+			parts[2].endswith('.ebuild'):
+			cps.add(parts[0] + '/' + parts[1])
+	return cps, eclasses
+
+
+def inherited_index(auxdb):
+	'''
+	Build a mapping from eclass name to the set of cpvs that inherit it,
+	based on the _eclasses_ of existing cache entries.
+
+	@param auxdb: a metadata cache instance
+	@type auxdb: portage.cache.template.database
+	@rtype: dict
+	@return: mapping of eclass name to a set of cpvs
+	'''
+	index = {}
+	try:
+		cpv_iter = list(auxdb)
+	except CacheError:
+		return index
+	for cpv in cpv_iter:
+		try:
+			entry = auxdb[cpv]
+		except (KeyError, CacheError):
+			continue
+		for eclass in entry.get('_eclasses_', ()):
+			index.setdefault(eclass, set()).add(cpv)
+	return index
+
+
+def affected_cps(paths, auxdb, eclass_index=None):
+	'''
+	Compute the cps that need metadata regeneration after the given
+	paths have changed. Packages that inherit a changed eclass are
+	located via the persistent eclass index of the cache if one is
+	given, which is built from the _eclasses_ of the existing cache
+	entries if it has been removed since the last update, and otherwise
+	via the cache entries themselves. Either describes inheritance as of
+	the last regeneration.
+
+	@param paths: paths relative to the repository root
+	@type paths: iterable
+	@param auxdb: a metadata cache instance, or None
+	@type auxdb: portage.cache.template.database
+	@param eclass_index: the index of auxdb, as returned by
+		EclassIndex.for_repo, or None
+	@type eclass_index: portage.cache.index.eclass_index.EclassIndex
+	@rtype: set or None
+	@return: a set of cps, or None if every package is affected
+	'''
+	result = parse_changed_paths(paths)
+	if result is None:
+		return None
+	cps, eclasses = result
+	if eclasses:
+		if auxdb is None:
+			return None
+		if eclass_index is not None:
+			if not eclass_index.load():
+				# Build the index from the cache entries, and save
+				# it for the next sync.
+				eclass_index.populate(auxdb)
+				eclass_index.save()
+			consumers = eclass_index.consumers
+		else:
+			consumers = inherited_index(auxdb).get
+		for eclass in eclasses:
+			for cpv in consumers(eclass) or ():
+				cp = cpv_getkey(cpv)
+				if cp is not None:
+					cps.add(cp)
+	return cps
+
+
+def read_changed_paths(filename):
+	'''
+	Read a changed path list, one path per line, as written by
+	write_changed_paths.
+	'''
+	with io.open(_unicode_encode(filename,
+		encoding=_encodings['fs'], errors='strict'),
+		mode='r', encoding=_encodings['repo.content'],
+		errors='replace') as f:
+		return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def write_changed_paths(filename, paths):
+	'''
+	Write a changed path list, one path per line.
+	'''
+	with io.open(_unicode_encode(filename,
+		encoding=_encodings['fs'], errors='strict'),
+		mode='w', encoding=_encodings['repo.content'],
+		errors='backslashreplace') as f:
+		for path in paths:
+			f.write(_unicode_decode(path) + '\n')
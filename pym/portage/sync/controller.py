@@ -8,6 +8,7 @@ import sys
 import logging
 import grp
 import pwd
+import tempfile
 import warnings
 
 import portage
@@ -20,7 +21,9 @@ good = create_color_func("GOOD")
 bad = create_color_func("BAD")
 warn = create_color_func("WARN")
 from portage.package.ebuild.doebuild import _check_temp_dir
+from portage.cache.index.eclass_index import EclassIndex
 from portage.metadata import action_metadata
+from portage.sync.changed_paths import affected_cps, write_changed_paths
 from portage.util._async.AsyncFunction import AsyncFunction
 from portage import OrderedDict
 from portage import _unicode_decode
@@ -36,6 +39,7 @@ class TaskHandler(object):
 		self.show_progress_bar = show_progress_bar
 		self.verbose = verbose
 		self.callback = callback
+		self.changed_paths = None
 		self.isatty = os.environ.get('TERM') != 'dumb' and sys.stdout.isatty()
 		self.progress_bar = ProgressBar(self.isatty, title="Portage-Sync", max_desc_length=27)
 
@@ -65,6 +69,7 @@ class TaskHandler(object):
 				'options': options.copy()
 				}
 			result = getattr(inst, func)(**kwargs)
+			self.changed_paths = getattr(inst, 'changed_paths', None)
 			if show_progress:
 				# make sure the final progress is displayed
 				self.progress_bar.display()
@@ -144,11 +149,11 @@ class SyncManager(object):
 		else:
 			msg = "\n%s: Sync module '%s' is not an installed/known type'\n" \
 				% (bad("ERROR"), repo.sync_type)
-			return self.exitcode, msg, self.updatecache_flg, hooks_enabled
+			return self.exitcode, msg, self.updatecache_flg, hooks_enabled, None
 
 		rval = self.pre_sync(repo)
 		if rval != os.EX_OK:
-			return rval, None, self.updatecache_flg, hooks_enabled
+			return rval, None, self.updatecache_flg, hooks_enabled, None
 
 		# need to pass the kwargs dict to the modules
 		# so they are available if needed.
@@ -166,14 +171,19 @@ class SyncManager(object):
 		status = None
 		taskmaster = TaskHandler(callback=self.do_callback)
 		taskmaster.run_tasks(tasks, func, status, options=task_opts)
+		changed_paths = None
+		if self.exitcode == os.EX_OK:
+			changed_paths = taskmaster.changed_paths
 
 		if (master_hooks or self.updatecache_flg or
 			not repo.sync_hooks_only_on_change):
 			hooks_enabled = True
 			self.perform_post_sync_hook(
-				repo.name, repo.sync_uri, repo.location)
+				repo.name, repo.sync_uri, repo.location,
+				changed_paths=changed_paths)
 
-		return self.exitcode, None, self.updatecache_flg, hooks_enabled
+		return (self.exitcode, None, self.updatecache_flg, hooks_enabled,
+			changed_paths)
 
 
 	def do_callback(self, result):
@@ -190,28 +200,48 @@ class SyncManager(object):
 		return
 
 
-	def perform_post_sync_hook(self, reponame, dosyncuri='', repolocation=''):
+	def perform_post_sync_hook(self, reponame, dosyncuri='', repolocation='',
+		changed_paths=None):
 		succeeded = os.EX_OK
 		if reponame:
 			_hooks = self.hooks["repo.postsync.d"]
 		else:
 			_hooks = self.hooks["postsync.d"]
-		for filepath in _hooks:
-			writemsg_level("Spawning post_sync hook: %s\n"
-				% (_unicode_decode(_hooks[filepath])),
-				level=logging.ERROR, noiselevel=4)
-			if reponame:
-				retval = portage.process.spawn(
-					[filepath, reponame, dosyncuri, repolocation],
-					env=self.settings.environ())
-			else:
-				retval = portage.process.spawn([filepath],
-					env=self.settings.environ())
-			if retval != os.EX_OK:
-				writemsg_level(" %s Spawn failed for: %s, %s\n" % (bad("*"),
-					_unicode_decode(_hooks[filepath]), filepath),
-					level=logging.ERROR, noiselevel=-1)
-				succeeded = retval
+		if not _hooks:
+			return succeeded
+		env = self.settings.environ()
+		changed_paths_file = None
+		if reponame and changed_paths is not None:
+			# Expose the changed path list to repo hooks, so that
+			# they can pass it to egencache --changed-paths.
+			fd, changed_paths_file = tempfile.mkstemp(
+				prefix="changed_paths.")
+			os.close(fd)
+			write_changed_paths(changed_paths_file, changed_paths)
+			env["PORTAGE_SYNC_CHANGED_PATHS"] = changed_paths_file
+		try:
+			for filepath in _hooks:
+				writemsg_level("Spawning post_sync hook: %s\n"
+					% (_unicode_decode(_hooks[filepath])),
+					level=logging.ERROR, noiselevel=4)
+				if reponame:
+					retval = portage.process.spawn(
+						[filepath, reponame, dosyncuri, repolocation],
+						env=env)
+				else:
+					retval = portage.process.spawn([filepath],
+						env=env)
+				if retval != os.EX_OK:
+					writemsg_level(" %s Spawn failed for: %s, %s\n" % (bad("*"),
+						_unicode_decode(_hooks[filepath]), filepath),
+						level=logging.ERROR, noiselevel=-1)
+					succeeded = retval
+		finally:
+			if changed_paths_file is not None:
+				try:
+					os.unlink(changed_paths_file)
+				except OSError:
+					pass
 		return succeeded
 
 
@@ -349,8 +379,10 @@ class SyncManager(object):
 		repo = proc.kwargs['repo']
 		exitcode = proc.returncode
 		updatecache_flg = False
+		changed_paths = None
 		if proc.returncode == os.EX_OK:
-			exitcode, message, updatecache_flg, hooks_enabled = proc.result
+			exitcode, message, updatecache_flg, hooks_enabled, \
+				changed_paths = proc.result
 
 		if updatecache_flg and "metadata-transfer" not in self.settings.features:
 			updatecache_flg = False
@@ -361,8 +393,14 @@ class SyncManager(object):
 
 			# Only update cache for repo.location since that's
 			# the only one that's been synced here.
+			cp_iter = None
+			if changed_paths is not None:
+				# Transfer only the entries of packages that have changed.
+				cp_iter = affected_cps(changed_paths,
+					self.portdb.auxdb.get(repo.location),
+					EclassIndex.for_repo(self.portdb, repo.location))
 			action_metadata(self.settings, self.portdb, self.emerge_config.opts,
-				porttrees=[repo.location])
+				porttrees=[repo.location], cp_iter=cp_iter)
 
 
 class SyncRepo(CompositeTask):
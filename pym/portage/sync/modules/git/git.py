@@ -141,8 +141,26 @@ class GitSync(NewBase):
 		current_rev = subprocess.check_output(rev_cmd,
 			cwd=portage._unicode_encode(self.repo.location))
 
+		self.changed_paths = self._diff_paths(previous_rev, current_rev)
+
 		return (os.EX_OK, current_rev != previous_rev)
 
+	def _diff_paths(self, previous_rev, current_rev):
+		'''Get the paths that differ between two revisions'''
+		previous_rev = portage._unicode_decode(previous_rev).strip()
+		current_rev = portage._unicode_decode(current_rev).strip()
+		if previous_rev == current_rev:
+			return []
+		diff_cmd = [self.bin_command, "diff", "--name-only", "-z",
+			previous_rev, current_rev]
+		try:
+			output = subprocess.check_output(diff_cmd,
+				cwd=portage._unicode_encode(self.repo.location))
+		except subprocess.CalledProcessError:
+			# The previous revision may be missing from a shallow clone.
+			return None
+		return [x for x in portage._unicode_decode(output).split("\0") if x]
+
 	def verify_head(self):
 		if (self.repo.module_specific_options.get(
 				'sync-git-verify-commit-signature', 'false') != 'true'):
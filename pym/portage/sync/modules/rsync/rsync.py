@@ -43,6 +43,11 @@ else:
 SERVER_OUT_OF_DATE = -1
 EXCEEDED_MAX_RETRIES = -2
 
+# Matches rsync --log-file lines such as
+# "2018/01/01 00:00:00 [1234] >f+++++++++ app-misc/foo/foo-1.ebuild".
+_changes_log_re = re.compile(
+	r'^\S+ \S+ \[\d+\] (\*deleting\s*|[<>ch.*][fdLDS]\S*) (.+)$')
+
 
 class RsyncSync(NewBase):
 	'''Rsync sync module'''
@@ -79,6 +84,9 @@ class RsyncSync(NewBase):
 				(self.repo.location, vcs_dir), level=logging.ERROR, noiselevel=-1)
 			return (1, False)
 		self.timeout=180
+		# The paths that are changed by all attempts, since an attempt
+		# that fails may still have changed some files.
+		self.changed_paths = []
 
 		rsync_opts = []
 		if self.settings["PORTAGE_RSYNC_OPTS"] == "":
@@ -662,6 +670,17 @@ class RsyncSync(NewBase):
 				else:
 					command.extend([syncuri + "/", self.repo.location])
 
+				# Record the transferred and deleted files, so that
+				# metadata regeneration can be restricted to the
+				# affected packages.
+				fd, changes_log = tempfile.mkstemp(dir=tmpdir)
+				os.close(fd)
+				if self.usersync_uid is not None:
+					portage.util.apply_permissions(changes_log,
+						uid=self.usersync_uid)
+				command[1:1] = ["--log-file=%s" % changes_log,
+					"--log-file-format=%i %n"]
+
 				exitcode = None
 				try:
 					exitcode = portage.process.spawn(command,
@@ -687,9 +706,25 @@ class RsyncSync(NewBase):
 							os.unlink(self.servertimestampfile)
 						except OSError:
 							pass
+						# The log may also be missing the files that
+						# were being transferred when rsync stopped,
+						# so the whole repository has to be treated
+						# as changed.
+						self.changed_paths = None
 					else:
 						updatecache_flg = True
 
+					if self.changed_paths is not None:
+						changed_paths = self._parse_changes_log(changes_log)
+						if changed_paths is None:
+							self.changed_paths = None
+						else:
+							self.changed_paths.extend(changed_paths)
+					try:
+						os.unlink(changes_log)
+					except OSError:
+						pass
+
 				if exitcode in [0,1,3,4,11,14,20,21]:
 					is_synced = True
 		elif exitcode in [1,3,4,11,14,20,21]:
@@ -702,3 +737,27 @@ class RsyncSync(NewBase):
 			pass
 
 		return local_state_unchanged, is_synced, exitcode, updatecache_flg
+
+
+	@staticmethod
+	def _parse_changes_log(changes_log):
+		'''Extract the changed file paths from an rsync log file
+		written with --log-file-format="%i %n"'''
+		changed_paths = []
+		try:
+			with io.open(portage._unicode_encode(changes_log),
+				mode='r', encoding=portage._encodings['repo.content'],
+				errors='replace') as f:
+				for line in f:
+					match = _changes_log_re.match(line.rstrip('\n'))
+					if match is None:
+						continue
+					item, path = match.groups()
+					if item.startswith('*deleting'):
+						if not path.endswith('/'):
+							changed_paths.append(path)
+					elif item[1:2] == 'f':
+						changed_paths.append(path)
+		except (IOError, OSError):
+			return None
+		return changed_paths
@@ -38,6 +38,9 @@ class SyncBase(object):
 		self.bin_command = None
 		self._bin_command = bin_command
 		self.bin_pkg = bin_pkg
+		# Repository relative paths of the files that the last sync
+		# operation added, modified or removed, or None if unknown.
+		self.changed_paths = None
 		if bin_command:
 			self.bin_command = portage.process.find_binary(bin_command)
 
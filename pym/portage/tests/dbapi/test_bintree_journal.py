@@ -0,0 +1,104 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.dbapi.bintree import binarytree
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class BintreeJournalTestCase(TestCase):
+
+	def testJournal(self):
+		binpkgs = {
+			"dev-libs/A-1": {"KEYWORDS": "a"},
+			"dev-libs/B-1": {"KEYWORDS": "b"},
+			"dev-libs/C-1": {"KEYWORDS": "c"},
+		}
+		playground = ResolverPlayground(binpkgs=binpkgs, user_config={
+			"make.conf": ('FEATURES="binpkg-index-journal"',),
+		})
+		try:
+			settings = playground.settings
+			bintree = playground.trees[playground.eroot]["bintree"]
+			bintree.populate()
+
+			def read_index():
+				with open(bintree._pkgindex_file) as f:
+					return f.read()
+
+			def remote_keywords():
+				# Binhost clients read only the Packages file.
+				pkgindex = bintree._new_pkgindex()
+				with open(bintree._pkgindex_file) as f:
+					pkgindex.read(f)
+				return keywords(pkgindex)
+
+			def keywords(pkgindex):
+				return dict((d["CPV"], d["KEYWORDS"])
+					for d in pkgindex.packages)
+
+			index = read_index()
+			bintree.dbapi.aux_update("dev-libs/A-1",
+				{"KEYWORDS": "a-updated"})
+
+			# The update is journaled, without rewriting Packages.
+			self.assertTrue(os.path.exists(bintree._pkgindex_journal_file))
+			self.assertEqual(read_index(), index)
+			self.assertEqual(keywords(bintree._load_pkgindex()), {
+				"dev-libs/A-1": "a-updated",
+				"dev-libs/B-1": "b",
+				"dev-libs/C-1": "c",
+			})
+
+			# A new reader sees the merged view, and its populate
+			# does not need to rewrite the index.
+			other = binarytree(pkgdir=settings["PKGDIR"], settings=settings)
+			other.populate()
+			self.assertEqual(other.dbapi.aux_get("dev-libs/A-1",
+				["KEYWORDS"]), ["a-updated"])
+			self.assertEqual(read_index(), index)
+
+			# Reaching the journal limit triggers compaction.
+			bintree._pkgindex_journal_max = 2
+			bintree.dbapi.aux_update("dev-libs/B-1",
+				{"KEYWORDS": "b-updated"})
+			self.assertFalse(os.path.exists(bintree._pkgindex_journal_file))
+			self.assertTrue("a-updated" in read_index())
+			self.assertTrue("b-updated" in read_index())
+
+			# A journal which belongs to a different Packages file
+			# is ignored.
+			bintree.dbapi.aux_update("dev-libs/C-1",
+				{"KEYWORDS": "c-updated"})
+			with open(bintree._pkgindex_journal_file) as f:
+				journal = f.read()
+			with open(bintree._pkgindex_journal_file, "w") as f:
+				f.write(journal.replace("TIMESTAMP: ", "TIMESTAMP: 1", 1))
+			self.assertEqual(
+				keywords(bintree._load_pkgindex())["dev-libs/C-1"], "c")
+
+			# Compaction removes the journal.
+			bintree._pkgindex_compact()
+			self.assertFalse(os.path.exists(bintree._pkgindex_journal_file))
+			self.assertEqual(remote_keywords()["dev-libs/B-1"], "b-updated")
+
+			# Journaled entries are not visible to binhost clients, until
+			# the Packages file reaches the journal age limit and is
+			# rewritten by the next update.
+			bintree._pkgindex_journal_max = 100
+			bintree.dbapi.aux_update("dev-libs/A-1",
+				{"KEYWORDS": "a-journaled"})
+			self.assertTrue(os.path.exists(bintree._pkgindex_journal_file))
+			self.assertEqual(remote_keywords()["dev-libs/A-1"], "a-updated")
+			bintree._pkgindex_journal_max_age = 0
+			bintree.dbapi.aux_update("dev-libs/B-1",
+				{"KEYWORDS": "b-journaled"})
+			self.assertFalse(os.path.exists(bintree._pkgindex_journal_file))
+			self.assertEqual(remote_keywords(), {
+				"dev-libs/A-1": "a-journaled",
+				"dev-libs/B-1": "b-journaled",
+				"dev-libs/C-1": "c",
+			})
+		finally:
+			playground.cleanup()
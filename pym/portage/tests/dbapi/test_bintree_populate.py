@@ -0,0 +1,57 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.dbapi.bintree import binarytree
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class BintreePopulateTestCase(TestCase):
+
+	def testConcurrentScan(self):
+		binpkgs = dict(("dev-libs/A%d-1" % i, {"KEYWORDS": "x86"})
+			for i in range(20))
+		binpkgs["dev-libs/B-1"] = {"KEYWORDS": "x86", "BUILD_ID": "1"}
+		binpkgs["dev-libs/B-2"] = {"KEYWORDS": "x86", "SLOT": ""}
+		playground = ResolverPlayground(binpkgs=binpkgs)
+		try:
+			settings = playground.settings
+			pkgdir = settings["PKGDIR"]
+
+			def scan(jobs):
+				settings.unlock()
+				settings["PORTAGE_BINPKG_SCAN_JOBS"] = str(jobs)
+				settings.lock()
+				bintree = binarytree(pkgdir=pkgdir, settings=settings)
+				calls = []
+				read_metadata = bintree._read_metadata
+				bintree._read_metadata = lambda *args, **kwargs: \
+					calls.append(os.path.basename(args[0])) or \
+					read_metadata(*args, **kwargs)
+				bintree.populate()
+				return bintree, sorted(calls)
+
+			def contents(bintree):
+				return sorted((cpv, bintree.dbapi.aux_get(cpv,
+					["SLOT", "BUILD_ID", "_mtime_"]), bintree.getname(cpv))
+					for cpv in bintree.dbapi.cpv_all())
+
+			# Without an index, every xpak is read, both by the
+			# unlocked and by the locked pass of populate.
+			serial, serial_calls = scan(1)
+			self.assertEqual(len(serial_calls), 2 * 22)
+			os.unlink(serial._pkgindex_file)
+			parallel, calls = scan(4)
+			self.assertEqual(calls, serial_calls)
+			self.assertEqual(len(parallel.dbapi.cpv_all()), 21)
+			self.assertEqual(contents(parallel), contents(serial))
+			self.assertEqual(parallel.invalids, serial.invalids)
+
+			# Once the index is up to date, only the xpak of the
+			# invalid package is read.
+			bintree, calls = scan(4)
+			self.assertEqual(contents(bintree), contents(serial))
+			self.assertEqual(calls, ["B-2.tbz2"])
+		finally:
+			playground.cleanup()
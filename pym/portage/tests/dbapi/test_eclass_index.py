@@ -0,0 +1,91 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage.cache.index.eclass_index import EclassIndex
+from portage.sync.changed_paths import affected_cps
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class EclassIndexTestCase(TestCase):
+
+	def testEclassIndex(self):
+		cache = {
+			"dev-libs/A-1": {"_eclasses_": {"foo": ("", 0)}},
+			"dev-libs/B-1": {"_eclasses_": {"foo": ("", 0), "bar": ("", 0)}},
+			"dev-libs/C-1": {"_eclasses_": {}},
+		}
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, "eclass_index")
+			index = EclassIndex(filename)
+			self.assertFalse(index.load())
+			index.populate(cache)
+			self.assertEqual(index.consumers("foo"),
+				frozenset(["dev-libs/A-1", "dev-libs/B-1"]))
+			self.assertEqual(index.consumers("bar"),
+				frozenset(["dev-libs/B-1"]))
+			self.assertEqual(len(index), 3)
+			index.save()
+
+			index = EclassIndex(filename)
+			self.assertTrue(index.load())
+			self.assertEqual(len(index), 3)
+			self.assertEqual(index.eclasses("dev-libs/C-1"), frozenset())
+
+			index.update("dev-libs/B-1", ["bar"])
+			index.discard("dev-libs/A-1")
+			self.assertEqual(index.consumers("foo"), frozenset())
+			self.assertEqual(index.consumers("bar"),
+				frozenset(["dev-libs/B-1"]))
+			index.save()
+
+			index = EclassIndex(filename)
+			index.load()
+			self.assertFalse("dev-libs/A-1" in index)
+			self.assertEqual(index.eclasses("dev-libs/B-1"),
+				frozenset(["bar"]))
+
+			index.remove()
+			self.assertFalse(index.exists())
+			index.remove()
+		finally:
+			shutil.rmtree(tmpdir)
+
+	def testPortdbInvalidation(self):
+		playground = ResolverPlayground(ebuilds={"dev-libs/A-1": {}})
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			repo_path = portdb.getRepositoryPath("test_repo")
+			cache = portdb.auxdb[repo_path]
+			index = EclassIndex.for_repo(portdb, repo_path)
+			self.assertEqual(index.filename, os.path.join(
+				portdb.depcachedir, "eclass_index", "test_repo"))
+			index.populate(cache)
+			index.save()
+			self.assertTrue(EclassIndex.for_repo(portdb, repo_path).load())
+			self.assertTrue("dev-libs/A-1" in index)
+
+			# The index is not used for another cache location.
+			self.assertFalse(EclassIndex(index.filename,
+				location=repo_path).load())
+
+			# Writing a cache entry removes the index, since portdbapi
+			# does not maintain it.
+			del cache["dev-libs/A-1"]
+			portdb._aux_cache.clear()
+			portdb.aux_get("dev-libs/A-1", ["EAPI"])
+			self.assertFalse(index.exists())
+			self.assertTrue("dev-libs/A-1" in cache)
+
+			# The index is rebuilt when it is needed.
+			self.assertEqual(affected_cps(["eclass/foo.eclass"], cache,
+				index), set())
+			self.assertTrue(index.exists())
+			self.assertFalse(".eclass_index" in os.listdir(repo_path))
+		finally:
+			playground.cleanup()
@@ -0,0 +1,103 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+
+from portage.getbinpkg import PackageIndex, _PackageIndexEntry
+from portage.tests import TestCase
+
+_packages = """CHOST: x86_64-pc-linux-gnu
+PACKAGES: 4
+REPO: gentoo
+TIMESTAMP: 1500000000
+
+CPV: dev-libs/A-1
+DESC: first
+SLOT: 1
+SLOT: 2
+UNKNOWN: x
+
+BUILD_ID: 1
+DESC: no cpv
+
+CPV: dev-libs/B-1
+CHOST: i686-pc-linux-gnu
+EAPI:
+REPO: other
+
+CPV: dev-libs/C-1
+KEYWORDS: x86
+"""
+
+
+class PackageIndexTestCase(TestCase):
+
+	def _new_pkgindex(self, lazy):
+		return PackageIndex(
+			allowed_pkg_keys=("BUILD_ID", "CHOST", "CPV", "DESC",
+				"DESCRIPTION", "EAPI", "KEYWORDS", "PATH", "REPO",
+				"SLOT", "repository"),
+			default_header_data={"CHOST": "", "repository": ""},
+			default_pkg_data={"EAPI": "0", "SLOT": "0"},
+			inherited_keys=("CHOST", "repository"),
+			translated_keys=(("DESCRIPTION", "DESC"),
+				("repository", "REPO")),
+			lazy=lazy)
+
+	def _read(self, lazy):
+		pkgindex = self._new_pkgindex(lazy)
+		pkgindex.read(io.StringIO(_packages))
+		return pkgindex
+
+	def _write(self, pkgindex):
+		f = io.StringIO()
+		pkgindex.write(f)
+		return f.getvalue()
+
+	def testLazyRead(self):
+		eager = self._read(False)
+		lazy = self._read(True)
+		self.assertEqual(len(lazy.packages), 3)
+		self.assertTrue(all(isinstance(d, _PackageIndexEntry)
+			for d in lazy.packages))
+		self.assertEqual(lazy.header, eager.header)
+		for d_lazy, d_eager in zip(lazy.packages, eager.packages):
+			self.assertEqual(dict(d_lazy.items()), dict(d_eager.items()))
+			self.assertEqual(sorted(d_lazy), sorted(d_eager))
+			for k in ("BUILD_ID", "CHOST", "DESC", "DESCRIPTION", "EAPI",
+				"REPO", "SLOT", "UNKNOWN", "repository"):
+				self.assertEqual(d_lazy.get(k), d_eager.get(k))
+				self.assertEqual(k in d_lazy, k in d_eager)
+
+		a, b, c = lazy.packages
+		self.assertEqual(a["SLOT"], "2")
+		self.assertEqual(a["DESCRIPTION"], "first")
+		self.assertEqual(b["EAPI"], "")
+		self.assertEqual(b["repository"], "other")
+		self.assertEqual(c["repository"], "gentoo")
+		self.assertRaises(KeyError, lambda: c["PATH"])
+
+		# Values are inherited from the header as it was read.
+		lazy.header["CHOST"] = "changed"
+		self.assertEqual(c["CHOST"], "x86_64-pc-linux-gnu")
+
+	def testLazyModify(self):
+		eager = self._read(False)
+		lazy = self._read(True)
+		self.assertEqual(self._write(lazy), self._write(eager))
+
+		for pkgindex in (eager, lazy):
+			a, b, c = pkgindex.packages
+			a["PATH"] = "dev-libs/A-1.xpak"
+			b.pop("REPO", None)
+			b.pop("repository")
+			c.setdefault("KEYWORDS", "amd64")
+
+		a, b, c = lazy.packages
+		self.assertEqual(a._data, None)
+		self.assertEqual(a["PATH"], "dev-libs/A-1.xpak")
+		self.assertTrue("PATH" in a.copy())
+		self.assertNotEqual(b._data, None)
+		self.assertFalse("repository" in b)
+		self.assertEqual(c["KEYWORDS"], "x86")
+		self.assertEqual(self._write(lazy), self._write(eager))
@@ -0,0 +1,69 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import io
+
+from portage import os, _encodings
+from portage.cache.index.pkg_trigram_index import (pkg_trigram_index_lines,
+	pkg_trigram_index_search, pkg_trigrams)
+from portage.dbapi.IndexedPortdb import IndexedPortdb
+from portage.dbapi._similar_name_search import similar_name_search
+from portage.dep import Atom
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class PkgTrigramIndexTestCase(TestCase):
+
+	def testPkgTrigramIndex(self):
+		self.assertEqual(pkg_trigrams("Sed"),
+			set(["^^s", "^se", "sed", "ed$", "d$$"]))
+
+		lines = list(pkg_trigram_index_lines(
+			["sys-apps/sed", "dev-util/sedutil", "sys-apps/usleep"]))
+		self.assertEqual(lines, sorted(lines))
+		self.assertTrue("sed dev-util/sedutil sys-apps/sed\n" in lines)
+		self.assertEqual(pkg_trigram_index_search(lines, "sde"),
+			set(["sys-apps/sed", "dev-util/sedutil"]))
+		self.assertEqual(pkg_trigram_index_search(lines, "usleap"),
+			set(["sys-apps/usleep"]))
+		self.assertEqual(pkg_trigram_index_search(lines, "xyz"), set())
+		self.assertEqual(pkg_trigram_index_search(lines, "sep"),
+			set(["sys-apps/sed", "dev-util/sedutil", "sys-apps/usleep"]))
+
+	def testSimilarNameSearch(self):
+		ebuilds = {
+			"dev-libs/libfoo-1": {},
+			"dev-libs/libfoobar-1": {},
+			"dev-util/foo-1": {},
+			"sys-apps/bar-1": {},
+			"sys-apps/baz-1": {},
+		}
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			indexed_portdb = IndexedPortdb(portdb)
+			self.assertEqual(indexed_portdb.cp_similar("liba"), None)
+
+			expected = {}
+			for atom in ("dev-libs/libfo", "null/libfooo", "sys-apps/bax"):
+				atom = Atom(atom)
+				expected[atom] = similar_name_search([portdb], atom)
+				self.assertTrue(expected[atom])
+
+			repo = portdb.repositories["test_repo"]
+			with io.open(os.path.join(repo.location, "metadata",
+				"pkg_trigram_index"), mode="w",
+				encoding=_encodings["repo.content"]) as f:
+				f.writelines(pkg_trigram_index_lines(portdb.cp_all()))
+
+			self.assertEqual(indexed_portdb.cp_similar("liba"),
+				set(["dev-libs/libfoo", "dev-libs/libfoobar"]))
+			for atom, matches in expected.items():
+				self.assertEqual(
+					similar_name_search([IndexedPortdb(portdb)], atom),
+					matches)
+		finally:
+			playground.cleanup()
@@ -0,0 +1,64 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import io
+
+from portage import os, _encodings
+from portage.cache.index.pkg_word_index import (pkg_word_index_lines,
+	pkg_word_index_search, pkg_words)
+from portage.dbapi.IndexedPortdb import IndexedPortdb
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class PkgWordIndexTestCase(TestCase):
+
+	def testPkgWordIndex(self):
+		self.assertEqual(pkg_words("Super-useful stream editor"),
+			set(["super", "useful", "stream", "editor"]))
+
+		lines = list(pkg_word_index_lines([
+			("sys-apps/sed", "Super-useful stream editor"),
+			("app-editors/vim", "Vim, an improved vi-style text editor"),
+			("sys-apps/usleep", "A wrapper for usleep"),
+		]))
+		self.assertEqual(lines, sorted(lines))
+		self.assertTrue("editor app-editors/vim sys-apps/sed\n" in lines)
+		self.assertEqual(pkg_word_index_search(lines, "EDITOR"),
+			set(["sys-apps/sed", "app-editors/vim"]))
+		self.assertEqual(pkg_word_index_search(lines, "ream edit"),
+			set(["sys-apps/sed"]))
+		self.assertEqual(pkg_word_index_search(lines, "vi-st"),
+			set(["app-editors/vim"]))
+		self.assertEqual(pkg_word_index_search(lines, "stream vim"), set())
+		self.assertEqual(pkg_word_index_search(lines, " - "), None)
+
+	def testDescMatch(self):
+		ebuilds = {
+			"sys-apps/sed-1": {"DESCRIPTION": "Super-useful stream editor"},
+			"app-editors/vim-1": {"DESCRIPTION": "Vim, an improved editor"},
+			"sys-apps/usleep-1": {"DESCRIPTION": "A wrapper for usleep"},
+		}
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			indexed_portdb = IndexedPortdb(portdb)
+			self.assertEqual(indexed_portdb.cp_desc_match("editor"), None)
+
+			repo = portdb.repositories["test_repo"]
+			with io.open(os.path.join(repo.location, "metadata",
+				"pkg_word_index"), mode="w",
+				encoding=_encodings["repo.content"]) as f:
+				f.writelines(pkg_word_index_lines(
+					(cp, portdb.aux_get(portdb.cp_list(cp)[-1],
+					["DESCRIPTION"])[0]) for cp in portdb.cp_all()))
+
+			self.assertEqual(indexed_portdb.cp_desc_match("editor"),
+				set(["sys-apps/sed", "app-editors/vim"]))
+			self.assertEqual(indexed_portdb.cp_desc_match("wrap"),
+				set(["sys-apps/usleep"]))
+			self.assertEqual(indexed_portdb.cp_desc_match("-"), None)
+		finally:
+			playground.cleanup()
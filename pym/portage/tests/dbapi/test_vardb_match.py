@@ -0,0 +1,55 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import shutil
+from portage.package.ebuild._ipc.QueryCommand import QueryCommand
+from portage.package.ebuild.config import config
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class VardbMatchTestCase(TestCase):
+
+	def testMatchCache(self):
+		installed = {
+			"dev-libs/A-1": {"SLOT": "1"},
+			"dev-libs/A-2": {"SLOT": "2"},
+			"dev-libs/B-1": {},
+		}
+		playground = ResolverPlayground(installed=installed)
+		try:
+			vardb = playground.trees[playground.eroot]["vartree"].dbapi
+			iter_match_calls = []
+			iter_match = vardb._iter_match
+
+			def counting_iter_match(atom, cpv_iter):
+				iter_match_calls.append(atom)
+				return iter_match(atom, cpv_iter)
+
+			vardb._iter_match = counting_iter_match
+
+			settings = config(clone=playground.settings)
+			settings["EAPI"] = "6"
+			settings["PORTAGE_USE"] = ""
+			QueryCommand._db = playground.trees
+			query = QueryCommand(settings, "compile")
+
+			for i in range(3):
+				self.assertEqual(vardb.match("dev-libs/A:2"),
+					["dev-libs/A-2"])
+				self.assertEqual(query(["best_version", playground.eroot,
+					"dev-libs/A"]), ("dev-libs/A-2\n", "", 0))
+			self.assertEqual(len(iter_match_calls), 2)
+
+			# Unmerge dev-libs/A-2 like dblink does, which invalidates
+			# the cache of its category.
+			shutil.rmtree(vardb.getpath("dev-libs/A-2"))
+			vardb._bump_mtime("dev-libs/A-2")
+			self.assertEqual(vardb.match("dev-libs/A:2"), [])
+			self.assertEqual(query(["has_version", playground.eroot,
+				"dev-libs/A:2"]), ("", "", 1))
+			self.assertEqual(query(["best_version", playground.eroot,
+				"dev-libs/A"]), ("dev-libs/A-1\n", "", 0))
+		finally:
+			QueryCommand._db = None
+			playground.cleanup()
@@ -0,0 +1,94 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import os as _os
+import threading
+import time
+
+from portage import os
+from portage.checksum import checksum_str
+from portage.package.ebuild.config import config
+from portage.package.ebuild.fetch import fetch
+from portage.process import find_binary
+from portage.tests import TestCase
+from portage.tests.ebuild.test_segmented_fetch import (_RangeRequestHandler,
+	_ThreadingHTTPServer)
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class _SlowRequestHandler(_RangeRequestHandler):
+	"""
+	Delay every response, and record the highest number of requests
+	that were in flight at the same time.
+	"""
+
+	def do_GET(self):
+		server = self.server
+		with server.lock:
+			server.active += 1
+			server.max_active = max(server.max_active, server.active)
+		try:
+			time.sleep(0.3)
+			_RangeRequestHandler.do_GET(self)
+		finally:
+			with server.lock:
+				server.active -= 1
+
+
+class ConcurrentFetchTestCase(TestCase):
+
+	def testConcurrentFetch(self):
+		if find_binary("wget") is None:
+			self.skipTest("wget not found")
+
+		server = _ThreadingHTTPServer(("127.0.0.1", 0), _SlowRequestHandler)
+		server.files = {}
+		server.requests = []
+		server.lock = threading.Lock()
+		server.active = 0
+		server.max_active = 0
+		server_thread = threading.Thread(target=server.serve_forever)
+		server_thread.daemon = True
+		server_thread.start()
+
+		digests = {}
+		uris = {}
+		for i in range(6):
+			name = "file-%d.tar" % i
+			data = _os.urandom(1000 + i)
+			server.files[name] = data
+			digests[name] = {
+				"size": len(data),
+				"SHA512": checksum_str(data, "SHA512"),
+			}
+			uris[name] = ["http://127.0.0.1:%d/distfiles/%s" %
+				(server.server_address[1], name)]
+
+		playground = ResolverPlayground(user_config={
+			"make.conf": ('PORTAGE_FETCH_JOBS="3"', 'FEATURES="-userfetch"'),
+		})
+		try:
+			settings = config(clone=playground.settings)
+			self.assertEqual(fetch(uris, settings, fetchonly=1,
+				digests=digests, try_mirrors=0), 1)
+			for name in uris:
+				with open(os.path.join(settings["DISTDIR"], name), "rb") as f:
+					self.assertEqual(f.read(), server.files[name])
+			self.assertEqual(len(server.requests), len(uris))
+			self.assertTrue(1 < server.max_active <= 3)
+
+			# A failure of one file is reported, while the remaining
+			# files are still fetched.
+			os.unlink(os.path.join(settings["DISTDIR"], "file-0.tar"))
+			uris["missing.tar"] = ["http://127.0.0.1:%d/missing/missing.tar" %
+				(server.server_address[1],)]
+			digests["missing.tar"] = {"size": 1, "SHA512": "0" * 128}
+			server.files["missing.tar"] = b"x"
+			self.assertEqual(fetch(uris, settings, fetchonly=1,
+				digests=digests, try_mirrors=0), 0)
+			self.assertTrue(os.path.exists(
+				os.path.join(settings["DISTDIR"], "file-0.tar")))
+		finally:
+			playground.cleanup()
+			server.shutdown()
+			server.server_close()
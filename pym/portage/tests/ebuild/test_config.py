@@ -9,12 +9,15 @@ import tempfile
 import portage
 from portage import os, shutil, _encodings
 from portage.const import USER_CONFIG_PATH
-from portage.dep import Atom
+from portage.dep import Atom, match_from_list
 from portage.package.ebuild.config import config
 from portage.package.ebuild._config.LicenseManager import LicenseManager
+from portage.package.ebuild._config.helper import AtomIndex, \
+	ordered_by_atom_specificity
 from portage.tests import TestCase
 from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
 from portage.util import normalize_path
+from portage.versions import _pkg_str
 
 class ConfigTestCase(TestCase):
 
@@ -130,10 +133,102 @@ class ConfigTestCase(TestCase):
 			self.assertEqual(lic_man.getMissingLicenses("dev-libs/C-1", [], "TEST5", "0", None), [])
 			self.assertEqual(lic_man.getMissingLicenses("dev-libs/C-2", [], "TEST2", "0", None), ["TEST2"])
 			self.assertEqual(lic_man.getMissingLicenses("dev-libs/D-1", [], "", "0", None), [])
+
+			# Memoized results are discarded when ACCEPT_LICENSE changes.
+			lic_man.set_accept_license_str("TEST")
+			self.assertEqual(lic_man._getPkgAcceptLicense("dev-libs/A-1", "0", None), ["TEST", "TEST", "-TEST2"])
 		finally:
 			portage.util.noiselimit = 0
 			playground.cleanup()
 
+	def testUseMaskMemo(self):
+		"""
+		Test that getUseMask, getUseForce and getPUSE give the same
+		results for packages that share memoized results.
+		"""
+
+		profile = {
+			"eapi": ("5",),
+			"use.mask": ("a", "b"),
+			"use.force": ("c",),
+			"package.use.mask": (
+				"dev-libs/A -b",
+				">=dev-libs/A-2 d",
+				"dev-libs/A:1 e",
+			),
+			"package.use.stable.mask": ("dev-libs/B f",),
+		}
+		user_config = {
+			"package.use": (">=dev-libs/A-2 x", "dev-libs/A:1 -y"),
+		}
+
+		playground = ResolverPlayground(profile=profile,
+			user_config=user_config)
+		try:
+			use_manager = playground.settings._use_manager
+			for i in range(2):
+				self.assertEqual(use_manager.getUseMask("dev-libs/A-1:1"),
+					frozenset(["a", "e"]))
+				self.assertEqual(use_manager.getUseMask("dev-libs/A-2:0"),
+					frozenset(["a", "d"]))
+				self.assertEqual(use_manager.getUseMask("dev-libs/B-1:0",
+					stable=True), frozenset(["a", "b", "f"]))
+				self.assertEqual(use_manager.getUseMask("dev-libs/B-1:0",
+					stable=False), frozenset(["a", "b"]))
+				self.assertEqual(use_manager.getUseMask("dev-libs/C-1:0"),
+					frozenset(["a", "b"]))
+				self.assertEqual(use_manager.getUseForce("dev-libs/A-1:1"),
+					frozenset(["c"]))
+				self.assertEqual(use_manager.getPUSE("dev-libs/A-1:1"), "-y")
+				self.assertEqual(use_manager.getPUSE("dev-libs/A-2:0"), "x")
+				self.assertEqual(use_manager.getPUSE("dev-libs/C-1:0"), "")
+		finally:
+			playground.cleanup()
+
+	def testAtomIndex(self):
+		"""
+		Test that AtomIndex finds the same atoms as match_from_list,
+		in the same order.
+		"""
+
+		atoms = [Atom(x, allow_wildcard=True, allow_repo=True) for x in (
+			">=dev-libs/A-2",
+			"=dev-libs/A-1.0",
+			"<dev-libs/A-1.0-r1",
+			"dev-libs/A:1",
+			"~dev-libs/A-2",
+			">dev-libs/A-1.0",
+			"=dev-libs/A-2*",
+			"<=dev-libs/A-2-r1::test_repo",
+			"=dev-libs/A-1.00",
+			"dev-libs/*",
+			"dev-libs/A",
+			">=dev-libs/A-1.0",
+			"<dev-libs/A-3",
+			"<=dev-libs/A-2-r1",
+			">dev-libs/A-0.5",
+			">=dev-libs/A-2:0",
+			"<dev-libs/A-2.1",
+			">=dev-libs/A-1.00",
+		)]
+		index = AtomIndex(atoms)
+		cpdict = dict((x, x) for x in atoms)
+		for cpv in ("dev-libs/A-0.9", "dev-libs/A-1.0", "dev-libs/A-1.0-r1",
+			"dev-libs/A-2", "dev-libs/A-2-r1", "dev-libs/A-2.1",
+			"dev-libs/A-20", "dev-libs/A-3"):
+			for slot in ("0", "1"):
+				for repo in ("test_repo", "other"):
+					pkg = _pkg_str(cpv, slot=slot, repo=repo)
+					expected = [x for x in atoms
+						if match_from_list(x, [pkg])]
+					self.assertEqual(index.match(pkg), expected)
+					self.assertEqual(index.first_match(pkg),
+						expected[0] if expected else None)
+					self.assertEqual(
+						ordered_by_atom_specificity(cpdict, pkg,
+						index=index),
+						ordered_by_atom_specificity(cpdict, pkg))
+
 	def testPackageMaskOrder(self):
 
 		ebuilds = {
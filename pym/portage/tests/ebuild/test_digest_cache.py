@@ -0,0 +1,55 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import tempfile
+
+from portage import os, shutil
+from portage._emirrordist.DigestCache import DigestCache
+from portage.tests import TestCase
+
+
+class DigestCacheTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def testGetSet(self):
+		path = os.path.join(self.tempdir, "foo.tar.gz")
+		with open(path, "wb") as f:
+			f.write(b"foo")
+		st = os.stat(path)
+
+		cache = DigestCache({}, 0)
+		self.assertEqual(cache.get("foo.tar.gz", st, "SHA512"), None)
+		cache.set("foo.tar.gz", st, {"SHA512": "abc"})
+		self.assertEqual(cache.get("foo.tar.gz", st, "SHA512"), "abc")
+		self.assertEqual(cache.get("foo.tar.gz", st, "BLAKE2B"), None)
+
+		# Entries are invalidated by a new mtime.
+		os.utime(path, (st.st_mtime + 1, st.st_mtime + 1))
+		self.assertEqual(cache.get("foo.tar.gz", os.stat(path), "SHA512"),
+			None)
+
+		cache.discard("foo.tar.gz")
+		self.assertEqual(cache.get("foo.tar.gz", st, "SHA512"), None)
+
+	def testReverify(self):
+		db = {}
+		distfiles = ["file-%d.tar.gz" % i for i in range(1000)]
+		reverified = set()
+		for run in range(4):
+			cache = DigestCache(db, 25)
+			selected = [x for x in distfiles if cache.reverify(x)]
+			# Each run selects roughly a quarter of the files.
+			self.assertTrue(150 < len(selected) < 350)
+			self.assertFalse(reverified.intersection(selected))
+			reverified.update(selected)
+			cache.finish()
+		# After 100 / 25 runs, every file has been selected once.
+		self.assertEqual(len(reverified), len(distfiles))
+
+		cache = DigestCache(db, 0)
+		self.assertFalse(any(cache.reverify(x) for x in distfiles))
@@ -0,0 +1,177 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import os as _os
+import tempfile
+import threading
+
+from portage import os, shutil
+from portage.checksum import checksum_str
+from portage.package.ebuild.config import config
+from portage.package.ebuild.fetch import fetch
+from portage.package.ebuild._distfiles_layout import (FilenameHashLayout,
+	FlatLayout, MirrorLayoutConfig, directory_layouts, distfile_path,
+	walk_distfiles)
+from portage.process import find_binary
+from portage.tests import TestCase
+from portage.tests.ebuild.test_segmented_fetch import (_RangeRequestHandler,
+	_ThreadingHTTPServer)
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+_layout_conf = """[structure]
+0=filename-hash SHA1 8:4
+1=flat
+"""
+
+
+class _PathRequestHandler(_RangeRequestHandler):
+	"""Serve server.files by path rather than by file name."""
+
+	def do_GET(self):
+		self.server.requests.append(self.path)
+		data = self.server.files.get(self.path)
+		if data is None:
+			self.send_error(404)
+			return
+		self.send_response(200)
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+
+class DistfilesLayoutTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def _write(self, path, data=b"data"):
+		parent = os.path.dirname(path)
+		if not os.path.isdir(parent):
+			os.makedirs(parent)
+		with open(path, "wb") as f:
+			f.write(data)
+
+	def testLayouts(self):
+		fnhash = checksum_str(b"foo-1.tar.gz", "SHA1")
+		layout = FilenameHashLayout("SHA1", "8:4")
+		self.assertEqual(layout.get_path("foo-1.tar.gz"),
+			"%s/%s/foo-1.tar.gz" % (fnhash[:2], fnhash[2]))
+		self.assertEqual(FlatLayout().get_path("foo-1.tar.gz"),
+			"foo-1.tar.gz")
+
+		conf = MirrorLayoutConfig()
+		conf.read_from_file(io.StringIO(_layout_conf +
+			"2=filename-hash NOSUCHHASH 8\n"
+			"3=filename-hash SHA1 6\n"
+			"4=unknown\n"))
+		self.assertEqual(len(conf.structure), 5)
+		layouts = conf.get_all_layouts()
+		self.assertEqual([type(x) for x in layouts],
+			[FilenameHashLayout, FlatLayout])
+
+		# An empty or unsupported structure implies the flat layout.
+		conf.read_from_file(io.StringIO("[structure]\n0=unknown\n"))
+		self.assertEqual([type(x) for x in conf.get_all_layouts()],
+			[FlatLayout])
+
+	def testDirectory(self):
+		layout = FilenameHashLayout("SHA1", "8:4")
+		self.assertEqual(distfile_path(self.tempdir, "foo-1.tar.gz"),
+			os.path.join(self.tempdir, "foo-1.tar.gz"))
+
+		with open(os.path.join(self.tempdir, "layout.conf"), "w") as f:
+			f.write(_layout_conf)
+		self.assertEqual([type(x) for x in directory_layouts(self.tempdir)],
+			[FilenameHashLayout, FlatLayout])
+		hashed = os.path.join(self.tempdir, layout.get_path("foo-1.tar.gz"))
+		flat = os.path.join(self.tempdir, "foo-1.tar.gz")
+
+		# Missing files are assigned to the primary layout, while
+		# existing files are also found in the flat layout.
+		self.assertEqual(distfile_path(self.tempdir, "foo-1.tar.gz"), hashed)
+		self._write(flat)
+		self.assertEqual(distfile_path(self.tempdir, "foo-1.tar.gz"), flat)
+		self._write(hashed)
+		self.assertEqual(distfile_path(self.tempdir, "foo-1.tar.gz"), hashed)
+
+		self._write(os.path.join(self.tempdir,
+			layout.get_path("bar-1.tar.gz")))
+		# Files at locations not assigned to their names are ignored.
+		self._write(os.path.join(os.path.dirname(hashed), "baz-1.tar.gz"))
+		self._write(os.path.join(self.tempdir, ".locks", "qux-1.tar.gz"))
+		self.assertEqual(sorted(walk_distfiles(self.tempdir)), sorted([
+			("bar-1.tar.gz", os.path.join(self.tempdir,
+				layout.get_path("bar-1.tar.gz"))),
+			("foo-1.tar.gz", flat),
+			("foo-1.tar.gz", hashed),
+		]))
+
+	def testFetch(self):
+		if find_binary("wget") is None:
+			self.skipTest("wget not found")
+
+		server = _ThreadingHTTPServer(("127.0.0.1", 0), _PathRequestHandler)
+		server.files = {}
+		server.requests = []
+		server_thread = threading.Thread(target=server.serve_forever)
+		server_thread.daemon = True
+		server_thread.start()
+
+		layout = FilenameHashLayout("SHA1", "8:4")
+		digests = {}
+		for name in ("hashed.tar", "flat.tar"):
+			data = _os.urandom(1000)
+			digests[name] = {
+				"size": len(data),
+				"SHA512": checksum_str(data, "SHA512"),
+			}
+			if name == "hashed.tar":
+				path = "/distfiles/" + layout.get_path(name)
+			else:
+				path = "/distfiles/" + name
+			server.files[path] = data
+		server.files["/distfiles/layout.conf"] = _layout_conf.encode()
+
+		mirror = "http://127.0.0.1:%d" % server.server_address[1]
+		playground = ResolverPlayground(user_config={
+			"make.conf": ('GENTOO_MIRRORS="%s"' % mirror,
+				'FEATURES="-userfetch"'),
+		})
+		try:
+			settings = config(clone=playground.settings)
+			distdir = settings["DISTDIR"]
+			with open(os.path.join(distdir, "layout.conf"), "w") as f:
+				f.write(_layout_conf)
+
+			uris = dict((name, ()) for name in digests)
+			self.assertEqual(fetch(uris, settings, digests=digests), 1)
+
+			# Files are stored under the primary layout of DISTDIR,
+			# and downloaded from the hashed location of the mirror if
+			# it exists, or from its flat location otherwise.
+			for name, path in (
+				("hashed.tar", "/distfiles/" + layout.get_path("hashed.tar")),
+				("flat.tar", "/distfiles/flat.tar")):
+				with open(os.path.join(distdir,
+					layout.get_path(name)), "rb") as f:
+					self.assertEqual(f.read(), server.files[path])
+			self.assertEqual(server.requests.count("/distfiles/layout.conf"), 1)
+			self.assertTrue("/distfiles/" + layout.get_path("flat.tar")
+				in server.requests)
+			self.assertFalse(any(x.startswith(".layout.conf")
+				for x in os.listdir(distdir)))
+
+			# The layout of the mirror is cached.
+			del server.requests[:]
+			os.unlink(os.path.join(distdir, layout.get_path("hashed.tar")))
+			self.assertEqual(fetch(uris, settings, digests=digests), 1)
+			self.assertEqual(server.requests,
+				["/distfiles/" + layout.get_path("hashed.tar")])
+		finally:
+			playground.cleanup()
+			server.shutdown()
+			server.server_close()
@@ -0,0 +1,78 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage._emirrordist.FetchIterator import FetchIterator
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class _Options(object):
+	def __init__(self, fetch_list_jobs):
+		self.fetch_list_jobs = fetch_list_jobs
+
+
+class _Config(object):
+	def __init__(self, portdb, fetch_list_jobs):
+		self.portdb = portdb
+		self.options = _Options(fetch_list_jobs)
+		self.file_owners = {}
+		self.file_failures = {}
+		self.restrict_mirror_exemptions = None
+		self.failures = []
+		self.log_failure = self.failures.append
+
+
+class EmirrordistFetchListTestCase(TestCase):
+
+	def testFetchList(self):
+		ebuilds = {}
+		distfiles = {}
+		for i, category in enumerate(("app-misc", "dev-libs",
+			"sys-apps", "x11-libs")):
+			for pn in ("foo", "bar"):
+				cpv = "%s/%s-1" % (category, pn)
+				filename = "%s-%s.tar.gz" % (pn, i)
+				distfiles[filename] = filename.encode()
+				ebuilds[cpv] = {"EAPI": "5",
+					"SRC_URI": "mirror://gentoo/%s shared.tar.gz" % filename}
+		distfiles["shared.tar.gz"] = b"shared"
+		ebuilds["dev-libs/bar-1"]["RESTRICT"] = "mirror"
+		ebuilds["sys-apps/foo-1"]["RESTRICT"] = "fetch"
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			distfiles=distfiles)
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			results = []
+			for jobs in (1, 3):
+				config = _Config(portdb, jobs)
+				tasks = [(task.cpv, task.distfile, task.uri_tuple,
+					sorted(task.digests), sorted(task.restrict))
+					for task in FetchIterator(config)]
+				results.append((tasks, config.file_owners, config.failures))
+
+			# Worker processes produce the same tasks in the same order.
+			self.assertEqual(results[0], results[1])
+			tasks, file_owners, failures = results[0]
+			self.assertEqual(failures, [])
+			self.assertEqual(file_owners["shared.tar.gz"], "app-misc/bar-1")
+			self.assertEqual(sorted(file_owners), sorted(
+				x for x in distfiles if x not in ("bar-1.tar.gz",
+				"foo-2.tar.gz")))
+			self.assertEqual(tasks[0][:3], ("app-misc/bar-1",
+				"bar-0.tar.gz", ("mirror://gentoo/bar-0.tar.gz",)))
+
+			# Without workers, termination is checked for each ebuild.
+			config = _Config(portdb, 1)
+			fetch_iterator = FetchIterator(config)
+			for task in fetch_iterator:
+				fetch_iterator.terminate()
+			self.assertEqual(list(config.file_owners), ["bar-0.tar.gz"])
+
+			# With workers, termination stops waiting for categories.
+			config = _Config(portdb, 3)
+			fetch_iterator = FetchIterator(config)
+			fetch_iterator.terminate()
+			self.assertEqual(list(fetch_iterator), [])
+		finally:
+			playground.cleanup()
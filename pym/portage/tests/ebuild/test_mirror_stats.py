@@ -0,0 +1,110 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import random
+import tempfile
+
+from portage import os, shutil
+from portage._emirrordist.FetchTask import FetchTask
+from portage.package.ebuild._mirror_stats import MirrorStats, mirror_key
+from portage.tests import TestCase
+
+
+class _Clock(object):
+
+	def __init__(self):
+		self.now = 1000000.0
+
+	def __call__(self):
+		return self.now
+
+
+class _NoProbe(object):
+
+	def random(self):
+		return 1.0
+
+
+class MirrorStatsTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.filename = os.path.join(self.tempdir, "mirror_stats.json")
+		self.clock = _Clock()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def _stats(self, rng=None):
+		stats = MirrorStats(self.filename, clock=self.clock,
+			rng=rng or _NoProbe())
+		stats.load()
+		return stats
+
+	def testMirrorKey(self):
+		self.assertEqual(mirror_key("http://user:pw@Example.org/a/b.tar"),
+			"http://example.org")
+		self.assertEqual(mirror_key("/var/cache/distfiles"), None)
+
+	def testOrder(self):
+		stats = self._stats()
+		fast = "http://fast.example.org/distfiles"
+		slow = "http://slow.example.org/distfiles"
+		dead = "http://dead.example.org/distfiles"
+		new = "http://new.example.org/distfiles"
+		for i in range(5):
+			stats.record(fast + "/f", True, duration=0.1,
+				nbytes=1024 * 1024, ttfb=0.05)
+			stats.record(slow + "/f", True, duration=40,
+				nbytes=1024 * 1024, ttfb=2)
+			stats.record(dead + "/f", False)
+		self.assertEqual(stats.order([dead, new, slow, fast]),
+			[fast, new, slow, dead])
+
+		# Failures of the dead mirror are forgotten over time.
+		self.clock.now += 20 * stats.half_life
+		self.assertAlmostEqual(stats.predict(dead), stats.predict(new),
+			places=3)
+
+	def testProbe(self):
+		stats = self._stats(rng=random.Random(0))
+		stats.probe_rate = 1.0
+		known = "http://known.example.org"
+		new = "http://new.example.org"
+		for i in range(5):
+			stats.record(known + "/f", True, duration=0.1,
+				nbytes=1024 * 1024)
+		self.assertEqual(stats.order([known, new]), [new, known])
+
+	def testSaveMerge(self):
+		a = self._stats()
+		b = self._stats()
+		a.record("http://a.example.org/f", False)
+		b.record("http://b.example.org/f", False)
+		a.save()
+		b.save()
+
+		c = self._stats()
+		self.assertEqual(c.order(["http://a.example.org",
+			"http://c.example.org", "http://b.example.org"]),
+			["http://c.example.org", "http://a.example.org",
+			"http://b.example.org"])
+
+		# Entries without recent updates expire.
+		self.clock.now += 20 * c.half_life
+		c.record("http://c.example.org/f", True)
+		c.save()
+		with open(self.filename) as f:
+			content = f.read()
+		self.assertTrue("c.example.org" in content)
+		self.assertFalse("a.example.org" in content)
+
+	def testMirrorIterator(self):
+		stats = self._stats()
+		stats.record("http://bad.example.org/f", False)
+		mirrors = {"gnu": ["http://bad.example.org/gnu",
+			"http://good.example.org/gnu/"]}
+		self.assertEqual(list(FetchTask._mirror_iterator(
+			"mirror://gnu/foo/foo-1.tar", mirrors, mirror_stats=stats)),
+			["http://good.example.org/gnu/foo/foo-1.tar",
+			"http://bad.example.org/gnu/foo/foo-1.tar"])
@@ -0,0 +1,96 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import io
+import tempfile
+
+import portage
+from portage import os, shutil, _encodings, _unicode_encode
+from portage.dep import Atom
+from portage.package.ebuild._config.ProfileSnapshot import ProfileSnapshot
+from portage.tests import TestCase
+from portage.util import grabdict_package, grabfile_package
+
+
+class ProfileSnapshotTestCase(TestCase):
+
+	def setUp(self):
+		self.eroot = tempfile.mkdtemp()
+		self.profile = os.path.join(self.eroot, "profile")
+		os.mkdir(self.profile)
+
+	def tearDown(self):
+		snapshots = portage.util._profile_snapshots
+		snapshots[:] = [x for x in snapshots if x._eroot != self.eroot]
+		shutil.rmtree(self.eroot)
+
+	def _write(self, name, content):
+		with io.open(_unicode_encode(os.path.join(self.profile, name),
+			encoding=_encodings['fs'], errors='strict'),
+			mode='w', encoding=_encodings['content']) as f:
+			f.write(content)
+
+	def testSnapshot(self):
+		self._write("package.mask", "dev-libs/A\n>=dev-libs/B-2\n")
+		os.mkdir(os.path.join(self.profile, "package.use"))
+		self._write(os.path.join("package.use", "a"), "dev-libs/A foo\n")
+		mask_file = os.path.join(self.profile, "package.mask")
+		use_dir = os.path.join(self.profile, "package.use")
+
+		snapshot = ProfileSnapshot.register(self.eroot, [self.profile])
+		self.assertTrue(snapshot.covers(mask_file))
+		self.assertFalse(snapshot.covers(os.path.join(self.eroot, "x")))
+
+		expected_mask = [Atom("dev-libs/A"), Atom(">=dev-libs/B-2")]
+		self.assertEqual(grabfile_package(mask_file), expected_mask)
+		self.assertEqual(grabdict_package(use_dir, recursive=True),
+			{Atom("dev-libs/A"): ["foo"]})
+
+		# Every call returns a new object.
+		grabfile_package(mask_file).pop()
+		self.assertEqual(grabfile_package(mask_file), expected_mask)
+
+		if not snapshot._can_save():
+			# Nothing is computed for a snapshot that cannot be saved.
+			self.assertEqual(snapshot._entries, {})
+			return
+		self.assertEqual(len(snapshot._entries), 2)
+		snapshot.flush()
+		self.assertTrue(os.path.exists(snapshot.filename))
+
+		# A new snapshot loads the saved results, as long as the
+		# files are unchanged.
+		portage.util._profile_snapshots.remove(snapshot)
+		snapshot = ProfileSnapshot.register(self.eroot, [self.profile])
+		self.assertEqual(len(snapshot._load()), 2)
+		result = grabfile_package(mask_file)
+		self.assertEqual(result, expected_mask)
+		self.assertTrue(isinstance(result[0], Atom))
+		self.assertFalse(snapshot._modified)
+
+		# Adding a file to a directory invalidates its result.
+		self._write(os.path.join("package.use", "b"), "dev-libs/B bar\n")
+		self.assertEqual(grabdict_package(use_dir, recursive=True),
+			{Atom("dev-libs/A"): ["foo"], Atom("dev-libs/B"): ["bar"]})
+		self.assertTrue(snapshot._modified)
+
+		# A snapshot that is owned by another user is ignored.
+		snapshot.flush()
+		os.chown(snapshot.filename, os.geteuid() + 1, -1)
+		portage.util._profile_snapshots.remove(snapshot)
+		snapshot = ProfileSnapshot.register(self.eroot, [self.profile])
+		self.assertEqual(snapshot._load(), {})
+
+	def testUnsavedSnapshot(self):
+		self._write("package.mask", "dev-libs/A\n")
+		mask_file = os.path.join(self.profile, "package.mask")
+
+		snapshot = ProfileSnapshot.register(self.eroot, [self.profile])
+		snapshot._save = False
+		self.assertEqual(grabfile_package(mask_file), [Atom("dev-libs/A")])
+		self.assertEqual(snapshot._entries, {})
+		self.assertFalse(snapshot._modified)
+		snapshot.flush()
+		self.assertFalse(os.path.exists(snapshot.filename))
@@ -0,0 +1,215 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import os as _os
+import re
+import tempfile
+import threading
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+from portage import os, shutil
+from portage.checksum import checksum_str
+from portage.package.ebuild.config import config
+from portage.package.ebuild.fetch import fetch
+from portage.package.ebuild._segmented_fetch import (MIN_SEGMENT_SIZE,
+	SegmentedFetch)
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class _RangeRequestHandler(BaseHTTPRequestHandler):
+	"""
+	Serve server.files, honoring Range requests unless the path
+	starts with /norange/.
+	"""
+
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		self.server.requests.append((self.path, self.headers.get("Range")))
+		name = self.path.split("/")[-1]
+		data = self.server.files.get(name)
+		if data is None or self.path.startswith("/missing/"):
+			self.send_error(404)
+			return
+
+		match = re.match(r'^bytes=(\d+)-(\d+)$', self.headers.get("Range", ""))
+		if match is None or self.path.startswith("/norange/"):
+			self.send_response(200)
+			self.send_header("Content-Length", str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+			return
+
+		start, end = int(match.group(1)), int(match.group(2))
+		self.send_response(206)
+		self.send_header("Content-Range",
+			"bytes %d-%d/%d" % (start, end, len(data)))
+		self.send_header("Content-Length", str(end - start + 1))
+		self.end_headers()
+		self.wfile.write(data[start:end + 1])
+
+
+class SegmentedFetchTestCase(TestCase):
+
+	def setUp(self):
+		self.server = _ThreadingHTTPServer(("127.0.0.1", 0),
+			_RangeRequestHandler)
+		self.server.files = {}
+		self.server.requests = []
+		self.server_thread = threading.Thread(
+			target=self.server.serve_forever)
+		self.server_thread.daemon = True
+		self.server_thread.start()
+		self.tempdir = tempfile.mkdtemp()
+
+		self.data = _os.urandom(10000)
+		self.server.files["distfile.tar"] = self.data
+		self.digests = {
+			"size": len(self.data),
+			"SHA512": checksum_str(self.data, "SHA512"),
+		}
+		self.distfile = os.path.join(self.tempdir, "distfile.tar")
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.tempdir)
+
+	def _uri(self, prefix, name="distfile.tar"):
+		return "http://127.0.0.1:%d/%s/%s" % \
+			(self.server.server_address[1], prefix, name)
+
+	def _fetcher(self, uris, **kwargs):
+		return SegmentedFetch(uris, self.distfile, len(self.data),
+			digests=self.digests, segment_size=1000, **kwargs)
+
+	def _read_distfile(self):
+		with open(self.distfile, "rb") as f:
+			return f.read()
+
+	def _assert_no_partial(self, fetcher):
+		self.assertFalse(os.path.exists(fetcher.partial_filename))
+		self.assertFalse(os.path.exists(fetcher.state_filename))
+
+	def testMultipleMirrors(self):
+		fetcher = self._fetcher([self._uri("a"), self._uri("b"),
+			"ftp://127.0.0.1/distfile.tar"], connections=3)
+		self.assertEqual(len(fetcher.uris), 2)
+		self.assertTrue(fetcher.run())
+		self.assertEqual(self._read_distfile(), self.data)
+		self._assert_no_partial(fetcher)
+
+		self.assertEqual(len(self.server.requests), 10)
+		prefixes = set(path.split("/")[1]
+			for path, _ in self.server.requests)
+		self.assertEqual(prefixes, set(["a", "b"]))
+
+	def testBadMirrors(self):
+		fetcher = self._fetcher([self._uri("norange"),
+			self._uri("missing"), self._uri("good")], connections=2)
+		self.assertTrue(fetcher.run())
+		self.assertEqual(self._read_distfile(), self.data)
+		self._assert_no_partial(fetcher)
+
+		# A mirror that ignores the Range header is dropped immediately.
+		norange = [path for path, _ in self.server.requests
+			if path.startswith("/norange/")]
+		self.assertEqual(len(norange), 1)
+
+	def testResume(self):
+		fetcher = self._fetcher([self._uri("a")])
+		with open(fetcher.partial_filename, "wb") as f:
+			f.write(self.data[:5000])
+			f.write(b"\0" * 5000)
+		with open(fetcher.state_filename, "w") as f:
+			f.write("segments 1 10000 1000\n")
+			for offset in range(0, 5000, 1000):
+				f.write("%d\n" % offset)
+
+		self.assertTrue(fetcher.run())
+		self.assertEqual(self._read_distfile(), self.data)
+		self._assert_no_partial(fetcher)
+		self.assertEqual(sorted(r for _, r in self.server.requests),
+			["bytes=%d-%d" % (offset, offset + 999)
+			for offset in range(5000, 10000, 1000)])
+
+	def testFailureKeepsState(self):
+		fetcher = self._fetcher([self._uri("missing")])
+		self.assertFalse(fetcher.run())
+		self.assertFalse(os.path.exists(self.distfile))
+		self.assertTrue(os.path.exists(fetcher.partial_filename))
+		self.assertTrue(os.path.exists(fetcher.state_filename))
+
+		# A resumed download starts over if the segment layout changed.
+		fetcher = SegmentedFetch([self._uri("a")], self.distfile,
+			len(self.data), digests=self.digests, segment_size=2000)
+		self.assertTrue(fetcher.run())
+		self.assertEqual(self._read_distfile(), self.data)
+
+	def testWorkerException(self):
+		class BrokenStats(object):
+			def record(self, uri, success, **kwargs):
+				if len(self.requests) == 10:
+					raise RuntimeError("broken stats")
+			requests = self.server.requests
+
+		# Without digests, a segment that is lost to an unexpected
+		# exception must not be mistaken for a complete download.
+		self.digests = None
+		fetcher = self._fetcher([self._uri("a")], connections=1,
+			mirror_stats=BrokenStats())
+		self.assertFalse(fetcher.run())
+		self.assertFalse(os.path.exists(self.distfile))
+		self.assertEqual(fetcher._pending, [(9000, 1000)])
+
+		# The segment is fetched again by a resumed download.
+		del self.server.requests[:]
+		fetcher = self._fetcher([self._uri("a")])
+		self.assertTrue(fetcher.run())
+		self.assertEqual(self._read_distfile(), self.data)
+		self._assert_no_partial(fetcher)
+		self.assertEqual([r for _, r in self.server.requests],
+			["bytes=9000-9999"])
+
+	def testVerifyFailure(self):
+		self.digests["SHA512"] = checksum_str(b"other", "SHA512")
+		fetcher = self._fetcher([self._uri("a")])
+		self.assertFalse(fetcher.run())
+		self.assertFalse(os.path.exists(self.distfile))
+		self._assert_no_partial(fetcher)
+
+	def testFetch(self):
+		data = _os.urandom(3 * MIN_SEGMENT_SIZE)
+		self.server.files["large.tar"] = data
+		digests = {"large.tar": {
+			"size": len(data),
+			"SHA512": checksum_str(data, "SHA512"),
+		}}
+		playground = ResolverPlayground(user_config={
+			"make.conf": ('FEATURES="segmented-fetch -userfetch"',),
+		})
+		try:
+			settings = config(clone=playground.settings)
+			self.assertTrue(fetch({"large.tar": [self._uri("a", "large.tar"),
+				self._uri("b", "large.tar")]}, settings, digests=digests,
+				try_mirrors=0))
+			with open(os.path.join(settings["DISTDIR"], "large.tar"),
+				"rb") as f:
+				self.assertEqual(f.read(), data)
+			self.assertEqual(len(self.server.requests), 3)
+			self.assertTrue(all(r is not None
+				for _, r in self.server.requests))
+		finally:
+			playground.cleanup()
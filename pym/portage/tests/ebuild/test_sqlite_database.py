@@ -0,0 +1,82 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shelve
+import sqlite3
+import tempfile
+
+from portage import os, shutil
+from portage._emirrordist.SqliteDatabase import (SqliteDatabase,
+	discard_missing, expired_keys, is_sqlite_database)
+from portage.tests import TestCase
+
+
+class SqliteDatabaseTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.filename = os.path.join(self.tempdir, "db.sqlite")
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def testMapping(self):
+		db = SqliteDatabase(self.filename, "distfiles")
+		db.commit_interval = 2
+		db["a.tar.gz"] = "dev-libs/A-1"
+		db["b.tar.gz"] = "dev-libs/B-1"
+		db["b.tar.gz"] = "dev-libs/B-2"
+		self.assertTrue("a.tar.gz" in db)
+		self.assertFalse("c.tar.gz" in db)
+		self.assertEqual(db.get("c.tar.gz", "unknown"), "unknown")
+		self.assertEqual(len(db), 2)
+		del db["a.tar.gz"]
+		self.assertRaises(KeyError, db.__delitem__, "a.tar.gz")
+		db.close()
+
+		db = SqliteDatabase(self.filename, "distfiles")
+		self.assertEqual(dict(db.items()), {"b.tar.gz": "dev-libs/B-2"})
+		self.assertEqual(list(db), ["b.tar.gz"])
+		db.close()
+
+	def testQueries(self):
+		recycle = {
+			"a.tar.gz": (10, 100.0),
+			"b.tar.gz": (20, 200.0),
+			"c.tar.gz": (30, 300.0),
+		}
+		db = SqliteDatabase(self.filename, "recycle")
+		for k, v in recycle.items():
+			db[k] = v
+		self.assertEqual(db["b.tar.gz"], (20, 200.0))
+
+		# The indexed queries give the same results as the
+		# generic implementations for other mappings.
+		for mapping in (db, dict(recycle)):
+			self.assertEqual(sorted(expired_keys(mapping, 200,
+				timestamp=lambda value: value[1])), ["a.tar.gz"])
+			self.assertEqual(sorted(expired_keys(mapping, 200,
+				inclusive=True, timestamp=lambda value: value[1])),
+				["a.tar.gz", "b.tar.gz"])
+			self.assertEqual(sorted(discard_missing(mapping,
+				set(["b.tar.gz", "d.tar.gz"]))), ["a.tar.gz", "c.tar.gz"])
+			self.assertEqual(list(mapping), ["b.tar.gz"])
+		db.close()
+
+	def testShelveDatabase(self):
+		self.assertTrue(is_sqlite_database(self.filename))
+		SqliteDatabase(self.filename, "distfiles").close()
+		self.assertTrue(is_sqlite_database(self.filename))
+
+		shelve_file = os.path.join(self.tempdir, "db.shelve")
+		db = shelve.open(shelve_file, flag="c")
+		db["a.tar.gz"] = "dev-libs/A-1"
+		db.close()
+		shelve_files = [os.path.join(self.tempdir, x)
+			for x in os.listdir(self.tempdir) if x.startswith("db.shelve")]
+		shelve_files = [x for x in shelve_files if os.path.getsize(x)]
+		self.assertTrue(shelve_files)
+		for filename in shelve_files:
+			self.assertFalse(is_sqlite_database(filename))
+			self.assertRaises(sqlite3.DatabaseError, SqliteDatabase,
+				filename, "distfiles")
@@ -282,6 +282,7 @@ pkg_preinst() {
 			emerge_cmd + ("--pretend", "--depclean", "--verbose", "dev-libs/B"),
 			emerge_cmd + ("--pretend", "--depclean",),
 			emerge_cmd + ("--depclean",),
+			quickpkg_cmd + ("--jobs", "2", "dev-libs/A", "=dev-libs/A-1"),
 			quickpkg_cmd + ("--include-config", "y", "dev-libs/A",),
 			# Test bug #523684, where a file renamed or removed by the
 			# admin forces replacement files to be merged with config
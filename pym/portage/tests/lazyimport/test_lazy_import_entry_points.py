@@ -0,0 +1,93 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import portage
+from portage import os
+from portage.const import PORTAGE_PYM_PATH
+from portage.tests import TestCase
+from portage.util._eventloop.global_event_loop import global_event_loop
+
+from _emerge.PipeReader import PipeReader
+from _emerge.SpawnProcess import SpawnProcess
+
+class LazyImportEntryPointsTestCase(TestCase):
+
+	# Modules that are imported by emerge, portageq and ebuild-ipc
+	# before they parse their arguments.
+	_entry_point_imports = (
+		'_emerge.main',
+		'_emerge.actions',
+		'portage.dbapi.bintree',
+		'portage.dbapi.porttree',
+		'portage.dbapi.vartree',
+		'portage.package.ebuild.config',
+		'portage.repository.config',
+		'portage.util._eventloop.global_event_loop',
+		'_emerge.PipeReader',
+	)
+
+	# Modules that are only needed in order to build, merge or sync
+	# packages, and slow down the startup of short commands.
+	_unexpected_imports = frozenset([
+		'_emerge.Scheduler',
+		'_emerge.depgraph',
+		'_emerge.EbuildPhase',
+		'portage.glsa',
+		'portage.package.ebuild.doebuild',
+		'portage.sync.controller',
+		'urllib.request',
+	])
+
+	_import_cmd = [portage._python_interpreter, '-c', '''
+import os
+import sys
+sys.path.insert(0, os.environ["PORTAGE_PYM_PATH"])
+for name in sys.argv[1:]:
+	__import__(name)
+sys.stdout.write(" ".join(k for k in sys.modules
+	if sys.modules[k] is not None))
+''']
+
+	def testLazyImportEntryPoints(self):
+		"""
+		Check that the modules which are imported by the entry points
+		do not import modules that only some actions need.
+		"""
+
+		env = os.environ.copy()
+		pythonpath = env.get('PYTHONPATH')
+		if pythonpath is not None and not pythonpath.strip():
+			pythonpath = None
+		if pythonpath is None:
+			pythonpath = ''
+		else:
+			pythonpath = ':' + pythonpath
+		env['PYTHONPATH'] = PORTAGE_PYM_PATH + pythonpath
+		env['PORTAGE_PYM_PATH'] = PORTAGE_PYM_PATH
+
+		scheduler = global_event_loop()
+		master_fd, slave_fd = os.pipe()
+		master_file = os.fdopen(master_fd, 'rb', 0)
+		slave_file = os.fdopen(slave_fd, 'wb')
+		producer = SpawnProcess(
+			args=self._import_cmd + list(self._entry_point_imports),
+			env=env, fd_pipes={1:slave_fd},
+			scheduler=scheduler)
+		producer.start()
+		slave_file.close()
+
+		consumer = PipeReader(
+			input_files={"producer" : master_file},
+			scheduler=scheduler)
+
+		consumer.start()
+		consumer.wait()
+		self.assertEqual(producer.wait(), os.EX_OK)
+		self.assertEqual(consumer.wait(), os.EX_OK)
+
+		output = consumer.getvalue().decode('ascii', 'replace').split()
+
+		unexpected_modules = " ".join(sorted(x for x in output
+			if x in self._unexpected_imports))
+
+		self.assertEqual("", unexpected_modules)
@@ -1,6 +1,8 @@
-# Copyright 2010-2015 Gentoo Foundation
+# Copyright 2010-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+from _emerge.depgraph import _backtrack_workers
+from _emerge.FakeVartree import FakeVartree
 from portage.tests import TestCase
 from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
 
@@ -30,6 +32,123 @@ class BacktrackingTestCase(TestCase):
 		finally:
 			playground.cleanup()
 
+	def testReducedDepsCache(self):
+		"""
+		Test that backtracking runs share reduced dependencies and the
+		dynamic deps of installed packages through the
+		_frozen_depgraph_config.
+		"""
+		ebuilds = {
+			"dev-libs/A-1": { },
+			"dev-libs/A-2": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D"},
+			"dev-libs/C-1": { },
+			"dev-libs/C-2": { "RDEPEND": ">=dev-libs/A-2" },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		installed = {
+			"dev-libs/A-1": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D" },
+			"dev-libs/C-1": { },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		world = ["dev-libs/B", "dev-libs/C"]
+
+		options = {
+			'--deep' : True,
+			'--selective' : True,
+			'--update' : True,
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed, world=world)
+
+		preloaded = []
+		dynamic_deps_preload = FakeVartree.dynamic_deps_preload
+		def counting_preload(self, pkg, metadata):
+			preloaded.append(pkg.cpv)
+			return dynamic_deps_preload(self, pkg, metadata)
+
+		try:
+			# Without backtracking, every dependency string is reduced once.
+			options["--backtrack"] = 0
+			result = playground.run(["@world"], options)
+			frozen_config = result.depgraph._frozen_config
+			self.assertEqual(frozen_config._reduced_deps_hits, 0)
+
+			options["--backtrack"] = 6
+			FakeVartree.dynamic_deps_preload = counting_preload
+			result = playground.run(["@world"], options)
+			self.assertEqual(result.mergelist, [])
+			frozen_config = result.depgraph._frozen_config
+			self.assertTrue(frozen_config._reduced_deps_hits >
+				frozen_config._reduced_deps_misses)
+			# Dynamic deps are applied once for each installed package,
+			# not once per backtracking run.
+			self.assertEqual(sorted(preloaded), sorted(installed))
+		finally:
+			FakeVartree.dynamic_deps_preload = dynamic_deps_preload
+			playground.cleanup()
+
+	def testParallelBacktracking(self):
+		"""
+		Test that with --backtrack-jobs, backtracking runs are evaluated
+		by workers, and that the result is the same as without workers.
+		--jobs alone does not start any workers.
+		"""
+		ebuilds = {
+			"dev-libs/A-1": { },
+			"dev-libs/A-2": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D"},
+			"dev-libs/C-1": { },
+			"dev-libs/C-2": { "RDEPEND": ">=dev-libs/A-2" },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		installed = {
+			"dev-libs/A-1": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D" },
+			"dev-libs/C-1": { },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		world = ["dev-libs/B", "dev-libs/C"]
+
+		options = {
+			'--backtrack': 6,
+			'--deep' : True,
+			'--selective' : True,
+			'--update' : True,
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed, world=world)
+
+		used = []
+		result_orig = _backtrack_workers.result
+		def counting_result(self, parameter, mydepgraph):
+			infos = result_orig(self, parameter, mydepgraph)
+			if infos is not None:
+				used.append(infos)
+			return infos
+
+		try:
+			sequential = playground.run(["@world"], options)
+			_backtrack_workers.result = counting_result
+			options["--jobs"] = 4
+			result = playground.run(["@world"], options)
+			self.assertEqual(result.mergelist, sequential.mergelist)
+			self.assertEqual(used, [])
+			for jobs in (1, 3):
+				options["--backtrack-jobs"] = jobs
+				result = playground.run(["@world"], options)
+				self.assertEqual(result.success, sequential.success)
+				self.assertEqual(result.mergelist, sequential.mergelist)
+			self.assertTrue(used)
+		finally:
+			_backtrack_workers.result = result_orig
+			playground.cleanup()
+
 
 	def testBacktrackNotNeeded(self):
 		ebuilds = {
@@ -0,0 +1,72 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import tempfile
+
+from portage import os
+from portage.sync.changed_paths import (affected_cps,
+	parse_changed_paths, read_changed_paths, write_changed_paths)
+from portage.sync.modules.rsync.rsync import RsyncSync
+from portage.tests import TestCase
+
+
+class ChangedPathsTestCase(TestCase):
+
+	def testParseChangedPaths(self):
+		self.assertEqual(parse_changed_paths([
+			"dev-libs/A/A-1.ebuild",
+			"dev-libs/B/files/B-1.patch",
+			"dev-libs/C/metadata.xml",
+			"eclass/foo.eclass",
+			"eclass/README",
+			"metadata/md5-cache/app-misc/D-2",
+			"profiles/package.mask",
+		]), (set(["dev-libs/A", "app-misc/D"]), set(["foo"])))
+
+		self.assertEqual(parse_changed_paths([
+			"dev-libs/A/A-1.ebuild",
+			"metadata/layout.conf",
+		]), None)
+
+	def testAffectedCps(self):
+		auxdb = {
+			"dev-libs/A-1": {"_eclasses_": {"foo": ("", 0)}},
+			"dev-libs/B-1": {"_eclasses_": {"bar": ("", 0)}},
+			"dev-libs/C-1": {"_eclasses_": {"foo": ("", 0), "bar": ("", 0)}},
+		}
+		self.assertEqual(affected_cps(["eclass/foo.eclass",
+			"dev-libs/D/D-1.ebuild"], auxdb),
+			set(["dev-libs/A", "dev-libs/C", "dev-libs/D"]))
+		self.assertEqual(affected_cps(["eclass/foo.eclass"], None), None)
+		self.assertEqual(affected_cps([], auxdb), set())
+
+	def testReadWriteChangedPaths(self):
+		paths = ["dev-libs/A/A-1.ebuild", "eclass/foo.eclass"]
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		try:
+			write_changed_paths(filename, paths)
+			self.assertEqual(read_changed_paths(filename), paths)
+		finally:
+			os.unlink(filename)
+
+	def testRsyncChangesLog(self):
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		try:
+			with open(filename, "w") as f:
+				f.write(
+					"2018/01/01 00:00:00 [1] receiving file list\n"
+					"2018/01/01 00:00:00 [1] cd+++++++++ dev-libs/A/\n"
+					"2018/01/01 00:00:00 [1] >f+++++++++ dev-libs/A/A-1.ebuild\n"
+					"2018/01/01 00:00:00 [1] >f.st...... eclass/foo.eclass\n"
+					"2018/01/01 00:00:00 [1] *deleting   dev-libs/B/B-1.ebuild\n"
+					"2018/01/01 00:00:00 [1] *deleting   dev-libs/B/\n"
+					"2018/01/01 00:00:00 [1] sent 100 bytes  received 200 bytes\n")
+			self.assertEqual(RsyncSync._parse_changes_log(filename), [
+				"dev-libs/A/A-1.ebuild",
+				"eclass/foo.eclass",
+				"dev-libs/B/B-1.ebuild",
+			])
+		finally:
+			os.unlink(filename)
@@ -0,0 +1,148 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import os as _os
+import tarfile
+import tempfile
+
+from _emerge.BinpkgExtractorAsync import BinpkgExtractorAsync
+from portage import os, shutil
+from portage.checksum import perform_multiple_checksums
+from portage.process import find_binary
+from portage.tests import TestCase
+from portage.util._binpkg_writer import write_binpkg
+from portage.util._eventloop.global_event_loop import global_event_loop
+from portage.util.compression_probe import _compress_command
+from portage.xpak import tbz2, xpak_mem
+
+
+class BinpkgWriterTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def _write_tar(self, tar):
+		for i in range(3):
+			data = _os.urandom(100000)
+			info = tarfile.TarInfo("file%d" % i)
+			info.size = len(data)
+			tar.addfile(info, io.BytesIO(data))
+
+	def testWriteBinpkg(self):
+		if find_binary("bzip2") is None:
+			self.skipTest("bzip2 not found")
+		filename = os.path.join(self.tempdir, "A-1.tbz2")
+		xpdata = xpak_mem({b"CATEGORY": b"dev-libs\n", b"PF": b"A-1\n"})
+		digests = write_binpkg(filename, ["bzip2"], self._write_tar,
+			xpdata, hashes=("MD5", "SHA1"))
+
+		# The checksums computed while the file was written match
+		# those of the complete file, including the xpak segment.
+		self.assertEqual(digests["size"], os.stat(filename).st_size)
+		del digests["size"]
+		self.assertEqual(digests, perform_multiple_checksums(filename,
+			hashes=("MD5", "SHA1")))
+		self.assertEqual(tbz2(filename).getfile("PF"), b"A-1\n")
+		with tarfile.open(filename, mode="r:bz2") as tar:
+			self.assertEqual(sorted(tar.getnames()),
+				["file0", "file1", "file2"])
+
+	def testExtractBinpkg(self):
+		if find_binary("bzip2") is None:
+			self.skipTest("bzip2 not found")
+		filename = os.path.join(self.tempdir, "A-1.tbz2")
+		write_binpkg(filename, ["bzip2"], self._write_tar,
+			xpak_mem({b"PF": b"A-1\n"}))
+		env = dict(os.environ)
+		env["PORTAGE_BZIP2_COMMAND"] = "bzip2"
+		env["PORTAGE_BINPKG_COMPRESS_JOBS"] = "1"
+
+		for hash_names in (None, ("MD5", "SHA1")):
+			image_dir = os.path.join(self.tempdir, "image")
+			os.mkdir(image_dir)
+			extractor = BinpkgExtractorAsync(background=True, env=env,
+				features=(), hash_names=hash_names, image_dir=image_dir,
+				pkg_path=filename, scheduler=global_event_loop())
+			extractor.start()
+			self.assertEqual(extractor.wait(), os.EX_OK)
+			self.assertEqual(sorted(os.listdir(image_dir)),
+				["file0", "file1", "file2"])
+			shutil.rmtree(image_dir)
+
+			if hash_names is None:
+				self.assertEqual(extractor.digests, None)
+			else:
+				# The digests cover the whole file, including the
+				# xpak segment that is not extracted.
+				digests = extractor.digests
+				self.assertEqual(digests.pop("size"),
+					os.stat(filename).st_size)
+				self.assertEqual(digests, perform_multiple_checksums(
+					filename, hashes=hash_names))
+
+	def testExtractBinpkgEarlyExit(self):
+		if find_binary("bzip2") is None:
+			self.skipTest("bzip2 not found")
+		filename = os.path.join(self.tempdir, "A-1.tbz2")
+		write_binpkg(filename, ["bzip2"], self._write_tar,
+			xpak_mem({b"PF": b"A-1\n"}))
+		content_dir = os.path.join(self.tempdir, "content")
+		os.mkdir(content_dir)
+		with open(os.path.join(content_dir, "file0"), "w"):
+			pass
+		image_dir = os.path.join(self.tempdir, "image")
+		os.mkdir(image_dir)
+
+		# A decompressor which exits successfully without reading its
+		# input makes feeding the pipeline fail with EPIPE.
+		env = dict(os.environ)
+		env["PORTAGE_BUNZIP2_COMMAND"] = "tar -cf - -C %s file0" % \
+			content_dir
+		env["PORTAGE_BINPKG_COMPRESS_JOBS"] = "1"
+		hash_names = ("MD5",)
+		extractor = BinpkgExtractorAsync(background=True, env=env,
+			features=(), hash_names=hash_names, image_dir=image_dir,
+			pkg_path=filename, scheduler=global_event_loop())
+		extractor.start()
+		self.assertEqual(extractor.wait(), os.EX_OK)
+		self.assertEqual(os.listdir(image_dir), ["file0"])
+
+		# The digests still cover the whole file.
+		digests = extractor.digests
+		self.assertEqual(digests.pop("size"), os.stat(filename).st_size)
+		self.assertEqual(digests, perform_multiple_checksums(
+			filename, hashes=hash_names))
+
+	def testCompressorFailure(self):
+		filename = os.path.join(self.tempdir, "A-1.tbz2")
+		self.assertEqual(write_binpkg(filename, ["false"], self._write_tar,
+			xpak_mem({})), None)
+		self.assertFalse(os.path.exists(filename))
+
+		def write_tar(tar):
+			raise ValueError("archive error")
+		self.assertRaises(ValueError, write_binpkg, filename, ["cat"],
+			write_tar, xpak_mem({}))
+		self.assertFalse(os.path.exists(filename))
+
+	def testCompressCommand(self):
+		settings = {
+			"BINPKG_COMPRESS_FLAGS": "-9",
+			"PORTAGE_BINPKG_COMPRESS_JOBS": "4",
+			"PORTAGE_BZIP2_COMMAND": "pbzip2",
+		}
+		if find_binary("xz") is not None:
+			self.assertEqual(_compress_command("xz", settings),
+				["xz", "-T4", "-9"])
+		# An explicitly configured compressor is used as it is.
+		self.assertEqual(_compress_command("bzip2", settings),
+			["pbzip2", "-9"])
+		settings["PORTAGE_BINPKG_COMPRESS_JOBS"] = "1"
+		self.assertEqual(_compress_command("xz", settings), ["xz", "-9"])
+		# Parallel compressors are only used if they are enabled.
+		del settings["PORTAGE_BINPKG_COMPRESS_JOBS"]
+		self.assertEqual(_compress_command("xz", settings), ["xz", "-9"])
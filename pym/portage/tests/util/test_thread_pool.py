@@ -0,0 +1,57 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
+
+from portage.tests import TestCase
+from portage.util._thread_pool import ThreadPool, thread_map
+
+
+class ThreadPoolTestCase(TestCase):
+
+	def testThreadPool(self):
+		pool = ThreadPool(3)
+		lock = threading.Lock()
+		results = []
+		threads = set()
+
+		def append(i):
+			with lock:
+				results.append(i)
+				threads.add(threading.current_thread())
+
+		for i in range(20):
+			pool.submit(append, i)
+		pool.wait()
+		self.assertEqual(sorted(results), list(range(20)))
+		self.assertTrue(len(threads) <= 3)
+
+		# The first exception is raised by wait, after all functions
+		# have finished, and the pool can be used again.
+		def fail(i):
+			append(i)
+			raise ValueError(i)
+
+		del results[:]
+		pool.submit(fail, 0)
+		pool.submit(append, 1)
+		self.assertRaises(ValueError, pool.wait)
+		self.assertEqual(sorted(results), [0, 1])
+		pool.submit(append, 2)
+		pool.wait()
+		self.assertEqual(sorted(results), [0, 1, 2])
+
+	def testThreadMap(self):
+		def square(i):
+			if i == 3:
+				raise ValueError(i)
+			return i * i
+
+		self.assertEqual(thread_map(square, list(range(6)), 4),
+			{0: 0, 1: 1, 2: 4, 4: 16, 5: 25})
+		# Nothing is done without concurrency.
+		self.assertEqual(thread_map(square, list(range(6)), 1), {})
+		self.assertEqual(thread_map(square, [2], 4), {})
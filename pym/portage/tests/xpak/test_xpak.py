@@ -0,0 +1,78 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import tempfile
+
+from portage import os, shutil
+from portage.tests import TestCase
+from portage.xpak import (getindex_mem, index_table, searchindex, tbz2,
+	xpak_mem, xsplit_mem)
+
+
+class XpakTestCase(TestCase):
+
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.data = {
+			b"CATEGORY": b"dev-libs\n",
+			b"PF": b"foo-1\n",
+			b"SLOT": b"0\n",
+			b"environment.bz2": bytes(bytearray(range(256))) * 64,
+		}
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def testXpakMem(self):
+		index, data = xsplit_mem(xpak_mem(self.data))
+		self.assertEqual(sorted(getindex_mem(index)), sorted(self.data))
+		table = index_table(index)
+		self.assertEqual(sorted(table), sorted(self.data))
+		for name, value in self.data.items():
+			offset, length = table[name]
+			self.assertEqual(searchindex(index, name), (offset, length))
+			self.assertEqual(data[offset:offset + length], value)
+
+		# A truncated index yields the complete entries only.
+		self.assertEqual(len(index_table(index[:-1])), len(self.data) - 1)
+
+	def testTbz2(self):
+		path = os.path.join(self.tempdir, "foo-1.tbz2")
+		with open(path, "wb") as f:
+			f.write(b"not really a tarball")
+
+		pkg = tbz2(path)
+		self.assertEqual(pkg.getfile("PF"), None)
+		pkg.recompose_mem(xpak_mem(self.data))
+
+		pkg = tbz2(path)
+		self.assertEqual(pkg.getfile("PF"), b"foo-1\n")
+		self.assertEqual(pkg.getfile("USE", b"default"), b"default")
+		self.assertEqual(pkg.getfile("environment.bz2"),
+			self.data[b"environment.bz2"])
+		self.assertEqual(pkg.get_data(), self.data)
+		self.assertEqual(pkg.getboth(), xsplit_mem(xpak_mem(self.data)))
+
+		dest = os.path.join(self.tempdir, "info")
+		pkg.unpackinfo(dest)
+		for name, value in self.data.items():
+			with open(os.path.join(dest, name.decode()), "rb") as f:
+				self.assertEqual(f.read(), value)
+
+		# Rewriting the segment with the same instance discards the
+		# index table of the old segment.
+		data = dict(self.data)
+		data[b"PF"] = b"foo-1-r1\n"
+		data[b"USE"] = b"bar\n"
+		pkg.recompose_mem(xpak_mem(data))
+		self.assertEqual(pkg.get_data(), data)
+		self.assertEqual(tbz2(path).getfile("PF"), b"foo-1-r1\n")
+		with open(path, "rb") as f:
+			self.assertTrue(f.read().startswith(b"not really a tarball"))
+
+		# Values are returned as copies, which remain valid after
+		# the file is rewritten.
+		value = pkg.getfile("USE")
+		pkg.recompose_mem(xpak_mem(self.data))
+		self.assertEqual(value, b"bar\n")
+		self.assertEqual(pkg.getfile("USE"), None)
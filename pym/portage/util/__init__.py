@@ -1,4 +1,4 @@
-# Copyright 2004-2017 Gentoo Foundation
+# Copyright 2004-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -15,6 +15,7 @@ __all__ = ['apply_permissions', 'apply_recursive_permissions',
 
 from copy import deepcopy
 import errno
+import functools
 import io
 try:
 	from itertools import chain, filterfalse
@@ -124,6 +125,26 @@ def normalize_path(mypath):
 	else:
 		return os.path.normpath(mypath)
 
+# ProfileSnapshot instances (see portage.package.ebuild._config), which
+# memoize the results of the functions that are decorated with
+# _snapshot_cached, for the files that they cover.
+_profile_snapshots = []
+
+def _snapshot_cached(func):
+	"""
+	Decorate a function that takes a file name as its first argument, so
+	that its result is loaded from a registered ProfileSnapshot that
+	covers the file, if there is one.
+	"""
+	@functools.wraps(func)
+	def wrapper(myfilename, *args, **kwargs):
+		for snapshot in _profile_snapshots:
+			if snapshot.covers(myfilename):
+				return snapshot.call(func, myfilename, args, kwargs)
+		return func(myfilename, *args, **kwargs)
+	return wrapper
+
+@_snapshot_cached
 def grabfile(myfilename, compat_level=0, recursive=0, remember_source_file=False):
 	"""This function grabs the lines in a file, normalizes whitespace and returns lines in a list; if a line
 	begins with a #, it is ignored, as are empty lines"""
@@ -340,6 +361,7 @@ def stack_lists(lists, incremental=1, remember_source_file=False,
 	else:
 		return list(new_list)
 
+@_snapshot_cached
 def grabdict(myfilename, juststrings=0, empty=0, recursive=0, incremental=1, newlines=0):
 	"""
 	This function grabs the lines in a file, normalizes whitespace and returns lines in a dictionary
@@ -428,6 +450,7 @@ def read_corresponding_eapi_file(filename, default="0"):
 		return default
 	return eapi
 
+@_snapshot_cached
 def grabdict_package(myfilename, juststrings=0, recursive=0, newlines=0,
 	allow_wildcard=False, allow_repo=False, allow_build_id=False, allow_use=True,
 	verify_eapi=False, eapi=None, eapi_default="0"):
@@ -470,6 +493,7 @@ def grabdict_package(myfilename, juststrings=0, recursive=0, newlines=0,
 
 	return atoms
 
+@_snapshot_cached
 def grabfile_package(myfilename, compatlevel=0, recursive=0,
 	allow_wildcard=False, allow_repo=False, allow_build_id=False,
 	remember_source_file=False, verify_eapi=False, eapi=None,
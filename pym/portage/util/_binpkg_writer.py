@@ -0,0 +1,107 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import subprocess
+import sys
+import tarfile
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
+
+from portage import os, _encodings, _unicode_encode
+from portage.checksum import _checksum_stream
+from portage.const import HASHING_BLOCKSIZE
+from portage.xpak import encodeint
+
+def write_binpkg(filename, compress_cmd, write_tar, xpdata,
+	hashes=(), xattrs=False):
+	"""
+	Create a binary package in a single pass. The tar archive that
+	write_tar(tar) writes is streamed through the compressor from
+	a separate thread, while the compressed output is written to the
+	file and hashed, followed by the xpak segment. Since the compressor
+	runs in its own process (possibly with multiple threads of its own),
+	archiving, compression and hashing all proceed concurrently, and the
+	package does not have to be read back for the Packages index.
+
+	@param filename: path of the binary package to create
+	@type filename: str
+	@param compress_cmd: compressor command, as returned from
+		portage.util.compression_probe._compress_command
+	@type compress_cmd: list
+	@param write_tar: function that adds the package contents to the
+		tarfile.TarFile that is passed in
+	@type write_tar: callable
+	@param xpdata: xpak segment, as returned from portage.xpak.xpak
+	@type xpdata: bytes
+	@param hashes: names of the checksums to compute
+	@type hashes: iterable
+	@param xattrs: write pax headers, which are needed to preserve xattrs
+	@type xattrs: bool
+	@rtype: dict or None
+	@return: the checksums of the package, in the same form as returned
+		from portage.checksum._checksum_stream.digests, or None if the
+		compressor failed, in which case the file is removed
+	"""
+	checksums = _checksum_stream(hashes)
+	feeder_error = []
+
+	with open(_unicode_encode(filename,
+		encoding=_encodings['fs'], errors='strict'), 'wb') as f:
+		proc = subprocess.Popen(compress_cmd,
+			stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+		def feed():
+			try:
+				# The tarfile module will write pax headers holding the
+				# xattrs only if PAX_FORMAT is specified here.
+				with tarfile.open(mode="w|", fileobj=proc.stdin,
+					format=tarfile.PAX_FORMAT if xattrs else
+					tarfile.DEFAULT_FORMAT) as tar:
+					write_tar(tar)
+			except Exception:
+				feeder_error.append(sys.exc_info())
+			finally:
+				try:
+					proc.stdin.close()
+				except EnvironmentError:
+					pass
+
+		feeder = threading.Thread(target=feed)
+		feeder.daemon = True
+		feeder.start()
+		try:
+			while True:
+				buf = proc.stdout.read(HASHING_BLOCKSIZE)
+				if not buf:
+					break
+				f.write(buf)
+				checksums.update(buf)
+		finally:
+			proc.stdout.close()
+			feeder.join()
+			returncode = proc.wait()
+
+		success = not feeder_error and returncode == os.EX_OK
+		if success:
+			for buf in (xpdata, encodeint(len(xpdata)) + b'STOP'):
+				f.write(buf)
+				checksums.update(buf)
+
+	if not success:
+		try:
+			os.unlink(filename)
+		except OSError:
+			pass
+		# If the compressor failed, then errors that writing the
+		# archive raised are due to the closed pipe.
+		if feeder_error and returncode == os.EX_OK:
+			exc_type, exc_value, exc_tb = feeder_error[0]
+			if sys.hexversion >= 0x3000000:
+				raise exc_value.with_traceback(exc_tb)
+			raise exc_value
+		return None
+
+	return checksums.digests()
@@ -0,0 +1,115 @@
+# Copyright 2018 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import sys
+
+try:
+	import threading
+except ImportError:
+	import dummy_threading as threading
+
+__all__ = ['ThreadPool', 'thread_map']
+
+
+class ThreadPool(object):
+	"""
+	Run functions from up to jobs worker threads. The submit method
+	blocks while all workers are busy, so that functions are started
+	in the order in which they are submitted, and the caller can
+	prepare the arguments of the next function while the previous ones
+	run. Workers are started when they are first needed, and they exit
+	when wait is called.
+	"""
+
+	def __init__(self, jobs):
+		self.jobs = jobs
+		self._slots = threading.Semaphore(jobs)
+		self._cond = threading.Condition()
+		self._pending = []
+		self._threads = []
+		self._closing = False
+		self._error = None
+
+	def submit(self, func, *args):
+		"""
+		Queue func(*args) for a worker thread, after waiting for a
+		worker to become available.
+		"""
+		self._slots.acquire()
+		with self._cond:
+			self._pending.append((func, args))
+			if len(self._threads) < self.jobs:
+				thread = threading.Thread(target=self._worker)
+				thread.daemon = True
+				thread.start()
+				self._threads.append(thread)
+			self._cond.notify()
+
+	def _worker(self):
+		while True:
+			with self._cond:
+				while not (self._pending or self._closing):
+					self._cond.wait()
+				if not self._pending:
+					return
+				func, args = self._pending.pop(0)
+			try:
+				func(*args)
+			except Exception:
+				with self._cond:
+					if self._error is None:
+						self._error = sys.exc_info()
+			finally:
+				self._slots.release()
+
+	def wait(self):
+		"""
+		Wait for all submitted functions to finish, and raise the first
+		exception that one of them raised. The pool can be used again
+		afterwards.
+		"""
+		with self._cond:
+			self._closing = True
+			self._cond.notify_all()
+		for thread in self._threads:
+			thread.join()
+		del self._threads[:]
+		self._closing = False
+		error = self._error
+		self._error = None
+		if error is not None:
+			raise error[1]
+
+
+def thread_map(func, items, jobs):
+	"""
+	Call func for each of items, from up to jobs threads. Items for
+	which func raises an exception are omitted from the result, so that
+	the caller can repeat the call and handle the exception itself.
+	Nothing is done unless there is more than one item and more than
+	one job.
+
+	@param func: function to call for each item
+	@type func: callable
+	@param items: hashable items
+	@type items: list
+	@param jobs: maximum number of concurrent calls
+	@type jobs: int
+	@rtype: dict
+	@return: mapping of item to func(item)
+	"""
+	results = {}
+	if jobs < 2 or len(items) < 2:
+		return results
+
+	def call(item):
+		try:
+			results[item] = func(item)
+		except Exception:
+			pass
+
+	pool = ThreadPool(min(jobs, len(items)))
+	for item in items:
+		pool.submit(call, item)
+	pool.wait()
+	return results
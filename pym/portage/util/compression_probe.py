@@ -1,4 +1,4 @@
-# Copyright 2015 Gentoo Foundation
+# Copyright 2015-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -8,19 +8,25 @@ import sys
 if sys.hexversion >= 0x3000000:
 	basestring = str
 
-from portage import _encodings, _unicode_encode
+from portage import os, _encodings, _unicode_encode
 from portage.exception import FileNotFound, PermissionDenied
+from portage.process import find_binary
+from portage.util import shlex_split, varexpand, writemsg
 
 _compressors = {
 	"bzip2": {
 		"compress": "${PORTAGE_BZIP2_COMMAND} ${BINPKG_COMPRESS_FLAGS}",
 		"decompress": "${PORTAGE_BUNZIP2_COMMAND}",
 		"decompress_alt": "${PORTAGE_BZIP2_COMMAND} -d",
+		"compress_parallel": "lbzip2 -n${PORTAGE_BINPKG_COMPRESS_JOBS} ${BINPKG_COMPRESS_FLAGS}",
+		"decompress_parallel": "lbzip2 -d -n${PORTAGE_BINPKG_COMPRESS_JOBS}",
 		"package": "app-arch/bzip2",
 	},
 	"gzip": {
 		"compress": "gzip ${BINPKG_COMPRESS_FLAGS}",
 		"decompress": "gzip -d",
+		"compress_parallel": "pigz -p${PORTAGE_BINPKG_COMPRESS_JOBS} ${BINPKG_COMPRESS_FLAGS}",
+		"decompress_parallel": "pigz -d -p${PORTAGE_BINPKG_COMPRESS_JOBS}",
 		"package": "app-arch/gzip",
 	},
 	"lz4": {
@@ -31,6 +37,8 @@ _compressors = {
 	"lzip": {
 		"compress": "lzip ${BINPKG_COMPRESS_FLAGS}",
 		"decompress": "lzip -d",
+		"compress_parallel": "plzip -n${PORTAGE_BINPKG_COMPRESS_JOBS} ${BINPKG_COMPRESS_FLAGS}",
+		"decompress_parallel": "plzip -d -n${PORTAGE_BINPKG_COMPRESS_JOBS}",
 		"package": "app-arch/lzip",
 	},
 	"lzop": {
@@ -41,11 +49,13 @@ _compressors = {
 	"xz": {
 		"compress": "xz ${BINPKG_COMPRESS_FLAGS}",
 		"decompress": "xz -d",
+		"compress_parallel": "xz -T${PORTAGE_BINPKG_COMPRESS_JOBS} ${BINPKG_COMPRESS_FLAGS}",
 		"package": "app-arch/xz-utils",
 	},
 	"zstd": {
 		"compress": "zstd ${BINPKG_COMPRESS_FLAGS}",
 		"decompress": "zstd -d",
+		"compress_parallel": "zstd -T${PORTAGE_BINPKG_COMPRESS_JOBS} ${BINPKG_COMPRESS_FLAGS}",
 		"package": "app-arch/zstd",
 	},
 }
@@ -109,3 +119,64 @@ def _compression_probe_file(f):
 				return k
 
 	return None
+
+def _compress_jobs(settings):
+	"""
+	Return the number of threads that binary packages are compressed
+	and decompressed with, according to PORTAGE_BINPKG_COMPRESS_JOBS,
+	which defaults to 1, since the output of the parallel compressors
+	differs from that of the usual ones.
+	"""
+	compress_jobs_default = 1
+	v = settings.get("PORTAGE_BINPKG_COMPRESS_JOBS")
+	if not v:
+		return compress_jobs_default
+	try:
+		compress_jobs = int(v)
+	except ValueError:
+		compress_jobs = 0
+	if compress_jobs < 1:
+		writemsg("!!! Variable PORTAGE_BINPKG_COMPRESS_JOBS"
+			" contains an invalid value: '%s'\n" % v, noiselevel=-1)
+		writemsg("!!! Using PORTAGE_BINPKG_COMPRESS_JOBS "
+			"default value: %s\n" % compress_jobs_default, noiselevel=-1)
+		compress_jobs = compress_jobs_default
+	return compress_jobs
+
+def _parallel_command(binpkg_compression, cmd, parallel_key, settings):
+	"""
+	Return the parallel variant of cmd, which is a command of the given
+	compression type, if more than one thread is allowed and the parallel
+	implementation is installed. A command that was configured
+	explicitly, such as PORTAGE_BZIP2_COMMAND="pbzip2", is returned as
+	it is.
+	"""
+	template = _compressors[binpkg_compression].get(parallel_key)
+	if not template or not cmd or \
+		os.path.basename(cmd[0]) != binpkg_compression:
+		return cmd
+	jobs = _compress_jobs(settings)
+	if jobs < 2:
+		return cmd
+	expand_map = dict(settings.items())
+	expand_map["PORTAGE_BINPKG_COMPRESS_JOBS"] = "%d" % jobs
+	parallel_cmd = [varexpand(x, mydict=expand_map)
+		for x in shlex_split(template)]
+	if find_binary(parallel_cmd[0]) is None:
+		return cmd
+	return parallel_cmd
+
+def _compress_command(binpkg_compression, settings):
+	"""
+	Return the command that compresses data with the given compression
+	type, which must be a key of _compressors, as a list of arguments
+	expanded with settings. A parallel implementation of the compressor
+	is used if possible (see _parallel_command), so that large binary
+	packages are not compressed by a single CPU.
+	"""
+	cmd = [varexpand(x, mydict=settings)
+		for x in shlex_split(_compressors[binpkg_compression]["compress"])]
+	cmd = _parallel_command(binpkg_compression, cmd,
+		"compress_parallel", settings)
+	# Filter empty elements that make Popen fail
+	return [x for x in cmd if x != ""]
@@ -1,4 +1,4 @@
-# Copyright 2001-2014 Gentoo Foundation
+# Copyright 2001-2018 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 
@@ -17,14 +17,14 @@
 
 __all__ = [
 	'addtolist', 'decodeint', 'encodeint', 'getboth',
-	'getindex', 'getindex_mem', 'getitem', 'listindex',
+	'getindex', 'getindex_mem', 'getitem', 'index_table', 'listindex',
 	'searchindex', 'tbz2', 'xpak_mem', 'xpak', 'xpand',
 	'xsplit', 'xsplit_mem',
 ]
 
-import array
 import errno
-import sys
+import struct
+from itertools import chain
 
 import portage
 from portage import os
@@ -60,31 +60,18 @@ def addtolist(mylist, curdir):
 				continue
 			mylist.append(os.path.join(parent, x)[len(curdir) + 1:])
 
+_int_struct = struct.Struct('>I')
+_int_pair_struct = struct.Struct('>II')
+
 def encodeint(myint):
 	"""Takes a 4 byte integer and converts it into a string of 4 characters.
 	Returns the characters in a string."""
-	a = array.array('B')
-	a.append((myint >> 24) & 0xff)
-	a.append((myint >> 16) & 0xff)
-	a.append((myint >>  8) & 0xff)
-	a.append(myint & 0xff)
-	try:
-		# Python >= 3.2
-		return a.tobytes()
-	except AttributeError:
-		return a.tostring()
+	return _int_struct.pack(myint & 0xffffffff)
 
 def decodeint(mystring):
 	"""Takes a 4 byte string and converts it into a 4 byte integer.
 	Returns an integer."""
-	if sys.hexversion < 0x3000000:
-		mystring = [ord(x) for x in mystring]
-	myint = 0
-	myint += mystring[3]
-	myint += mystring[2] << 8
-	myint += mystring[1] << 16
-	myint += mystring[0] << 24
-	return myint
+	return _int_struct.unpack_from(mystring)[0]
 
 def xpak(rootdir, outfile=None):
 	"""(rootdir, outfile) -- creates an xpak segment of the directory 'rootdir'
@@ -126,22 +113,23 @@ def xpak_mem(mydata):
 	mydata = mydata_encoded
 	del mydata_encoded
 
-	indexglob = b''
-	indexpos = 0
-	dataglob = b''
+	# Collect the pieces in lists and join them once, since repeated
+	# concatenation copies the whole segment for every entry.
+	index_chunks = []
+	data_chunks = []
+	indexsize = 0
 	datapos = 0
 	for x, newglob in mydata.items():
 		mydatasize = len(newglob)
-		indexglob = indexglob + encodeint(len(x)) + x + encodeint(datapos) + encodeint(mydatasize)
-		indexpos = indexpos + 4 + len(x) + 4 + 4
-		dataglob = dataglob + newglob
-		datapos = datapos + mydatasize
-	return b'XPAKPACK' \
-		+ encodeint(len(indexglob)) \
-		+ encodeint(len(dataglob)) \
-		+ indexglob \
-		+ dataglob \
-		+ b'XPAKSTOP'
+		index_chunks.append(encodeint(len(x)))
+		index_chunks.append(x)
+		index_chunks.append(_int_pair_struct.pack(datapos, mydatasize))
+		indexsize += 12 + len(x)
+		data_chunks.append(newglob)
+		datapos += mydatasize
+	return b''.join(chain((b'XPAKPACK',
+		_int_pair_struct.pack(indexsize, datapos)),
+		index_chunks, data_chunks, (b'XPAKSTOP',)))
 
 def xsplit(infile):
 	"""(infile) -- Splits the infile into two files.
@@ -210,6 +198,27 @@ def listindex(myindex):
 	for x in getindex_mem(myindex):
 		print(x)
 
+def index_table(myindex):
+	"""Parses the indexglob passed in, and returns a dict which maps each
+	filename to the (offset, length) of its data in the datasegment. If a
+	filename occurs more than once, the first occurrence is used, like
+	searchindex() does."""
+	table = {}
+	myindexlen = len(myindex)
+	startpos = 0
+	try:
+		while ((startpos + 8) < myindexlen):
+			namelen = _int_struct.unpack_from(myindex, startpos)[0]
+			name = myindex[startpos + 4:startpos + 4 + namelen]
+			if name not in table:
+				table[name] = _int_pair_struct.unpack_from(myindex,
+					startpos + 4 + namelen)
+			startpos = startpos + namelen + 12
+	except struct.error:
+		# truncated index
+		pass
+	return table
+
 def getindex_mem(myindex):
 	"""Returns the filenames listed in the indexglob passed in."""
 	myindexlen = len(myindex)
@@ -286,6 +295,7 @@ class tbz2(object):
 		self.datasize = None
 		self.indexpos = None
 		self.datapos = None
+		self._table = None
 
 	def decompose(self, datadir, cleanup=1):
 		"""Alias for unpackinfo() --- Complement to recompose() but optionally
@@ -341,7 +351,8 @@ class tbz2(object):
 			raise IOError
 		myfile.seek(-self.xpaksize, 2) # 0,2 or -0,2 just mean EOF.
 		myfile.truncate()
-		myfile.write(xpdata + encodeint(len(xpdata)) + b'STOP')
+		myfile.write(xpdata)
+		myfile.write(encodeint(len(xpdata)) + b'STOP')
 		myfile.flush()
 		myfile.close()
 		return 1
@@ -374,6 +385,7 @@ class tbz2(object):
 				if not changed:
 					return 1
 			self.filestat = mystat
+			self._table = None
 			a = open(_unicode_encode(self.file,
 				encoding=_encodings['fs'], errors='strict'), 'rb')
 			a.seek(-16, 2)
@@ -410,19 +422,31 @@ class tbz2(object):
 			return None
 		return getindex_mem(self.index)
 
+	def _index_table(self):
+		if self._table is None:
+			self._table = index_table(self.index)
+		return self._table
+
+	def _read_data(self, offset=0, length=None):
+		"""Reads length bytes of the data segment, starting at offset, or
+		the whole data segment by default."""
+		if length is None:
+			length = self.datasize
+		with open(_unicode_encode(self.file,
+			encoding=_encodings['fs'], errors='strict'), 'rb') as a:
+			a.seek(self.datapos + offset)
+			return a.read(length)
+
 	def getfile(self, myfile, mydefault=None):
 		"""Finds 'myfile' in the data segment and returns it."""
 		if not self.scan():
 			return None
-		myresult = searchindex(self.index, myfile)
-		if not myresult:
+		myfile = _unicode_encode(myfile,
+			encoding=_encodings['repo.content'], errors='backslashreplace')
+		myresult = self._index_table().get(myfile)
+		if myresult is None:
 			return mydefault
-		a = open(_unicode_encode(self.file,
-			encoding=_encodings['fs'], errors='strict'), 'rb')
-		a.seek(self.datapos + myresult[0], 0)
-		myreturn = a.read(myresult[1])
-		a.close()
-		return myreturn
+		return self._read_data(*myresult)
 
 	def getelements(self, myfile):
 		"""A split/array representation of tbz2.getfile()"""
@@ -436,16 +460,9 @@ class tbz2(object):
 		if not self.scan():
 			return 0
 		mydest = normalize_path(mydest) + os.sep
-		a = open(_unicode_encode(self.file,
-			encoding=_encodings['fs'], errors='strict'), 'rb')
 		if not os.path.exists(mydest):
 			os.makedirs(mydest)
-		startpos = 0
-		while ((startpos + 8) < self.indexsize):
-			namelen = decodeint(self.index[startpos:startpos + 4])
-			datapos = decodeint(self.index[startpos + 4 + namelen:startpos + 8 + namelen])
-			datalen = decodeint(self.index[startpos + 8 + namelen:startpos + 12 + namelen])
-			myname = self.index[startpos + 4:startpos + 4 + namelen]
+		for myname, mydata in self.get_data().items():
 			myname = _unicode_decode(myname,
 				encoding=_encodings['repo.content'], errors='replace')
 			filename = os.path.join(mydest, myname.lstrip(os.sep))
@@ -457,43 +474,21 @@ class tbz2(object):
 			if dirname:
 				if not os.path.exists(dirname):
 					os.makedirs(dirname)
-			mydat = open(_unicode_encode(filename,
-				encoding=_encodings['fs'], errors='strict'), 'wb')
-			a.seek(self.datapos + datapos)
-			mydat.write(a.read(datalen))
-			mydat.close()
-			startpos = startpos + namelen + 12
-		a.close()
+			with open(_unicode_encode(filename,
+				encoding=_encodings['fs'], errors='strict'), 'wb') as mydat:
+				mydat.write(mydata)
 		return 1
 
 	def get_data(self):
 		"""Returns all the files from the dataSegment as a map object."""
 		if not self.scan():
 			return {}
-		a = open(_unicode_encode(self.file,
-			encoding=_encodings['fs'], errors='strict'), 'rb')
-		mydata = {}
-		startpos = 0
-		while ((startpos + 8) < self.indexsize):
-			namelen = decodeint(self.index[startpos:startpos + 4])
-			datapos = decodeint(self.index[startpos + 4 + namelen:startpos + 8 + namelen])
-			datalen = decodeint(self.index[startpos + 8 + namelen:startpos + 12 + namelen])
-			myname = self.index[startpos + 4:startpos + 4 + namelen]
-			a.seek(self.datapos + datapos)
-			mydata[myname] = a.read(datalen)
-			startpos = startpos + namelen + 12
-		a.close()
-		return mydata
+		data = self._read_data()
+		return dict((myname, data[datapos:datapos + datalen])
+			for myname, (datapos, datalen) in self._index_table().items())
 
 	def getboth(self):
 		"""Returns an array [indexSegment, dataSegment]"""
 		if not self.scan():
 			return None
-
-		a = open(_unicode_encode(self.file,
-			encoding=_encodings['fs'], errors='strict'), 'rb')
-		a.seek(self.datapos)
-		mydata = a.read(self.datasize)
-		a.close()
-
-		return self.index, mydata
+		return self.index, self._read_data()